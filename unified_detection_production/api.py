@@ -4,23 +4,35 @@ Main API Module
 
 import cv2
 import time
+import threading
 import numpy as np
 from pathlib import Path
-from typing import Union, Dict, List
+from typing import Union, Dict, List, Any
 from unified_detector import UnifiedDetector
 from visualizer import DetectionVisualizer
 
 # Global instances
 _detector = None
 _visualizer = None
+_DETECTOR_LOCK = threading.Lock()
+# YOLO predictors keep per-call state: one forward pass at a time per process
+_INFER_LOCK = threading.Lock()
 
 def _get_detector():
     """Get or create detector instance"""
     global _detector
     if _detector is None:
-        _detector = UnifiedDetector()
+        with _DETECTOR_LOCK:
+            if _detector is None:
+                _detector = UnifiedDetector()
     return _detector
 
+def prewarm() -> threading.Thread:
+    """Load the detector on a background thread; later _get_detector() calls wait for it"""
+    thread = threading.Thread(target=_get_detector, name="detector-prewarm", daemon=True)
+    thread.start()
+    return thread
+
 def _get_visualizer():
     """Get or create visualizer instance"""
     global _visualizer
@@ -28,6 +40,15 @@ def _get_visualizer():
         _visualizer = DetectionVisualizer()
     return _visualizer
 
+def _load(image: Union[str, Path, np.ndarray]) -> np.ndarray:
+    """Return the image as a BGR array, decoding it only if a path is given"""
+    if isinstance(image, (str, Path)):
+        array = cv2.imread(str(image))
+        if array is None:
+            raise ValueError(f"Failed to load image: {image}")
+        return array
+    return image
+
 def detect_objects(image: Union[str, Path, np.ndarray], 
                   detect_face: bool = True, 
                   detect_lp: bool = True) -> Dict[str, List[Dict]]:
@@ -45,16 +66,37 @@ def detect_objects(image: Union[str, Path, np.ndarray],
     detector = _get_detector()
     
     # Load image if path is provided
-    if isinstance(image, (str, Path)):
-        image = cv2.imread(str(image))
-        if image is None:
-            raise ValueError(f"Failed to load image: {image}")
+    image = _load(image)
     
     # Perform detection
-    results = detector.detect_objects(image, detect_face=detect_face, detect_lp=detect_lp)
+    with _INFER_LOCK:
+        results = detector.detect_objects(image, detect_face=detect_face, detect_lp=detect_lp)
     
     return results
 
+def detect_objects_batch(images: List[Union[str, Path, np.ndarray]], 
+                         detect_face: bool = True, 
+                         detect_lp: bool = True) -> List[Dict[str, List[Dict]]]:
+    """
+    Detect faces and license plates in several images with batched model calls.
+    
+    Args:
+        images: Input images (file paths, Path objects, or numpy arrays)
+        detect_face: Whether to detect faces
+        detect_lp: Whether to detect license plates
+        
+    Returns:
+        One detect_objects()-style dictionary per image, in input order
+    """
+    detector = _get_detector()
+    
+    # Load images if paths are provided
+    images = [_load(image) for image in images]
+    
+    # Perform detection
+    with _INFER_LOCK:
+        return detector.detect_objects_batch(images, detect_face=detect_face, detect_lp=detect_lp)
+
 def visualize_detections(image: Union[str, Path, np.ndarray], 
                         results: Dict[str, List[Dict]], 
                         show_confidence: bool = True,
@@ -74,10 +116,7 @@ def visualize_detections(image: Union[str, Path, np.ndarray],
     visualizer = _get_visualizer()
     
     # Load image if path is provided
-    if isinstance(image, (str, Path)):
-        image = cv2.imread(str(image))
-        if image is None:
-            raise ValueError(f"Failed to load image: {image}")
+    image = _load(image)
     
     # Draw detections
     result_image = visualizer.draw_boxes(image, results, show_confidence)
@@ -95,7 +134,8 @@ def blur_detections(image: Union[str, Path, np.ndarray],
                    results: Dict[str, List[Dict]], 
                    face_blur_strength: int = 15,
                    plate_blur_strength: int = 15,
-                   save_path: Union[str, Path, None] = None) -> np.ndarray:
+                   save_path: Union[str, Path, None] = None,
+                   inplace: bool = False) -> np.ndarray:
     """
     Blur detected faces and license plates in the image.
     
@@ -105,21 +145,20 @@ def blur_detections(image: Union[str, Path, np.ndarray],
         face_blur_strength: Blur strength for faces - oval blur (default: 15)
         plate_blur_strength: Blur strength for license plates - rectangular blur (default: 15)
         save_path: Optional path to save the blurred image
+        inplace: Blur a passed-in array in place instead of copying it
         
     Returns:
         Image with blurred detections as numpy array
     """
     visualizer = _get_visualizer()
     
-    # Load image if path is provided
-    if isinstance(image, (str, Path)):
-        image = cv2.imread(str(image))
-        if image is None:
-            raise ValueError(f"Failed to load image: {image}")
+    # Load image if path is provided (a freshly decoded image is ours to modify)
+    inplace = inplace or isinstance(image, (str, Path))
+    image = _load(image)
     
     # Create blurred image
     blurred_image = visualizer.blur_detections(
-        image, results, face_blur_strength, plate_blur_strength
+        image, results, face_blur_strength, plate_blur_strength, inplace=inplace
     )
     
     # Save image if path provided
@@ -130,3 +169,47 @@ def blur_detections(image: Union[str, Path, np.ndarray],
         print(f"🔒 Blurred image saved to: {save_path}")
     
     return blurred_image
+
+
+def pipeline(image: Union[str, Path, np.ndarray],
+             detect_face: bool = True,
+             detect_lp: bool = True,
+             visualize: bool = False,
+             blur: bool = False,
+             show_confidence: bool = True,
+             face_blur_strength: int = 15,
+             plate_blur_strength: int = 15,
+             visualization_path: Union[str, Path, None] = None,
+             blurred_path: Union[str, Path, None] = None) -> Dict[str, Any]:
+    """
+    Detect, then visualize and/or blur, decoding the image only once.
+    
+    Args:
+        image: Input image (file path, Path object, or numpy array)
+        detect_face: Whether to detect faces
+        detect_lp: Whether to detect license plates
+        visualize: Whether to draw the detections
+        blur: Whether to blur the detections
+        show_confidence: Whether to show confidence scores in the visualization
+        face_blur_strength: Blur strength for faces - oval blur (default: 15)
+        plate_blur_strength: Blur strength for license plates - rectangular blur (default: 15)
+        visualization_path: Optional path to save the visualization
+        blurred_path: Optional path to save the blurred image
+        
+    Returns:
+        Dictionary with 'results', 'visualization' and 'blurred' (None when not requested)
+    """
+    image = _load(image)
+    results = detect_objects(image, detect_face=detect_face, detect_lp=detect_lp)
+    
+    output = {'results': results, 'visualization': None, 'blurred': None}
+    if visualize:
+        output['visualization'] = visualize_detections(
+            image, results, show_confidence, save_path=visualization_path
+        )
+    if blur:
+        output['blurred'] = blur_detections(
+            image, results, face_blur_strength, plate_blur_strength, save_path=blurred_path
+        )
+    
+    return output
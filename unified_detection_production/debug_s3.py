@@ -51,34 +51,30 @@ def test_s3_folder_listing(processor, folder_path):
         print(f"❌ Folder listing failed: {e}")
         return []
 
-def test_s3_upload(processor, local_file, s3_path):
+def test_s3_upload(processor, image, s3_path):
     """Test S3 upload"""
-    print(f"\n📤 Testing S3 Upload: {local_file} -> {s3_path}")
-    
-    if not os.path.exists(local_file):
-        print(f"❌ Local file does not exist: {local_file}")
-        return False
+    print(f"\n📤 Testing S3 Upload: {image.shape[1]}x{image.shape[0]} image -> {s3_path}")
     
     try:
-        s3_url = processor._upload_image_to_s3(local_file, s3_path)
+        s3_url = processor._upload_image_to_s3(image, s3_path)
         print(f"✅ Upload successful: {s3_url}")
         return True
     except Exception as e:
         print(f"❌ Upload failed: {e}")
         return False
 
-def test_s3_download(processor, s3_path, local_path):
+def test_s3_download(processor, s3_path):
     """Test S3 download"""
-    print(f"\n📥 Testing S3 Download: {s3_path} -> {local_path}")
+    print(f"\n📥 Testing S3 Download: {s3_path}")
     
     try:
-        local_file, filename = processor._download_image_from_s3(s3_path)
-        print(f"✅ Download successful: {local_file}")
+        image, filename = processor._download_image_from_s3(s3_path)
+        print(f"✅ Download successful: {image.shape[1]}x{image.shape[0]}")
         print(f"📄 Original filename: {filename}")
-        return True
+        return image
     except Exception as e:
         print(f"❌ Download failed: {e}")
-        return False
+        return None
 
 def main():
     """Main debug function"""
@@ -98,12 +94,11 @@ def main():
         if files:
             # Test download
             test_file = files[0]
-            local_download = "test_download.jpg"
-            test_s3_download(processor, test_file, local_download)
+            image = test_s3_download(processor, test_file)
             
             # Test upload
             output_folder = input("\nEnter S3 output folder path (e.g., s3://bucket/output/): ").strip()
-            if output_folder:
+            if output_folder and image is not None:
                 # Generate output path
                 bucket_name, input_key = processor._parse_s3_path(test_file)
                 filename = os.path.basename(input_key)
@@ -112,12 +107,7 @@ def main():
                 output_s3_path = f"s3://{output_bucket}/{output_key}"
                 
                 print(f"\n📤 Generated output path: {output_s3_path}")
-                test_s3_upload(processor, local_download, output_s3_path)
-                
-                # Clean up
-                if os.path.exists(local_download):
-                    os.remove(local_download)
-                    print(f"🧹 Cleaned up: {local_download}")
+                test_s3_upload(processor, image, output_s3_path)
     
     print("\n🎉 Debug complete!")
 
@@ -7,6 +7,9 @@ import cv2
 import numpy as np
 import onnxruntime as ort
 from ultralytics import YOLO
+from nms_numba import NUMBA_AVAILABLE, nms_core
+from scrfd_batch import detect_batch
+from devices import ort_providers, torch_device, face_pack, yolo_weights, tensorrt_weights
 
 def expand_xyxy(box, scale, W, H, square=True):
     x1,y1,x2,y2 = [float(v) for v in box]
@@ -21,37 +24,52 @@ def expand_xyxy(box, scale, W, H, square=True):
     return [nx1, ny1, nx2, ny2]
 
 def nms_xyxy(boxes, scores, iou_thr=0.5):
-    if not boxes:
-        return []
-    B = np.asarray(boxes, np.float32); S = np.asarray(scores, np.float32)
+    if len(boxes) == 0:
+        return np.empty(0, np.intp)
+    B = np.ascontiguousarray(boxes, np.float32); S = np.ascontiguousarray(scores, np.float32)
+    if NUMBA_AVAILABLE:
+        return nms_core(B, S, iou_thr)
+    areas = (B[:,2]-B[:,0])*(B[:,3]-B[:,1])
     order = S.argsort()[::-1]; keep=[]
     while order.size>0:
         i = order[0]; keep.append(i)
         rest = order[1:]
-        xx1 = np.maximum(B[i,0], B[rest,0]); yy1 = np.maximum(B[i,1], B[rest,1])
-        xx2 = np.minimum(B[i,2], B[rest,2]); yy2 = np.minimum(B[i,3], B[rest,3])
-        w = np.maximum(0, xx2-xx1); h = np.maximum(0, yy2-yy1)
-        inter = w*h
-        area_i = (B[i,2]-B[i,0])*(B[i,3]-B[i,1])
-        area_r = (B[rest,2]-B[rest,0])*(B[rest,3]-B[rest,1])
-        iou = inter/(area_i+area_r-inter+1e-6)
+        xy1 = np.maximum(B[i,:2], B[rest,:2]); xy2 = np.minimum(B[i,2:4], B[rest,2:4])
+        wh = np.clip(xy2-xy1, 0, None)
+        inter = wh[:,0]*wh[:,1]
+        iou = inter/(areas[i]+areas[rest]-inter+1e-6)
         order = rest[iou<=iou_thr]
-    return keep
+    return np.asarray(keep, np.intp)
+
+def letterbox(img, new_size, color=(114,114,114), out=None):
+    # resizes straight into the (reusable) padded canvas; no separate border pass
+    h, w = img.shape[:2]
+    r = min(new_size / w, new_size / h)
+    nw, nh = int(round(w*r)), int(round(h*r))
+    if out is None:
+        out = np.empty((new_size, new_size, 3), np.uint8)
+    top, left = int((new_size - nh) * 0.5), int((new_size - nw) * 0.5)
+    out[:top] = color; out[top+nh:] = color
+    out[top:top+nh, :left] = color; out[top:top+nh, left+nw:] = color
+    cv2.resize(img, (nw, nh), dst=out[top:top+nh, left:left+nw], interpolation=cv2.INTER_LINEAR)
+    return out, r, (left, top), (nw, nh)
 
 class DetectFace:
-    def __init__(self, yolo_model_path='models/yolo11n.pt', person_conf=0.20, face_det_size=1280, face_det_thresh=0.30, roi_scale=1.45):
+    def __init__(self, yolo_model_path='models/yolo11n.pt', person_conf=0.20, face_det_size=1280, face_det_thresh=0.30, roi_scale=1.45, device=None):
         self.yolo_model_path = yolo_model_path
         self.person_conf = person_conf
         self.face_det_size = face_det_size
         self.face_det_thresh = face_det_thresh
         self.roi_scale = roi_scale
+        # cpu / cuda[:N] / tensorrt / openvino, defaults to $IDEN_HIDE_DEVICE
+        self.device = torch_device(device)
         
         # Load YOLO model
-        self.yolo = YOLO(yolo_model_path)
+        self.yolo = YOLO(tensorrt_weights(yolo_weights(yolo_model_path), device=device))
         
         # Load InsightFace
         from insightface.app import FaceAnalysis
-        self.app = FaceAnalysis(name="buffalo_l", providers=["CPUExecutionProvider"], allowed_modules=['detection'])
+        self.app = FaceAnalysis(name=face_pack("buffalo_l"), providers=ort_providers(device), allowed_modules=['detection'])
         self.app.prepare(ctx_id=0, det_size=(face_det_size, face_det_size))
         
         det = self.app.models.get('detection', None)
@@ -64,39 +82,65 @@ class DetectFace:
         H, W = image.shape[:2]
         
         # YOLO person detection
-        yres = self.yolo.predict(image, conf=self.person_conf, classes=[0], verbose=False)[0]
-        persons = [b.xyxy[0].tolist() for b in yres.boxes]
+        yres = self.yolo.predict(image, conf=self.person_conf, classes=[0], device=self.device,
+                                 half=self.device.startswith("cuda"), verbose=False)[0]
+        persons = yres.boxes.xyxy.cpu().numpy()
+        
+        # per-canvas (K, 5) [x1, y1, x2, y2, score] arrays in image coordinates
+        found = []
         
-        face_boxes, face_scores = [], []
+        # One letterboxed SCRFD canvas per expanded person ROI
+        if len(persons):
+            S = self.face_det_size
+            canvases = np.empty((len(persons), S, S, 3), np.uint8)
+            metas = []
+            for pb in persons:
+                roi = expand_xyxy(pb, self.roi_scale, W, H, True)
+                rx1, ry1, rx2, ry2 = int(roi[0]), int(roi[1]), int(roi[2]), int(roi[3])
+                if rx2 <= rx1 or ry2 <= ry1:
+                    continue
+                _, r, (dx, dy), _ = letterbox(image[ry1:ry2, rx1:rx2], S, out=canvases[len(metas)])
+                metas.append((rx1, ry1, r, dx, dy))
+            if metas:
+                dets = detect_batch(self.app.models['detection'], canvases[:len(metas)])
+                for (rx1, ry1, r, dx, dy), faces in zip(metas, dets):
+                    F = faces.astype(np.float64)
+                    F[:,:4] -= (dx, dy, dx, dy); F[:,:4] /= r; F[:,:4] += (rx1, ry1, rx1, ry1)
+                    found.append(F)
         
-        # Fallback: tiled whole-frame detection
-        if not face_boxes:
+        # Fallback: tiled whole-frame detection when YOLO finds no persons
+        if not len(persons):
             gh, gw, ov = 2, 2, 0.15
             stepx, stepy = int(W/gw), int(H/gh)
             ox, oy = int(ov*stepx), int(ov*stepy)
+            tiles = []
+            crops = np.empty((gh*gw, self.face_det_size, self.face_det_size, 3), np.uint8)
             for gy in range(gh):
                 for gx in range(gw):
                     tx1 = max(0, gx*stepx - ox); ty1 = max(0, gy*stepy - oy)
                     tx2 = min(W, (gx+1)*stepx + ox); ty2 = min(H, (gy+1)*stepy + oy)
                     tile = image[ty1:ty2, tx1:tx2]
-                    tr = cv2.resize(tile, (self.face_det_size, self.face_det_size), interpolation=cv2.INTER_CUBIC)
-                    faces = self.app.get(tr)
-                    sx = (tx2 - tx1) / float(self.face_det_size)
-                    sy = (ty2 - ty1) / float(self.face_det_size)
-                    for f in faces:
-                        bx1,by1,bx2,by2 = f.bbox.astype(float)
-                        face_boxes.append([tx1 + bx1*sx, ty1 + by1*sy, tx1 + bx2*sx, ty1 + by2*sy])
-                        face_scores.append(float(getattr(f, "det_score", 1.0)))
+                    cv2.resize(tile, (self.face_det_size, self.face_det_size), dst=crops[len(tiles)], interpolation=cv2.INTER_LINEAR)
+                    tiles.append((tx1, ty1, tx2, ty2))
+            # Single SCRFD run over all tiles
+            dets = detect_batch(self.app.models['detection'], crops)
+            for (tx1, ty1, tx2, ty2), faces in zip(tiles, dets):
+                sx = (tx2 - tx1) / float(self.face_det_size)
+                sy = (ty2 - ty1) / float(self.face_det_size)
+                F = faces.astype(np.float64)
+                F[:,:4] *= (sx, sy, sx, sy); F[:,:4] += (tx1, ty1, tx1, ty1)
+                found.append(F)
         
         # Apply NMS
-        keep = nms_xyxy(face_boxes, face_scores, iou_thr=0.5)
+        F = np.concatenate(found) if found else np.empty((0, 5))
+        keep = nms_xyxy(F[:,:4], F[:,4], iou_thr=0.5)
         
         # Return results
         results = []
-        for i in keep:
+        for x1, y1, x2, y2, score in F[keep].tolist():
             results.append({
-                'bbox': [int(face_boxes[i][0]), int(face_boxes[i][1]), int(face_boxes[i][2]), int(face_boxes[i][3])],
-                'confidence': float(face_scores[i])
+                'bbox': [int(x1), int(y1), int(x2), int(y2)],
+                'confidence': float(score)
             })
         
         return results
@@ -5,15 +5,62 @@
 # - outputs ONLY faces [x1,y1,x2,y2,score]
 # - writes <out>.json with faces and copies input image to --out (no drawings)
 
-import os, json, cv2, argparse, numpy as np
+import os, json, cv2, atexit, argparse, threading, numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from PIL import Image
 from ultralytics import YOLO
 from insightface.app import FaceAnalysis
+from nms_numba import NUMBA_AVAILABLE, nms_core
+from utils_numba import filter_candidates
+from scrfd_batch import detect_batch
+from devices import get_device, ort_providers, torch_device, face_pack, yolo_weights, tensorrt_weights
+
+try:
+    import orjson
+except ImportError:  # stdlib json fallback
+    orjson = None
 
 # ---------------- utils ----------------
 def ensure_dir_for(path: str):
     d = os.path.dirname(path)
     if d: os.makedirs(d, exist_ok=True)
 
+# output encodes/writes overlap with the next detection (imwrite releases the GIL)
+_IO_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="face-io")
+atexit.register(_IO_POOL.shutdown)
+# the image copy is a plain passthrough: cheapest deflate level (ignored for non-PNG outputs)
+PNG_FAST = [cv2.IMWRITE_PNG_COMPRESSION, 1]
+
+def write_json(path, payload):
+    if orjson is not None:
+        with open(path, "wb") as f:
+            f.write(orjson.dumps(payload, option=orjson.OPT_INDENT_2))
+        return
+    with open(path, "w") as f:
+        json.dump(payload, f, indent=2)
+
+def read_image(path, detector_size, reduced=True):
+    """
+    Decode path; sources over 2x the detector size are decoded at half resolution
+    (IMREAD_REDUCED_COLOR_2 uses libjpeg's DCT scaling, so JPEGs decode ~2x faster).
+    Returns (img, scale, (H, W)) with scale mapping img coords back to the original.
+    """
+    if reduced:
+        with Image.open(path) as im:  # header only, no pixel decode
+            W0, H0 = im.size
+            # cv2.imread applies EXIF orientation; 5-8 are the transposing ones
+            if im.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+                W0, H0 = H0, W0
+        if max(H0, W0) > 2 * detector_size:
+            img = cv2.imread(path, cv2.IMREAD_REDUCED_COLOR_2)
+            if img is not None:
+                return img, W0 / float(img.shape[1]), (H0, W0)
+    img = cv2.imread(path)
+    if img is None:
+        return None, 1.0, (0, 0)
+    return img, 1.0, img.shape[:2]
+
 def expand_xyxy(box, scale, W, H, square=True):
     x1, y1, x2, y2 = map(float, box)
     cx, cy = (x1 + x2) * 0.5, (y1 + y2) * 0.5
@@ -26,51 +73,44 @@ def expand_xyxy(box, scale, W, H, square=True):
     nx2, ny2 = min(W - 1.0, cx + w * 0.5), min(H - 1.0, cy + h * 0.5)
     return [nx1, ny1, nx2, ny2]
 
-def head_band_from_person(pb, frac=0.45):
-    x1,y1,x2,y2 = map(float, pb)
-    h = max(1.0, y2 - y1)
-    return [x1, y1, x2, y1 + h * frac]
-
-def center_in_band(face_xyxy, band_xyxy, margin=0.0):
-    fx1, fy1, fx2, fy2 = map(float, face_xyxy)
-    bx1, by1, bx2, by2 = map(float, band_xyxy)
-    cx = 0.5 * (fx1 + fx2); cy = 0.5 * (fy1 + fy2)
-    return (bx1 - margin) <= cx <= (bx2 + margin) and (by1 - margin) <= cy <= (by2 + margin)
-
-def face_size_ok(face_xyxy, person_xyxy, min_rel=0.10, max_rel=0.55):
-    x1,y1,x2,y2 = map(float, face_xyxy)
-    px1,py1,px2,py2 = map(float, person_xyxy)
-    fh = max(1.0, y2 - y1); ph = max(1.0, py2 - py1)
-    r = fh / ph
-    return (min_rel <= r <= max_rel)
+def gate_faces(F, pb, head_frac, min_rel, max_rel):
+    """Rows of F[K,5] centered in the person's head band with a plausible relative height"""
+    P = np.asarray(pb, np.float64)
+    if NUMBA_AVAILABLE: return filter_candidates(F, P, head_frac, min_rel, max_rel)
+    ph = max(1.0, P[3] - P[1])
+    cx = 0.5 * (F[:,0] + F[:,2]); cy = 0.5 * (F[:,1] + F[:,3])
+    r = np.maximum(1.0, F[:,3] - F[:,1]) / ph
+    ok = (P[0] <= cx) & (cx <= P[2]) & (P[1] <= cy) & (cy <= P[1] + ph * head_frac) & (min_rel <= r) & (r <= max_rel)
+    return np.flatnonzero(ok)
 
 def nms_xyxy(boxes, scores, iou_thr=0.5):
-    if not boxes: return []
-    B = np.asarray(boxes, np.float32); S = np.asarray(scores, np.float32)
+    if len(boxes) == 0: return np.empty(0, np.intp)
+    B = np.ascontiguousarray(boxes, np.float32); S = np.ascontiguousarray(scores, np.float32)
+    if NUMBA_AVAILABLE: return nms_core(B, S, iou_thr)
+    areas = (B[:,2] - B[:,0]) * (B[:,3] - B[:,1])
     order = S.argsort()[::-1]; keep = []
     while order.size > 0:
         i = order[0]; keep.append(i)
         rest = order[1:]
         if rest.size == 0: break
-        xx1 = np.maximum(B[i,0], B[rest,0]); yy1 = np.maximum(B[i,1], B[rest,1])
-        xx2 = np.minimum(B[i,2], B[rest,2]); yy2 = np.minimum(B[i,3], B[rest,3])
-        w = np.maximum(0, xx2 - xx1); h = np.maximum(0, yy2 - yy1)
-        inter = w * h
-        area_i = (B[i,2]-B[i,0])*(B[i,3]-B[i,1])
-        area_r = (B[rest,2]-B[rest,0])*(B[rest,3]-B[rest,1])
-        iou = inter / (area_i + area_r - inter + 1e-6)
+        xy1 = np.maximum(B[i,:2], B[rest,:2]); xy2 = np.minimum(B[i,2:4], B[rest,2:4])
+        wh = np.clip(xy2 - xy1, 0, None)
+        inter = wh[:,0] * wh[:,1]
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-6)
         order = rest[iou <= iou_thr]
-    return keep
+    return np.asarray(keep, np.intp)
 
-def letterbox(img, new_size, color=(114,114,114)):
+def letterbox(img, new_size, color=(114,114,114), out=None):
+    # resizes straight into the (reusable) padded canvas; no separate border pass
     h, w = img.shape[:2]
     r = min(new_size / w, new_size / h)
     nw, nh = int(round(w*r)), int(round(h*r))
-    imr = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_CUBIC)
-    dw, dh = (new_size - nw) * 0.5, (new_size - nh) * 0.5
-    top, bottom = int(dh), new_size - nh - int(dh)
-    left, right = int(dw), new_size - nw - int(dw)
-    out = cv2.copyMakeBorder(imr, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
+    if out is None:
+        out = np.empty((new_size, new_size, 3), np.uint8)
+    top, left = int((new_size - nh) * 0.5), int((new_size - nw) * 0.5)
+    out[:top] = color; out[top+nh:] = color
+    out[top:top+nh, :left] = color; out[top:top+nh, left+nw:] = color
+    cv2.resize(img, (nw, nh), dst=out[top:top+nh, left:left+nw], interpolation=cv2.INTER_LINEAR)
     return out, r, (left, top), (nw, nh)
 
 def tiles_inside_roi(roi, W, H, grid=(2,2), overlap=0.25):
@@ -81,122 +121,173 @@ def tiles_inside_roi(roi, W, H, grid=(2,2), overlap=0.25):
     rw, rh = (rx2 - rx1), (ry2 - ry1)
     stepx, stepy = max(1, rw // gw), max(1, rh // gh)
     ox, oy = int(overlap * stepx), int(overlap * stepy)
-    out = []
-    for gy in range(gh):
-        for gx in range(gw):
-            tx1 = max(0, rx1 + gx*stepx - ox)
-            ty1 = max(0, ry1 + gy*stepy - oy)
-            tx2 = min(W, rx1 + (gx+1)*stepx + ox)
-            ty2 = min(H, ry1 + (gy+1)*stepy + oy)
-            if tx2 > tx1 and ty2 > ty1:
-                out.append([tx1, ty1, tx2, ty2])
-    return out
-
-def detect_faces_in_tile(face_app, img, xyxy, face_size, thr, flip_tta=False):
-    x1,y1,x2,y2 = map(int, xyxy)
-    tile = img[y1:y2, x1:x2]
-    if tile.size == 0: return []
-    rs, r, (dx,dy), (nw,nh) = letterbox(tile, face_size)
-    faces = face_app.get(rs)
+    # grid edges once, then every (row, col) tile by broadcasting
+    xs = rx1 + stepx * np.arange(gw + 1); ys = ry1 + stepy * np.arange(gh + 1)
+    x1s = np.maximum(0, xs[:-1] - ox); x2s = np.minimum(W, xs[1:] + ox)
+    y1s = np.maximum(0, ys[:-1] - oy); y2s = np.minimum(H, ys[1:] + oy)
+    out = np.empty((gh, gw, 4), np.int64)
+    out[..., 0] = x1s; out[..., 2] = x2s
+    out[..., 1] = y1s[:, None]; out[..., 3] = y2s[:, None]
+    out = out.reshape(-1, 4)
+    return out[(out[:, 2] > out[:, 0]) & (out[:, 3] > out[:, 1])]
+
+def detect_faces_in_tiles(face_app, img, tiles, face_size, thr, flip_tta=False):
+    canvases = np.empty(((2 if flip_tta else 1) * len(tiles), face_size, face_size, 3), np.uint8)
+    metas = []
+    for xyxy in tiles:
+        x1,y1,x2,y2 = map(int, xyxy)
+        tile = img[y1:y2, x1:x2]
+        if tile.size == 0: continue
+        _, r, (dx,dy), (nw,nh) = letterbox(tile, face_size, out=canvases[len(metas)])
+        metas.append((x1, y1, r, dx, dy, nw, nh))
+    if not metas: return np.empty((0, 5))
+    n = len(metas)
     if flip_tta:
-        rsf = cv2.flip(rs, 1)
-        ff = face_app.get(rsf)
-        for f in ff:
-            b = f.bbox.astype(float); b[[0,2]] = face_size - b[[2,0]]
-            faces.append(type('obj',(object,),{'bbox':b,'det_score':getattr(f,'det_score',1.0)}))
+        for k in range(n):
+            cv2.flip(canvases[k], 1, dst=canvases[n + k])
+    canvases = canvases[:(2 if flip_tta else 1) * n]
+    # one SCRFD session run for every tile (and its mirror)
+    dets = detect_batch(face_app.models['detection'], canvases, thr)
     outs=[]
-    for f in faces:
-        bx1,by1,bx2,by2 = f.bbox.astype(float)
-        sc = float(getattr(f, "det_score", 1.0))
-        if sc < thr: continue
-        tx1 = (bx1 - dx) / r; ty1 = (by1 - dy) / r
-        tx2 = (bx2 - dx) / r; ty2 = (by2 - dy) / r
-        tx1 = np.clip(tx1, 0, nw-1); tx2 = np.clip(tx2, 0, nw-1)
-        ty1 = np.clip(ty1, 0, nh-1); ty2 = np.clip(ty2, 0, nh-1)
-        outs.append([x1 + tx1, y1 + ty1, x1 + tx2, y1 + ty2, sc])
-    return outs
+    for k, (x1, y1, r, dx, dy, nw, nh) in enumerate(metas):
+        D = dets[k]
+        if flip_tta:
+            F = dets[n + k].copy(); F[:,[0,2]] = face_size - F[:,[2,0]]
+            D = np.concatenate([D, F])
+        D = D[D[:,4] >= thr].astype(np.float64)
+        if not len(D): continue
+        # canvas -> tile (clipped) -> image, all boxes at once
+        B = D[:,:4]
+        B -= (dx, dy, dx, dy); B /= r
+        np.clip(B[:,0::2], 0, nw-1, out=B[:,0::2]); np.clip(B[:,1::2], 0, nh-1, out=B[:,1::2])
+        B += (x1, y1, x1, y1)
+        outs.append(D)
+    # (K, 5) [x1, y1, x2, y2, score] in image coordinates
+    return np.concatenate(outs) if outs else np.empty((0, 5))
+
+# ---------------- models ----------------
+_MODEL_CACHE = {}
+_MODEL_LOCK = threading.Lock()
+
+def _half(device=None):
+    """FP16 person YOLO on CUDA (Tensor Cores); FP32 elsewhere"""
+    return torch_device(device).startswith("cuda")
+
+def _get_models(yolo_w, face_size, fthr, device=None):
+    """(yolo, app) for these weights / SCRFD canvas / device; loaded and warmed up once per process"""
+    device = get_device(device)
+    key = (yolo_w, face_size, device)
+    with _MODEL_LOCK:
+        if key not in _MODEL_CACHE:
+            yolo = YOLO(tensorrt_weights(yolo_weights(yolo_w), device=device))
+            app = FaceAnalysis(name=face_pack("buffalo_l"),
+                            providers=ort_providers(device),
+                            allowed_modules=['detection'])
+            app.prepare(ctx_id=0, det_size=(face_size, face_size))  # if you ever see GPU selection issues, use ctx_id=-1
+            # warm-up: first inference pays for ORT / torch graph setup
+            dummy = np.zeros((face_size, face_size, 3), np.uint8)
+            yolo.predict(dummy, classes=[0], device=torch_device(device), half=_half(device), verbose=False)
+            detect_batch(app.models['detection'], [dummy])
+            _MODEL_CACHE[key] = (yolo, app)
+    yolo, app = _MODEL_CACHE[key]
+    det = app.models.get('detection', None)
+    if det:
+        det.det_thresh = fthr
+        det.nms_thresh = 0.40
+    return yolo, app
 
 # ---------------- main ----------------
-def run(
-    source, out_path,
+def run_array(
+    img,
     # YOLO (person)
     yolo_w='yolov8x.pt', pconf=0.25, imgsz=832, person_nms_iou=0.60,
     # SCRFD
-    face_size=640, fthr=0.20, flip_tta=True,
+    face_size=640, fthr=0.20, flip_tta=False,
     # person ROI + fixed tiling
     roi_scale=1.10, roi_square=False, grid="2x2", overlap=0.30,
     # gating
-    head_frac=0.45, size_min_rel=0.10, size_max_rel=0.55
+    head_frac=0.45, size_min_rel=0.10, size_max_rel=0.55,
+    # inference device (default: $IDEN_HIDE_DEVICE or cpu)
+    device=None,
+    # img -> original image coordinates (see read_image)
+    img_scale=1.0
 ):
-    img = cv2.imread(source); assert img is not None, f"bad path: {source}"
+    """In-memory pipeline on a BGR ndarray; returns (faces [[x1,y1,x2,y2,score], ...], n_persons)"""
     H, W = img.shape[:2]
 
+    yolo, app = _get_models(yolo_w, face_size, fthr, device)
+
     # YOLO person (with extra de-dup NMS)
-    yolo = YOLO(yolo_w)
-    pred = yolo.predict(img, conf=pconf, classes=[0], imgsz=imgsz, verbose=False)[0]
-    p_boxes = [b.xyxy[0].tolist() for b in pred.boxes]
-    p_scores = [float(b.conf[0]) if hasattr(b, "conf") and b.conf is not None else 0.0 for b in pred.boxes]
+    pred = yolo.predict(img, conf=pconf, classes=[0], imgsz=imgsz, device=torch_device(device),
+                        half=_half(device), verbose=False)[0]
+    boxes = pred.boxes.cpu()
+    p_boxes = boxes.xyxy.numpy().astype(np.float32)
+    p_scores = boxes.conf.numpy().astype(np.float32) if boxes.conf is not None else np.zeros(len(p_boxes), np.float32)
     keep_p = nms_xyxy(p_boxes, p_scores, iou_thr=person_nms_iou)
-    persons = [p_boxes[i] for i in keep_p]
+    persons = p_boxes[keep_p]
     # print(f"[YOLO] persons_raw={len(p_boxes)} persons_kept={len(persons)}")
 
-    # SCRFD
-    app = FaceAnalysis(name="buffalo_l",
-                    providers=["CPUExecutionProvider"],
-                    allowed_modules=['detection'])
-    app.prepare(ctx_id=0, det_size=(face_size, face_size))  # if you ever see GPU selection issues, use ctx_id=-1
-
-    det = app.models.get('detection', None)
-    if det:
-        det.det_thresh = fthr
-        det.nms_thresh = 0.40
-
-    faces_all, scores_all = [], []
+    # at most one face per person: preallocated rows + write cursor
+    best = np.empty((len(persons), 5), np.float64); nb = 0
 
     # per-person: expand ROI -> tiles -> SCRFD -> gating -> pick BEST ONLY
     for pb in persons:
         roi  = expand_xyxy(pb, roi_scale, W, H, square=roi_square)
-        band = head_band_from_person(pb, frac=head_frac)
 
-        cand_boxes, cand_scores = [], []
         tiles = tiles_inside_roi(roi, W, H, grid=tuple(int(x) for x in grid.lower().split("x")), overlap=overlap)
-        for t in tiles:
-            outs = detect_faces_in_tile(app, img, t, face_size, fthr, flip_tta=flip_tta)
-            for x1,y1,x2,y2,sc in outs:
-                if center_in_band([x1,y1,x2,y2], band) and face_size_ok([x1,y1,x2,y2], pb, size_min_rel, size_max_rel):
-                    cand_boxes.append([x1,y1,x2,y2]); cand_scores.append(sc)
+        outs = detect_faces_in_tiles(app, img, tiles, face_size, fthr, flip_tta=flip_tta)
+        cand = outs[gate_faces(outs, pb, head_frac, size_min_rel, size_max_rel)]
 
         # keep best candidate per person
-        if cand_boxes:
-            j = int(np.argmax(cand_scores))
-            faces_all.append(cand_boxes[j]); scores_all.append(cand_scores[j])
+        if len(cand):
+            best[nb] = cand[int(np.argmax(cand[:,4]))]; nb += 1
+    best = best[:nb]
 
     # cross-person NMS (in case ROIs overlap)
-    keep_f = nms_xyxy(faces_all, scores_all, iou_thr=0.55)
-    # faces_final = [[float(f"{v:.2f}") for v in faces_all[i]] + [float(f"{scores_all[i]:.4f}")] for i in keep_f]
-    faces_final = [faces_all[i] + [float(scores_all[i])] for i in keep_f]
+    keep_f = nms_xyxy(best[:,:4], best[:,4], iou_thr=0.55)
+    # boxes to 2 decimals, scores to 4 (vectorized; no per-value string round-trip)
+    B = (best[keep_f,:4] * img_scale).round(2)
+    S = best[keep_f,4].round(4)
+    return np.concatenate([B, S[:,None]], axis=1).tolist(), len(persons)
+
+def run(source, out_path, reduced_decode=True, **params):
+    """
+    File-based pipeline: reads source, writes <out>.json and a copy of the image
+    to out_path. params are the run_array() settings; reduced_decode allows a
+    half-resolution decode for very large sources.
+    """
+    face_size = params.get('face_size', 640); imgsz = params.get('imgsz', 832)
+    img, img_scale, (H0, W0) = read_image(source, max(imgsz, face_size), reduced=reduced_decode)
+    assert img is not None, f"bad path: {source}"
+
+    faces_final, n_persons = run_array(img, img_scale=img_scale, **params)
 
     # --- outputs ---
     # 1) save sidecar JSON <out>.json
-    json_path = os.path.splitext(out_path)[0] + ".json"
+    json_path = str(Path(out_path).with_suffix(".json"))
     ensure_dir_for(json_path)
     payload = {
         "image": os.path.basename(source),
-        "size": {"H": H, "W": W},
+        "size": {"H": H0, "W": W0},
         "faces": [{"bbox":[b[0],b[1],b[2],b[3]], "score": b[4]} for b in faces_final],
-        "counts": {"faces": len(faces_final), "persons": len(persons)}
+        "counts": {"faces": len(faces_final), "persons": n_persons}
     }
-    with open(json_path, "w") as f:
-        json.dump(payload, f, indent=2)
+    json_write = _IO_POOL.submit(write_json, json_path, payload)
 
     # 2) copy input image to --out (no drawings), to preserve your I/O
     ensure_dir_for(out_path)
-    cv2.imwrite(out_path, img)
+    if img_scale == 1.0:
+        image_write = _IO_POOL.submit(cv2.imwrite, out_path, img, PNG_FAST)
+    else:  # full-resolution copy, decoded off the detection path
+        image_write = _IO_POOL.submit(lambda: cv2.imwrite(out_path, cv2.imread(source), PNG_FAST))
 
     # 3) print faces to stdout
     print(json.dumps({"faces": faces_final}, indent=2))
     # Example element: [x1, y1, x2, y2, score]
 
+    # pending writes: wait on these before reading the outputs back
+    return json_write, image_write
+
 # ---------------- cli ----------------
 if __name__ == "__main__":
     ap = argparse.ArgumentParser(description="YOLO(person) -> tiled SCRFD (faces-only output)")
@@ -221,6 +312,9 @@ if __name__ == "__main__":
     ap.add_argument("--head_frac", type=float, default=0.45, help="fraction of person height as head band")
     ap.add_argument("--size_min_rel", type=float, default=0.10, help="min face height / person height")
     ap.add_argument("--size_max_rel", type=float, default=0.55, help="max face height / person height")
+    # device
+    ap.add_argument("--full_decode", action="store_true", help="never decode large sources at half resolution")
+    ap.add_argument("--device", default=None, help="cpu | cuda[:N] | tensorrt | openvino (default: $IDEN_HIDE_DEVICE or cpu)")
 
     a = ap.parse_args()
     run(
@@ -228,5 +322,6 @@ if __name__ == "__main__":
         yolo_w=a.yolo, pconf=a.pconf, imgsz=a.imgsz, person_nms_iou=a.person_nms_iou,
         face_size=a.fsize, fthr=a.fthr, flip_tta=a.flip_tta,
         roi_scale=a.scale, roi_square=a.square, grid=a.grid, overlap=a.overlap,
-        head_frac=a.head_frac, size_min_rel=a.size_min_rel, size_max_rel=a.size_max_rel
+        head_frac=a.head_frac, size_min_rel=a.size_min_rel, size_max_rel=a.size_max_rel,
+        device=a.device, reduced_decode=not a.full_decode
     )
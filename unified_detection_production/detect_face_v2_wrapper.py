@@ -3,10 +3,7 @@
 Wrapper for detect_face_v2.py to match the expected interface
 """
 
-import os
-import tempfile
-import json
-from detect_face_v2 import run as detect_faces_v2
+from detect_face_v2 import run_array as detect_faces_v2_array
 
 class DetectFace:
     def __init__(self):
@@ -30,20 +27,8 @@ class DetectFace:
             list: List of face detections in format [x1, y1, x2, y2, confidence]
         """
         try:
-            # Save image to temporary file
-            with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp_file:
-                temp_input = tmp_file.name
-                import cv2
-                cv2.imwrite(temp_input, image)
-            
-            # Create temporary output file
-            with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp_file:
-                temp_output = tmp_file.name
-            
             # Set default parameters for v2 detector
             params = {
-                'source': temp_input,
-                'out_path': temp_output,
                 'yolo_w': kwargs.get('yolo_w', 'yolo11s.pt'),
                 'pconf': kwargs.get('person_conf', 0.50),
                 'imgsz': kwargs.get('imgsz', 960),
@@ -57,39 +42,23 @@ class DetectFace:
                 'overlap': kwargs.get('overlap', 0.30),
                 'head_frac': kwargs.get('head_frac', 0.25),
                 'size_min_rel': kwargs.get('size_min_rel', 0.07),
-                'size_max_rel': kwargs.get('size_max_rel', 0.55)
+                'size_max_rel': kwargs.get('size_max_rel', 0.55),
+                'device': kwargs.get('device')
             }
             
+            # Run the v2 detector in-process on the array
+            face_data, _ = detect_faces_v2_array(image, **params)
             
-            # Run the v2 detector
-            detect_faces_v2(**params)
-            
-            # Read the JSON output
-            json_path = os.path.splitext(temp_output)[0] + '.json'
             faces = []
-            
-            if os.path.exists(json_path):
-                with open(json_path, 'r') as f:
-                    data = json.load(f)
-                    face_data = data.get('faces', [])
-                    # Convert to the expected format: [x1, y1, x2, y2, confidence]
-                    for face in face_data:
-                        if isinstance(face, dict) and 'bbox' in face:
-                            bbox = face['bbox']
-                            score = face.get('score', 0.0)
-                            faces.append([bbox[0], bbox[1], bbox[2], bbox[3], score])
-                        elif isinstance(face, list) and len(face) >= 5:
-                            # Already in the correct format
-                            faces.append(face)
-            
-            # Clean up temporary files
-            try:
-                os.unlink(temp_input)
-                os.unlink(temp_output)
-                if os.path.exists(json_path):
-                    os.unlink(json_path)
-            except:
-                pass
+            # Convert to the expected format: [x1, y1, x2, y2, confidence]
+            for face in face_data:
+                if isinstance(face, dict) and 'bbox' in face:
+                    bbox = face['bbox']
+                    score = face.get('score', 0.0)
+                    faces.append([bbox[0], bbox[1], bbox[2], bbox[3], score])
+                elif isinstance(face, list) and len(face) >= 5:
+                    # Already in the correct format
+                    faces.append(face)
             
             return faces
             
@@ -108,18 +77,4 @@ class DetectFace:
         Returns:
             list: List of face detections
         """
-        # Save image to temporary file
-        with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp_file:
-            temp_input = tmp_file.name
-            import cv2
-            cv2.imwrite(temp_input, image)
-        
-        try:
-            faces = self.detect_faces(temp_input, **kwargs)
-            return faces
-        finally:
-            # Clean up temporary file
-            try:
-                os.unlink(temp_input)
-            except:
-                pass
+        return self.detect_faces(image, **kwargs)
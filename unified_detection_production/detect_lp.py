@@ -2,45 +2,91 @@
 License Plate Detection Module
 """
 
+import copy
+import logging
+from operator import itemgetter
+import threading
 import cv2
 import numpy as np
+import torch
+import torch.nn.functional as F
 from ultralytics import YOLO
+from ultralytics.utils import ops
+from devices import torch_device, tensorrt_weights
+
+log = logging.getLogger(__name__)
+
+# YOLO weights are loaded once per process and shared by every DetectLP
+_MODEL_CACHE = {}
+_MODEL_LOCK = threading.Lock()
+
+def _get_model(path):
+    """YOLO model for a weights path, loaded on first use"""
+    with _MODEL_LOCK:
+        if path not in _MODEL_CACHE:
+            _MODEL_CACHE[path] = YOLO(path)
+        return _MODEL_CACHE[path]
+
+def _get_fused_plate_net(path, model, device):
+    """Standalone eval copy of the plate network on device (fp16 on CUDA) for the fused path"""
+    key = ("fused", path, device)
+    with _MODEL_LOCK:
+        if key not in _MODEL_CACHE:
+            net = copy.deepcopy(model.model).to(device).eval()
+            if device.startswith("cuda"):
+                net = net.half()
+            _MODEL_CACHE[key] = net
+        return _MODEL_CACHE[key]
 
 class DetectLP:
     def __init__(self, vehicle_model_path='models/yolo11n.pt', plate_model_path='models/license_plate_detector.pt'):
         self.vehicle_model_path = vehicle_model_path
         self.plate_model_path = plate_model_path
         
-        # Load models
-        self.vehicle_model = YOLO(vehicle_model_path)
-        self.plate_model = YOLO(plate_model_path)
+        # Load models (prebuilt TensorRT engines on IDEN_HIDE_DEVICE=tensorrt)
+        self.vehicle_model = _get_model(tensorrt_weights(vehicle_model_path))
+        plate_weights = tensorrt_weights(plate_model_path)
+        self.plate_model = _get_model(plate_weights)
         
         # Detection parameters
         self.vehicle_conf_threshold = 0.3
         self.plate_conf_threshold = 0.2
         self.vehicle_classes = [2, 3, 5, 7]  # car, motorcycle, bus, truck
+        self.plate_batch_size = 16  # vehicle ROIs per plate-model predict call
+        self.plate_imgsz = 640  # plate-model input size for the fused GPU path
+        
+        # On CUDA, crop + letterbox every vehicle ROI on the GPU and run one forward pass
+        self.device = torch_device()
+        self.fused_plates = self.device.startswith("cuda") and plate_weights.endswith(".pt")
+        self.half = self.device.startswith("cuda")  # FP16 predict on CUDA only
 
     def detect_vehicles(self, image):
-        """Detect vehicles in the image"""
-        results = self.vehicle_model.predict(
+        """Detect vehicles in the image (or in each image of a list, in one predict call)"""
+        # stream=True: results are yielded and parsed one by one, never cached in the predictor
+        vehicles = [self._vehicles_from_result(r) for r in self.vehicle_model.predict(
             image, 
             conf=self.vehicle_conf_threshold,
             classes=self.vehicle_classes,
-            verbose=False
-        )[0]
-        
+            verbose=False,
+            half=self.half,
+            stream=True
+        )]
+        return vehicles if isinstance(image, list) else vehicles[0]
+    
+    def _vehicles_from_result(self, results):
+        """Vehicle dicts from one YOLO Results"""
         vehicles = []
         if results.boxes is not None:
-            for box in results.boxes:
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                conf = box.conf[0].cpu().numpy()
-                cls = int(box.cls[0].cpu().numpy())
-                
-                vehicles.append({
-                    'bbox': [int(x1), int(y1), int(x2), int(y2)],
-                    'confidence': float(conf),
-                    'class': cls
-                })
+            # one device->host copy: rows are x1, y1, x2, y2, conf, cls
+            data = results.boxes.data.cpu().numpy()
+            xyxy = data[:, :4].astype(np.int64).tolist()
+            confs = data[:, -2].tolist()
+            clss = data[:, -1].astype(np.int64).tolist()
+            
+            vehicles = [
+                {'bbox': bbox, 'confidence': conf, 'class': cls}
+                for bbox, conf, cls in zip(xyxy, confs, clss)
+            ]
         
         return vehicles
 
@@ -65,22 +111,113 @@ class DetectLP:
         if roi_image is None or roi_image.size == 0:
             return []
         
-        results = self.plate_model.predict(
+        for results in self.plate_model.predict(
             roi_image,
             conf=self.plate_conf_threshold,
-            verbose=False
-        )[0]
+            verbose=False,
+            half=self.half,
+            stream=True
+        ):
+            return self._plates_from_result(results)
+        return []
+    
+    def detect_plates_in_rois(self, rois):
+        """
+        Detect license plates in several vehicle ROIs with batched predict calls
         
+        Args:
+            rois: List of ROI images (None / empty entries give no plates)
+            
+        Returns:
+            List with one plate list per ROI, in ROI coordinates
+        """
+        plates = [[] for _ in rois]
+        valid = [i for i, roi in enumerate(rois) if roi is not None and roi.size > 0]
+        for start in range(0, len(valid), self.plate_batch_size):
+            chunk = valid[start:start + self.plate_batch_size]
+            results = self.plate_model.predict(
+                [rois[i] for i in chunk],
+                conf=self.plate_conf_threshold,
+                verbose=False,
+                half=self.half,
+                stream=True
+            )
+            for i, result in zip(chunk, results):
+                plates[i] = self._plates_from_result(result)
+        return plates
+    
+    def detect_plates_in_boxes(self, image, boxes):
+        """
+        Fused plate detection: the frame goes to the GPU once, every vehicle box is
+        cropped and letterboxed there into one (N, 3, S, S) batch, and the plate
+        network runs a single forward pass (no per-ROI predictor preprocessing)
+        
+        Args:
+            image: Full BGR frame
+            boxes: Clamped [x1, y1, x2, y2] vehicle boxes (None entries give no plates)
+            
+        Returns:
+            List with one plate list per box, in ROI coordinates
+        """
+        plates = [[] for _ in boxes]
+        valid = [i for i, box in enumerate(boxes) if box is not None]
+        if not valid:
+            return plates
+        
+        net = _get_fused_plate_net(self.plate_model_path, self.plate_model, self.device)
+        dtype = next(net.parameters()).dtype
+        S = self.plate_imgsz
+        
+        # HWC BGR uint8 -> CHW RGB on device, uploaded once
+        frame = torch.from_numpy(image).to(self.device, non_blocking=True).permute(2, 0, 1)[[2, 1, 0]]
+        batch = torch.full((len(valid), 3, S, S), 114 / 255.0, dtype=dtype, device=self.device)
+        metas = []
+        for k, i in enumerate(valid):
+            x1, y1, x2, y2 = boxes[i]
+            crop = frame[:, y1:y2, x1:x2]
+            h, w = y2 - y1, x2 - x1
+            r = min(S / h, S / w)
+            nh, nw = max(1, round(h * r)), max(1, round(w * r))
+            top, left = (S - nh) // 2, (S - nw) // 2
+            batch[k, :, top:top+nh, left:left+nw] = F.interpolate(
+                crop[None].to(dtype) / 255.0, size=(nh, nw), mode='bilinear', align_corners=False
+            )[0]
+            metas.append((i, r, left, top, w, h))
+        
+        with torch.inference_mode():
+            preds = net(batch)
+        dets = ops.non_max_suppression(preds, self.plate_conf_threshold, 0.7)
+        
+        # letterbox -> ROI coordinates
+        for (i, r, left, top, w, h), det in zip(metas, dets):
+            d = det[:, :5].float().cpu().numpy()
+            d[:, [0, 2]] = ((d[:, [0, 2]] - left) / r).clip(0, w)
+            d[:, [1, 3]] = ((d[:, [1, 3]] - top) / r).clip(0, h)
+            plates[i] = [{'bbox': bbox, 'confidence': conf}
+                         for bbox, conf in zip(d[:, :4].astype(np.int64).tolist(), d[:, 4].tolist())]
+        return plates
+    
+    def _plates_for_vehicles(self, image, vehicles):
+        """(rois, per-ROI plate lists) for every vehicle, batched on either path"""
+        rois = [self.crop_vehicle_roi(image, vehicle['bbox']) for vehicle in vehicles]
+        if self.fused_plates:
+            h, w = image.shape[:2]
+            boxes = [None if roi is None else
+                     [max(0, int(v['bbox'][0])), max(0, int(v['bbox'][1])), min(w, int(v['bbox'][2])), min(h, int(v['bbox'][3]))]
+                     for v, roi in zip(vehicles, rois)]
+            return rois, self.detect_plates_in_boxes(image, boxes)
+        return rois, self.detect_plates_in_rois(rois)
+    
+    def _plates_from_result(self, results):
+        """Plate dicts from one YOLO Results"""
         plates = []
         if results.boxes is not None:
-            for box in results.boxes:
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                conf = box.conf[0].cpu().numpy()
-                
-                plates.append({
-                    'bbox': [int(x1), int(y1), int(x2), int(y2)],
-                    'confidence': float(conf)
-                })
+            # one device->host copy: rows are x1, y1, x2, y2, conf, cls
+            data = results.boxes.data.cpu().numpy()
+            xyxy = data[:, :4].astype(np.int64).tolist()
+            confs = data[:, -2].tolist()
+            
+            plates = [{'bbox': bbox, 'confidence': conf} for bbox, conf in zip(xyxy, confs)]
         
         return plates
 
@@ -95,38 +232,44 @@ class DetectLP:
         Returns:
             List of plates that meet the size criteria
         """
+        if not plates:
+            return []
+        
         vx1, vy1, vx2, vy2 = vehicle_bbox
         vehicle_area = (vx2 - vx1) * (vy2 - vy1)
         max_plate_area = vehicle_area * 0.30  # 30% of vehicle area
         
-        filtered_plates = []
+        # All plate areas in one vector op
+        bboxes = np.array([plate['bbox'] for plate in plates], np.int64)
+        areas = (bboxes[:, 2] - bboxes[:, 0]) * (bboxes[:, 3] - bboxes[:, 1])
+        mask = areas <= max_plate_area
         
-        for plate in plates:
-            px1, py1, px2, py2 = plate['bbox']
-            plate_area = (px2 - px1) * (py2 - py1)
-            
-            if plate_area <= max_plate_area:
-                filtered_plates.append(plate)
-            else:
-                plate_percentage = (plate_area / vehicle_area) * 100
-                print(f"  Plate filtered: area={plate_area:.0f}px² ({plate_percentage:.1f}% of vehicle), max allowed=30%")
+        filtered_plates = [plate for plate, keep in zip(plates, mask.tolist()) if keep]
+        
+        if log.isEnabledFor(logging.DEBUG):
+            for plate_area in areas[~mask].tolist():
+                log.debug("  Plate filtered: area=%.0fpx² (%.1f%% of vehicle), max allowed=30%%",
+                          plate_area, plate_area / vehicle_area * 100)
         
         return filtered_plates
 
-    def process_image_plates_only(self, image):
-        """Process image to detect license plates only"""
+    def process_image_plates_only(self, image, vehicles=None):
+        """Process image to detect license plates only (vehicles: precomputed detect_vehicles() output)"""
         # Step 1: Detect vehicles
-        vehicles = self.detect_vehicles(image)
+        if vehicles is None:
+            vehicles = self.detect_vehicles(image)
         
         all_plates = []
         
-        # Step 2: Look for license plates in each vehicle
+        # Step 2: Look for license plates in every vehicle ROI at once
+        rois, roi_plates = self._plates_for_vehicles(image, vehicles)
+        
         for i, vehicle in enumerate(vehicles):
             vehicle_bbox = vehicle['bbox']
-            roi = self.crop_vehicle_roi(image, vehicle_bbox)
+            roi = rois[i]
             
             if roi is not None:
-                plates = self.detect_plates_in_roi(roi)
+                plates = roi_plates[i]
                 
                 # If multiple plates detected in this vehicle, select the one with highest confidence
                 if plates:
@@ -138,12 +281,11 @@ class DetectLP:
                         size_filtered_plates = self._filter_plates_by_size(valid_plates, vehicle_bbox)
                         
                         if size_filtered_plates:
-                            # Sort plates by confidence in descending order
-                            plates_sorted = sorted(size_filtered_plates, key=lambda x: x['confidence'], reverse=True)
-                            best_plate = plates_sorted[0]  # Take the plate with highest confidence
+                            # Take the plate with highest confidence
+                            best_plate = max(size_filtered_plates, key=itemgetter('confidence'))
                         else:
                             # No plates meet the size criteria
-                            print(f"Vehicle {i+1}: All {len(valid_plates)} plates filtered out due to size (exceed 30% of vehicle area)")
+                            log.debug("Vehicle %d: All %d plates filtered out due to size (exceed 30%% of vehicle area)", i+1, len(valid_plates))
                             continue
                         
                         # Convert ROI coordinates back to image coordinates
@@ -165,9 +307,9 @@ class DetectLP:
                         
                         # Log if multiple plates were found but only best one selected
                         if len(valid_plates) > 1:
-                            print(f"Vehicle {i+1}: Found {len(valid_plates)} valid plates, selected best with confidence {best_plate['confidence']:.3f}")
+                            log.debug("Vehicle %d: Found %d valid plates, selected best with confidence %.3f", i+1, len(valid_plates), best_plate['confidence'])
                         elif len(plates) > len(valid_plates):
-                            print(f"Vehicle {i+1}: Found {len(plates)} plates, {len(plates) - len(valid_plates)} filtered out due to low confidence")
+                            log.debug("Vehicle %d: Found %d plates, %d filtered out due to low confidence", i+1, len(plates), len(plates) - len(valid_plates))
         
         return all_plates
 
@@ -187,6 +329,13 @@ class DetectLP:
         else:
             return self.process_image_plates_only(image)
     
+    def detect_license_plates_batch(self, images):
+        """Best plate per vehicle for several images; the vehicle model runs once over all of them"""
+        if not images:
+            return []
+        vehicles = self.detect_vehicles(list(images))
+        return [self.process_image_plates_only(image, v) for image, v in zip(images, vehicles)]
+    
     def process_image_all_plates(self, image):
         """Process image to detect all license plates (for debugging)"""
         # Step 1: Detect vehicles
@@ -194,13 +343,15 @@ class DetectLP:
         
         all_plates = []
         
-        # Step 2: Look for license plates in each vehicle
+        # Step 2: Look for license plates in every vehicle ROI at once
+        rois, roi_plates = self._plates_for_vehicles(image, vehicles)
+        
         for i, vehicle in enumerate(vehicles):
             vehicle_bbox = vehicle['bbox']
-            roi = self.crop_vehicle_roi(image, vehicle_bbox)
+            roi = rois[i]
             
             if roi is not None:
-                plates = self.detect_plates_in_roi(roi)
+                plates = roi_plates[i]
                 
                 # Filter out plates with very low confidence
                 valid_plates = [p for p in plates if p['confidence'] >= self.plate_conf_threshold]
@@ -227,11 +378,11 @@ class DetectLP:
                     
                     # Log filtering results
                     if len(plates) > len(valid_plates):
-                        print(f"Vehicle {i+1}: {len(plates) - len(valid_plates)} plates filtered out due to low confidence")
+                        log.debug("Vehicle %d: %d plates filtered out due to low confidence", i+1, len(plates) - len(valid_plates))
                     if len(valid_plates) > len(size_filtered_plates):
-                        print(f"Vehicle {i+1}: {len(valid_plates) - len(size_filtered_plates)} plates filtered out due to size (exceed 30% of vehicle area)")
+                        log.debug("Vehicle %d: %d plates filtered out due to size (exceed 30%% of vehicle area)", i+1, len(valid_plates) - len(size_filtered_plates))
                 
                 if len(plates) > 1:
-                    print(f"Vehicle {i+1}: Found {len(plates)} plates (all returned)")
+                    log.debug("Vehicle %d: Found %d plates (all returned)", i+1, len(plates))
         
         return all_plates
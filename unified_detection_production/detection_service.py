@@ -3,120 +3,360 @@ Detection Service Module
 """
 
 import time
+import io
 import os
-from typing import List, Dict, Any
+import atexit
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, Union, BinaryIO
 import cv2
 import numpy as np
 from pathlib import Path
 
-from api import detect_objects, blur_detections
+from api import detect_objects, detect_objects_batch, blur_detections
+from devices import release_cached_memory
+
+try:
+    import xxhash
+    _hasher = xxhash.xxh64
+except ImportError:  # hashlib fallback, a little slower
+    _hasher = hashlib.blake2b
 from models import BoundingBox, DetectionResponse, BlurResponse
 
+# Output directory, created once per process (uploads are decoded in memory, never staged on disk)
+OUTPUT_DIR = Path("output")
+OUTPUT_DIR.mkdir(exist_ok=True)
+
+# JPEG encodes run off the request thread (imencode releases the GIL)
+BLUR_JPEG_QUALITY = int(os.getenv("BLUR_JPEG_QUALITY", 95))
+JPEG_PARAMS = [cv2.IMWRITE_JPEG_QUALITY, BLUR_JPEG_QUALITY, cv2.IMWRITE_JPEG_OPTIMIZE, 0]
+_WRITE_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="jpeg-write")
+_PENDING_WRITES = {}  # output path -> write future
+_PENDING_LOCK = threading.Lock()
+atexit.register(_WRITE_POOL.shutdown)
+
+# (output dir mtime, list_outputs() entries)
+_OUTPUT_LISTING = None
+
+# LRU of detection results keyed by (image content hash, flags): detect-then-blur runs the models once
+_RESULT_CACHE = OrderedDict()
+_RESULT_CACHE_SIZE = 64
+_RESULT_LOCK = threading.Lock()
+
+def _write_jpeg(path: Path, image: np.ndarray) -> None:
+    """Encode image and publish it at path atomically (readers never see a partial file)"""
+    ok, buf = cv2.imencode('.jpg', image, JPEG_PARAMS)
+    if not ok:
+        raise ValueError(f"Failed to encode {path.name}")
+    tmp = path.with_name(f".{path.name}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(buf)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+def _content_key(image: Union[str, np.ndarray]) -> str:
+    if isinstance(image, np.ndarray):
+        h = _hasher(np.ascontiguousarray(image).data)
+        h.update(str(image.shape).encode())
+    else:
+        h = _hasher(Path(image).read_bytes())
+    return h.hexdigest()
+
+def cached_detect_objects(image: Union[str, np.ndarray], detect_face: bool, detect_lp: bool) -> Dict[str, Any]:
+    """detect_objects() behind a small content-addressed LRU"""
+    key = (_content_key(image), detect_face, detect_lp)
+    with _RESULT_LOCK:
+        if key in _RESULT_CACHE:
+            _RESULT_CACHE.move_to_end(key)
+            return _RESULT_CACHE[key]
+    results = detect_objects(image, detect_face=detect_face, detect_lp=detect_lp)
+    with _RESULT_LOCK:
+        _RESULT_CACHE[key] = results
+        if len(_RESULT_CACHE) > _RESULT_CACHE_SIZE:
+            _RESULT_CACHE.popitem(last=False)
+    return results
+
+def cached_detect_objects_batch(images: List[np.ndarray], detect_face: bool, detect_lp: bool) -> List[Dict[str, Any]]:
+    """detect_objects_batch() for the cache misses only, filling the same LRU"""
+    keys = [(_content_key(image), detect_face, detect_lp) for image in images]
+    results = [None] * len(images)
+    with _RESULT_LOCK:
+        for i, key in enumerate(keys):
+            if key in _RESULT_CACHE:
+                _RESULT_CACHE.move_to_end(key)
+                results[i] = _RESULT_CACHE[key]
+    misses = [i for i, r in enumerate(results) if r is None]
+    if misses:
+        fresh = detect_objects_batch([images[i] for i in misses], detect_face=detect_face, detect_lp=detect_lp)
+        with _RESULT_LOCK:
+            for i, r in zip(misses, fresh):
+                results[i] = _RESULT_CACHE[keys[i]] = r
+            while len(_RESULT_CACHE) > _RESULT_CACHE_SIZE:
+                _RESULT_CACHE.popitem(last=False)
+    return results
+
+def _read_into_buffer(file_obj: BinaryIO, chunk: int = 1 << 20) -> Union[bytearray, memoryview]:
+    """Whole file contents with one copy at most: the in-memory spool's own buffer, else one bytearray"""
+    file_obj.seek(0)
+    inner = getattr(file_obj, "_file", file_obj)  # SpooledTemporaryFile -> BytesIO until it rolls over
+    if isinstance(inner, io.BytesIO):
+        return inner.getbuffer()
+    size = os.fstat(file_obj.fileno()).st_size
+    buf = bytearray(size)
+    view = memoryview(buf)
+    pos = 0
+    while pos < size:
+        n = file_obj.readinto(view[pos:pos + chunk])
+        if not n:
+            break
+        pos += n
+    return view[:pos]
+
 class DetectionService:
     """Service class for handling detection operations"""
     
     def __init__(self):
         """Initialize the detection service"""
-        self.upload_dir = Path("uploads")
-        self.output_dir = Path("output")
-        self.upload_dir.mkdir(exist_ok=True)
-        self.output_dir.mkdir(exist_ok=True)
+        self.output_dir = OUTPUT_DIR
+    
+    def warmup(self) -> None:
+        """One dummy pass through every detector (model load, CUDA context, ORT session setup)"""
+        try:
+            detect_objects(np.zeros((640, 640, 3), np.uint8), detect_face=True, detect_lp=True)
+        finally:
+            release_cached_memory()
     
     def detect_objects_in_image(self, 
-                              image_path: str, 
+                              image_path: Union[str, np.ndarray], 
                               detect_face: bool = True, 
                               detect_license_plate: bool = True) -> DetectionResponse:
-        """Detect objects in an image and return bounding box information"""
+        """Detect objects in an image (file path or decoded array) and return bounding box information"""
         start_time = time.time()
         
+        if not detect_face and not detect_license_plate:
+            return DetectionResponse(
+                success=True,
+                message="No detectors requested",
+                detections=[],
+                total_faces=0,
+                total_license_plates=0,
+                processing_time_ms=0.0
+            )
+        
         try:
             # Perform detection using the unified detection system
-            results = detect_objects(
+            results = cached_detect_objects(
                 image_path, 
                 detect_face=detect_face, 
                 detect_lp=detect_license_plate
             )
             
-            # Convert results to BoundingBox objects
-            detections = []
-            
-            # Process face detections
-            if detect_face and 'faces' in results:
-                for face in results['faces']:
-                    # Handle both list format [x1, y1, x2, y2, confidence] and dict format
-                    if isinstance(face, list) and len(face) >= 5:
-                        # List format: [x1, y1, x2, y2, confidence]
-                        detections.append(BoundingBox(
-                            x1=int(face[0]),
-                            y1=int(face[1]),
-                            x2=int(face[2]),
-                            y2=int(face[3]),
-                            confidence=float(face[4]),
-                            label="face"
-                        ))
-                    elif isinstance(face, dict) and 'bbox' in face:
-                        # Dict format: {'bbox': [x1, y1, x2, y2], 'confidence': score}
-                        bbox = face['bbox']
-                        detections.append(BoundingBox(
-                            x1=int(bbox[0]),
-                            y1=int(bbox[1]),
-                            x2=int(bbox[2]),
-                            y2=int(bbox[3]),
-                            confidence=float(face.get('confidence', 0.0)),
-                            label="face"
-                        ))
+            processing_time = (time.time() - start_time) * 1000  # Convert to milliseconds
+            return self._to_response(results, detect_face, detect_license_plate, processing_time)
             
-            # Process license plate detections
-            if detect_license_plate and 'license_plates' in results:
-                for plate in results['license_plates']:
-                    bbox = plate['bbox']
+        except Exception as e:
+            processing_time = (time.time() - start_time) * 1000
+            return DetectionResponse(
+                success=False,
+                message=f"Detection failed: {str(e)}",
+                detections=[],
+                total_faces=0,
+                total_license_plates=0,
+                processing_time_ms=round(processing_time, 2)
+            )
+        finally:
+            # long-running service: don't let the CUDA cache grow across requests
+            release_cached_memory()
+    
+    def _to_response(self, results: Dict[str, Any], detect_face: bool, detect_license_plate: bool,
+                     processing_time: float) -> DetectionResponse:
+        """DetectionResponse from a detect_objects() result dict"""
+        # Convert results to BoundingBox objects
+        detections = []
+        n_face = 0
+        n_lp = 0
+        
+        # Process face detections
+        if detect_face and 'faces' in results:
+            for face in results['faces']:
+                # Handle both list format [x1, y1, x2, y2, confidence] and dict format
+                if isinstance(face, list) and len(face) >= 5:
+                    # List format: [x1, y1, x2, y2, confidence]
+                    detections.append(BoundingBox(
+                        x1=int(face[0]),
+                        y1=int(face[1]),
+                        x2=int(face[2]),
+                        y2=int(face[3]),
+                        confidence=float(face[4]),
+                        label="face"
+                    ))
+                    n_face += 1
+                elif isinstance(face, dict) and 'bbox' in face:
+                    # Dict format: {'bbox': [x1, y1, x2, y2], 'confidence': score}
+                    bbox = face['bbox']
                     detections.append(BoundingBox(
                         x1=int(bbox[0]),
                         y1=int(bbox[1]),
                         x2=int(bbox[2]),
                         y2=int(bbox[3]),
-                        confidence=float(plate['confidence']),
-                        label="license_plate"
+                        confidence=float(face.get('confidence', 0.0)),
+                        label="face"
                     ))
-            
-            processing_time = (time.time() - start_time) * 1000  # Convert to milliseconds
-            
-            return DetectionResponse(
-                success=True,
-                message=f"Successfully detected {len(detections)} objects",
-                detections=detections,
-                total_faces=len([d for d in detections if d.label == "face"]),
-                total_license_plates=len([d for d in detections if d.label == "license_plate"]),
-                processing_time_ms=round(processing_time, 2)
-            )
-            
+                    n_face += 1
+        
+        # Process license plate detections
+        if detect_license_plate and 'license_plates' in results:
+            for plate in results['license_plates']:
+                bbox = plate['bbox']
+                detections.append(BoundingBox(
+                    x1=int(bbox[0]),
+                    y1=int(bbox[1]),
+                    x2=int(bbox[2]),
+                    y2=int(bbox[3]),
+                    confidence=float(plate['confidence']),
+                    label="license_plate"
+                ))
+                n_lp += 1
+        
+        return DetectionResponse(
+            success=True,
+            message=f"Successfully detected {len(detections)} objects",
+            detections=detections,
+            total_faces=n_face,
+            total_license_plates=n_lp,
+            processing_time_ms=round(processing_time, 2)
+        )
+    
+    def detect_batch(self, 
+                     images: List[np.ndarray], 
+                     detect_face: bool = True, 
+                     detect_license_plate: bool = True,
+                     return_results: bool = False) -> List[Any]:
+        """
+        Detect objects in several decoded images with batched model calls
+        
+        Results land in the same cache as detect_objects_in_image. Each response
+        carries an equal share of the batch time. With return_results=True, each
+        entry is a (DetectionResponse, detect_objects() dict or None) pair; the
+        dict can go straight into blur_objects_in_image(results=...).
+        """
+        start_time = time.time()
+        empty = {'faces': [], 'license_plates': []}
+        
+        if not images or (not detect_face and not detect_license_plate):
+            responses = [self.detect_objects_in_image(image, detect_face, detect_license_plate) for image in images]
+            return [(r, empty) for r in responses] if return_results else responses
+        
+        try:
+            all_results = cached_detect_objects_batch(images, detect_face, detect_license_plate)
+            share = (time.time() - start_time) * 1000 / len(images)
+            responses = [self._to_response(results, detect_face, detect_license_plate, share) for results in all_results]
+        except Exception as e:
+            share = (time.time() - start_time) * 1000 / len(images)
+            all_results = [None] * len(images)
+            responses = [DetectionResponse(
+                success=False,
+                message=f"Detection failed: {str(e)}",
+                detections=[],
+                total_faces=0,
+                total_license_plates=0,
+                processing_time_ms=round(share, 2)
+            ) for _ in images]
+        finally:
+            release_cached_memory()
+        return list(zip(responses, all_results)) if return_results else responses
+    
+    def detect_then_blur(self, 
+                         image_path: Union[str, np.ndarray], 
+                         detect_face: bool = True, 
+                         detect_license_plate: bool = True,
+                         face_blur_strength: int = 15,
+                         plate_blur_strength: int = 15,
+                         output_name: Optional[str] = None,
+                         wait_for_write: bool = False) -> Tuple[DetectionResponse, Optional[BlurResponse]]:
+        """Detection response and blurred output from a single detection pass (no blur if detection failed)"""
+        start_time = time.time()
+        try:
+            if detect_face or detect_license_plate:
+                results = cached_detect_objects(image_path, detect_face=detect_face, detect_lp=detect_license_plate)
+            else:
+                results = {'faces': [], 'license_plates': []}
+            detection = self._to_response(results, detect_face, detect_license_plate, (time.time() - start_time) * 1000)
         except Exception as e:
-            processing_time = (time.time() - start_time) * 1000
             return DetectionResponse(
                 success=False,
                 message=f"Detection failed: {str(e)}",
                 detections=[],
                 total_faces=0,
                 total_license_plates=0,
-                processing_time_ms=round(processing_time, 2)
-            )
+                processing_time_ms=round((time.time() - start_time) * 1000, 2)
+            ), None
+        finally:
+            release_cached_memory()
+        
+        blur = self.blur_objects_in_image(
+            image_path,
+            detect_face=detect_face,
+            detect_license_plate=detect_license_plate,
+            face_blur_strength=face_blur_strength,
+            plate_blur_strength=plate_blur_strength,
+            output_name=output_name,
+            wait_for_write=wait_for_write,
+            results=results
+        )
+        return detection, blur
+    
+    def encode_blurred(self, image: np.ndarray, results: Dict[str, Any],
+                       face_blur_strength: int = 15, plate_blur_strength: int = 15,
+                       inplace: bool = False) -> bytes:
+        """Blur a decoded image with known detection results and return it JPEG-encoded (nothing is written)"""
+        blurred_image = blur_detections(
+            image,
+            results,
+            face_blur_strength=face_blur_strength,
+            plate_blur_strength=plate_blur_strength,
+            inplace=inplace
+        )
+        ok, buf = cv2.imencode('.jpg', blurred_image, JPEG_PARAMS)
+        if not ok:
+            raise ValueError("Failed to encode blurred image")
+        return buf.tobytes()
     
     def blur_objects_in_image(self, 
-                            image_path: str, 
+                            image_path: Union[str, np.ndarray], 
                             detect_face: bool = True, 
                             detect_license_plate: bool = True,
                             face_blur_strength: int = 15,
-                            plate_blur_strength: int = 15) -> BlurResponse:
-        """Blur detected objects in an image"""
+                            plate_blur_strength: int = 15,
+                            output_name: Optional[str] = None,
+                            wait_for_write: bool = False,
+                            results: Optional[Dict[str, Any]] = None) -> BlurResponse:
+        """
+        Blur detected objects in an image (file path or decoded array)
+        
+        The JPEG is written in the background; readers call wait_for_output(path)
+        first, or pass wait_for_write=True to return only once it is on disk.
+        Pass results (a detect_objects() dict) to blur without detecting again.
+        """
         start_time = time.time()
         
         try:
-            # First detect objects
-            results = detect_objects(
-                image_path, 
-                detect_face=detect_face, 
-                detect_lp=detect_license_plate
-            )
+            # First detect objects (nothing to run when both detectors are off)
+            if results is not None:
+                pass
+            elif detect_face or detect_license_plate:
+                results = cached_detect_objects(
+                    image_path, 
+                    detect_face=detect_face, 
+                    detect_lp=detect_license_plate
+                )
+            else:
+                results = {'faces': [], 'license_plates': []}
             
             # Count total detections
             total_detections = 0
@@ -125,8 +365,8 @@ class DetectionService:
             if detect_license_plate and 'license_plates' in results:
                 total_detections += len(results['license_plates'])
             
-            # Generate output filename
-            input_filename = Path(image_path).stem
+            # Generate output filename (arrays carry no name, so take output_name)
+            input_filename = Path(output_name or image_path).stem
             output_filename = f"{input_filename}_blurred.jpg"
             output_path = self.output_dir / output_filename
             
@@ -135,10 +375,18 @@ class DetectionService:
                 image_path,
                 results,
                 face_blur_strength=face_blur_strength,
-                plate_blur_strength=plate_blur_strength,
-                save_path=str(output_path)
+                plate_blur_strength=plate_blur_strength
             )
             
+            # Encode + write off the request thread
+            write = _WRITE_POOL.submit(_write_jpeg, output_path, blurred_image)
+            if wait_for_write:
+                write.result()
+            else:
+                with _PENDING_LOCK:
+                    _PENDING_WRITES[str(output_path)] = write
+                write.add_done_callback(lambda _, key=str(output_path): self._write_done(key))
+            
             processing_time = (time.time() - start_time) * 1000  # Convert to milliseconds
             
             return BlurResponse(
@@ -159,24 +407,49 @@ class DetectionService:
                 processing_time_ms=round(processing_time, 2)
             )
     
-    def save_uploaded_file(self, file_content: bytes, filename: str) -> str:
-        """Save uploaded file to uploads directory"""
-        # Generate unique filename to avoid conflicts
-        timestamp = int(time.time())
-        name, ext = os.path.splitext(filename)
-        unique_filename = f"{name}_{timestamp}{ext}"
-        file_path = self.upload_dir / unique_filename
-        
-        # Save file
-        with open(file_path, "wb") as f:
-            f.write(file_content)
-        
-        return str(file_path)
+    @staticmethod
+    def _write_done(key: str):
+        with _PENDING_LOCK:
+            future = _PENDING_WRITES.get(key)
+            if future is not None and future.done():
+                del _PENDING_WRITES[key]
+    
+    def list_outputs(self) -> List[Dict[str, Any]]:
+        """JPEGs in output/ (filename, size_bytes, created_at), re-scanned only when the directory changes"""
+        global _OUTPUT_LISTING
+        mtime = os.stat(self.output_dir).st_mtime_ns
+        listing = _OUTPUT_LISTING
+        if listing is not None and listing[0] == mtime:
+            return listing[1]
+        entries = []
+        with os.scandir(self.output_dir) as it:
+            for entry in it:
+                if entry.name.endswith('.jpg') and entry.is_file():
+                    st = entry.stat()
+                    entries.append({
+                        "filename": entry.name,
+                        "size_bytes": st.st_size,
+                        "created_at": st.st_ctime
+                    })
+        _OUTPUT_LISTING = (mtime, entries)
+        return entries
+    
+    def pending_write(self, path: Union[str, Path]) -> Optional[Future]:
+        """Future of the background write of path, or None when nothing is pending"""
+        with _PENDING_LOCK:
+            return _PENDING_WRITES.get(str(path))
+    
+    def wait_for_output(self, path: Union[str, Path]) -> None:
+        """Block until a background write of path (if any) has finished"""
+        future = self.pending_write(path)
+        if future is not None:
+            future.result()
     
-    def validate_image(self, image_path: str) -> bool:
-        """Validate that the uploaded file is a valid image"""
+    def decode_upload(self, file_content: Union[bytes, BinaryIO]) -> Optional[np.ndarray]:
+        """Decode an upload (bytes or file-like, e.g. UploadFile.file) in memory; returns the image or None if invalid"""
         try:
-            image = cv2.imread(image_path)
-            return image is not None
+            if not isinstance(file_content, (bytes, bytearray, memoryview)):
+                file_content = _read_into_buffer(file_content)
+            return cv2.imdecode(np.frombuffer(file_content, np.uint8), cv2.IMREAD_COLOR)
         except Exception:
-            return False
+            return None
@@ -0,0 +1,147 @@
+"""
+Inference Device Selection
+The device comes from an explicit argument or the IDEN_HIDE_DEVICE
+environment variable: cpu (default), cuda / cuda:N, tensorrt or openvino.
+IDEN_HIDE_QUANT=int8 switches to the INT8 models from quantize_models.py.
+On tensorrt, YOLO .pt weights are exported to a .engine once and reused, and
+SCRFD runs through ORT's TensorRT provider in FP16; both are cached per GPU model.
+On cuda/tensorrt with a CUDA-enabled OpenCV build, blurring also runs on the GPU.
+IDEN_HIDE_CV_THREADS caps OpenCV's own thread pool (e.g. 1 per process worker).
+IDEN_HIDE_OPENCL=1 blurs through OpenCV's OpenCL T-API (UMat) on other GPUs.
+"""
+
+import os
+import re
+import shutil
+import threading
+from functools import lru_cache
+
+def get_device(device=None):
+    """Resolve the configured inference device name"""
+    return (device or os.getenv("IDEN_HIDE_DEVICE", "cpu")).strip().lower()
+
+@lru_cache(maxsize=1)
+def gpu_tag():
+    """Filesystem-safe name of GPU 0 (engines are only valid on the GPU model that built them)"""
+    try:
+        import torch
+        name = torch.cuda.get_device_name(0) if torch.cuda.is_available() else "nogpu"
+    except ImportError:
+        name = "nogpu"
+    return re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_").lower()
+
+def trt_cache_dir():
+    """ORT TensorRT engine cache, one directory per GPU model"""
+    root = os.getenv("IDEN_HIDE_TRT_CACHE", os.path.join(os.path.expanduser("~/.cache"), "iden_hide", "trt"))
+    path = os.path.join(root, gpu_tag())
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def ort_providers(device=None):
+    """ONNX Runtime execution providers for the device (CPU always last as fallback)"""
+    device = get_device(device)
+    if device == "tensorrt":
+        # FP16 engines, built on first load and reused from the cache afterwards
+        trt = {"trt_fp16_enable": True, "trt_engine_cache_enable": True, "trt_engine_cache_path": trt_cache_dir()}
+        return [("TensorrtExecutionProvider", trt), "CUDAExecutionProvider", "CPUExecutionProvider"]
+    if device.startswith("cuda"):
+        return ["CUDAExecutionProvider", "CPUExecutionProvider"]
+    if device == "openvino":
+        return ["OpenVINOExecutionProvider", "CPUExecutionProvider"]
+    return ["CPUExecutionProvider"]
+
+def torch_device(device=None):
+    """Device string for Ultralytics YOLO predict()"""
+    device = get_device(device)
+    if device.startswith("cuda"):
+        return device if ":" in device else "cuda:0"
+    if device == "tensorrt":
+        return "cuda:0"
+    return "cpu"
+
+_EXPORT_LOCK = threading.Lock()
+
+def tensorrt_weights(path, imgsz=640, batch=16, device=None):
+    """On tensorrt, the sibling <stem>_<gpu>.engine for a .pt (exported once, FP16, dynamic); else path"""
+    if get_device(device) != "tensorrt" or not path.endswith(".pt"):
+        return path
+    engine = f"{os.path.splitext(path)[0]}_{gpu_tag()}.engine"
+    with _EXPORT_LOCK:
+        if not os.path.exists(engine):
+            from ultralytics import YOLO
+            print(f"🔧 Building TensorRT engine {engine} (one-time)")
+            built = YOLO(path).export(format="engine", half=True, dynamic=True, batch=batch, imgsz=imgsz)
+            if os.path.abspath(built) != os.path.abspath(engine):
+                shutil.move(built, engine)
+    return engine
+
+def opencv_cuda(device=None):
+    """True when the device is cuda/tensorrt and this OpenCV build can see a CUDA GPU"""
+    device = get_device(device)
+    if not (device.startswith("cuda") or device == "tensorrt"):
+        return False
+    import cv2
+    try:
+        return cv2.cuda.getCudaEnabledDeviceCount() > 0
+    except (AttributeError, cv2.error):
+        return False
+
+def opencv_opencl():
+    """True when IDEN_HIDE_OPENCL=1 and OpenCV finds an OpenCL device (e.g. an Intel iGPU); enables T-API"""
+    if os.getenv("IDEN_HIDE_OPENCL", "0").strip().lower() not in ("1", "true", "yes"):
+        return False
+    import cv2
+    if not cv2.ocl.haveOpenCL():
+        print("⚠️ IDEN_HIDE_OPENCL=1 but OpenCV has no OpenCL device, blurring on the CPU")
+        return False
+    cv2.ocl.setUseOpenCL(True)
+    return True
+
+_CV_CONFIGURED = False
+
+def configure_opencv():
+    """Once per process: SIMD dispatch on, IDEN_HIDE_CV_THREADS threads if set, warn when AVX2 is unused"""
+    global _CV_CONFIGURED
+    if _CV_CONFIGURED:
+        return
+    _CV_CONFIGURED = True
+    import cv2
+    cv2.setUseOptimized(True)
+    threads = os.getenv("IDEN_HIDE_CV_THREADS")
+    if threads:
+        cv2.setNumThreads(int(threads))
+    # CPU has AVX2 (feature id 11) but this build has no AVX2 kernels to dispatch
+    dispatched = [l for l in cv2.getBuildInformation().splitlines() if "Dispatched code generation" in l]
+    if cv2.checkHardwareSupport(11) and dispatched and "AVX2" not in dispatched[0]:
+        print("⚠️ OpenCV build has no AVX2 kernels; blur/resize run at SSE speed (see SETUP_GUIDE.md)")
+
+def use_int8():
+    """True when IDEN_HIDE_QUANT=int8"""
+    return os.getenv("IDEN_HIDE_QUANT", "").strip().lower() == "int8"
+
+def face_pack(name="buffalo_l"):
+    """InsightFace model pack to load; the _int8 pack when enabled and present (FP32 fallback)"""
+    if use_int8():
+        root = os.path.join(os.path.expanduser("~/.insightface"), "models", f"{name}_int8")
+        if os.path.isdir(root):
+            return f"{name}_int8"
+        print(f"⚠️ IDEN_HIDE_QUANT=int8 but {root} is missing, using FP32 {name}")
+    return name
+
+def yolo_weights(path):
+    """YOLO weights to load; the sibling <stem>_int8.onnx when enabled and present (FP32 fallback)"""
+    if use_int8():
+        int8 = os.path.splitext(path)[0] + "_int8.onnx"
+        if os.path.exists(int8):
+            return int8
+        print(f"⚠️ IDEN_HIDE_QUANT=int8 but {int8} is missing, using FP32 {path}")
+    return path
+
+def release_cached_memory():
+    """Return cached CUDA allocator blocks between requests (no-op on CPU)"""
+    try:
+        import torch
+    except ImportError:
+        return
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
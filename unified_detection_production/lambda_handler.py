@@ -0,0 +1,28 @@
+"""
+Lambda Entry Point for Fan-out Folder Processing
+One invocation per image, started by the state machine that
+S3ProcessingService.process_folder_fanout drives (S3_FANOUT_STATE_MACHINE).
+The event carries input_s3_path, output_s3_path and the DetectParams fields;
+the returned dict is an S3ImageResult.
+"""
+
+import os
+from s3_processor import S3ImageProcessor, DetectParams
+
+# Reused across warm invocations: models load once per container
+_processor = None
+
+def _get_processor() -> S3ImageProcessor:
+    """Processor for the function's own role credentials"""
+    global _processor
+    if _processor is None:
+        _processor = S3ImageProcessor(
+            os.environ["AWS_ACCESS_KEY_ID"],
+            os.environ["AWS_SECRET_ACCESS_KEY"],
+            os.environ.get("AWS_SESSION_TOKEN")
+        )
+    return _processor
+
+def handler(event, context):
+    params = DetectParams(**{k: event[k] for k in DetectParams._fields if k in event})
+    return _get_processor().process_single_image(event["input_s3_path"], event["output_s3_path"], *params)
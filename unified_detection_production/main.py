@@ -2,29 +2,54 @@
 FastAPI Server for Unified Detection System
 """
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request
+from fastapi.responses import FileResponse, ORJSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
+import msgpack
 from typing import Optional, Dict, Any, List
 import os
+import time
+import asyncio
+import atexit
+import queue
+import logging
+import logging.handlers
+from functools import lru_cache
 from pathlib import Path
 
 from models import (
     DetectionResponse, BlurRequest, BlurResponse, ErrorResponse,
-    S3SingleImageRequest, S3SingleImageResponse,
-    S3FolderRequest, S3FolderResponse, S3ViewRequest, S3ViewResponse
+    S3Credentials, S3SingleImageRequest, S3SingleImageResponse,
+    S3FolderRequest, S3FolderResponse, S3ImageResult, S3ViewRequest, S3ViewResponse
 )
 from detection_service import DetectionService
 from s3_service import S3ProcessingService
+from s3_processor import get_s3_client
 from parallel_processor import get_parallel_processor
 from urllib.parse import urlparse
 
+# Detector diagnostics are DEBUG-level; production runs at WARNING (override with LOG_LEVEL).
+# Request threads only enqueue records; a listener thread formats and writes them
+_LOG_QUEUE = queue.SimpleQueue()
+_log_listener = logging.handlers.QueueListener(_LOG_QUEUE, logging.StreamHandler())
+_log_listener.handlers[0].setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING").upper(),
+                    handlers=[logging.handlers.QueueHandler(_LOG_QUEUE)])
+_log_listener.start()
+atexit.register(_log_listener.stop)
+log = logging.getLogger(__name__)
+
+def _json_response(model) -> Response:
+    """Serialize a response model in pydantic-core (skips the jsonable_encoder walk over every result)"""
+    return Response(content=model.model_dump_json(), media_type="application/json")
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Unified Detection API",
     description="API for face and license plate detection with blur functionality",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -40,6 +65,11 @@ app.add_middleware(
 detection_service = DetectionService()
 s3_service = S3ProcessingService()
 
+@app.on_event("startup")
+async def warmup():
+    """Pay model load / first-inference setup before the first request arrives"""
+    await asyncio.to_thread(detection_service.warmup)
+
 @app.get("/")
 async def root():
     """Root endpoint with API information"""
@@ -48,6 +78,7 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "detect": "/detect - POST - Detect objects in image",
+            "detect_msgpack": "/detect.msgpack - POST - Same as /detect, msgpack-encoded",
             "blur": "/blur - POST - Blur detected objects in image",
             "health": "/health - GET - Health check"
         }
@@ -70,27 +101,19 @@ async def detect_objects(
         if not file.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="File must be an image")
         
-        # Read file content
-        file_content = await file.read()
-        
-        # Save uploaded file
-        image_path = detection_service.save_uploaded_file(file_content, file.filename)
-        
-        # Validate image
-        if not detection_service.validate_image(image_path):
-            os.remove(image_path)  # Clean up invalid file
+        # Decode straight from the spooled upload (no uploads/ round trip, no extra bytes copy)
+        image = await asyncio.to_thread(detection_service.decode_upload, file.file)
+        if image is None:
             raise HTTPException(status_code=400, detail="Invalid image file")
         
-        # Perform detection
-        result = detection_service.detect_objects_in_image(
-            image_path=image_path,
+        # Perform detection (off the event loop)
+        result = await asyncio.to_thread(
+            detection_service.detect_objects_in_image,
+            image_path=image,
             detect_face=detect_face,
             detect_license_plate=detect_license_plate
         )
         
-        # Clean up uploaded file
-        os.remove(image_path)
-        
         return result
         
     except HTTPException:
@@ -98,6 +121,16 @@ async def detect_objects(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+@app.post("/detect.msgpack")
+async def detect_objects_msgpack(
+    file: UploadFile = File(..., description="Image file to process"),
+    detect_face: bool = Form(True, description="Whether to detect faces"),
+    detect_license_plate: bool = Form(True, description="Whether to detect license plates")
+):
+    """Same as /detect, msgpack-encoded for server-to-server callers"""
+    result = await detect_objects(file, detect_face, detect_license_plate)
+    return Response(content=msgpack.packb(result.model_dump()), media_type="application/msgpack")
+
 @app.post("/blur", response_model=BlurResponse)
 async def blur_objects(
     file: UploadFile = File(..., description="Image file to process"),
@@ -118,29 +151,22 @@ async def blur_objects(
         if plate_blur_strength < 1 or plate_blur_strength > 100:
             raise HTTPException(status_code=400, detail="Plate blur strength must be between 1 and 100")
         
-        # Read file content
-        file_content = await file.read()
-        
-        # Save uploaded file
-        image_path = detection_service.save_uploaded_file(file_content, file.filename)
-        
-        # Validate image
-        if not detection_service.validate_image(image_path):
-            os.remove(image_path)  # Clean up invalid file
+        # Decode straight from the spooled upload (no uploads/ round trip, no extra bytes copy)
+        image = await asyncio.to_thread(detection_service.decode_upload, file.file)
+        if image is None:
             raise HTTPException(status_code=400, detail="Invalid image file")
         
-        # Perform blur operation
-        result = detection_service.blur_objects_in_image(
-            image_path=image_path,
+        # Perform blur operation (off the event loop)
+        result = await asyncio.to_thread(
+            detection_service.blur_objects_in_image,
+            image_path=image,
             detect_face=detect_face,
             detect_license_plate=detect_license_plate,
             face_blur_strength=face_blur_strength,
-            plate_blur_strength=plate_blur_strength
+            plate_blur_strength=plate_blur_strength,
+            output_name=f"{Path(file.filename).stem}_{time.monotonic_ns()}"
         )
         
-        # Clean up uploaded file
-        os.remove(image_path)
-        
         return result
         
     except HTTPException:
@@ -151,13 +177,7 @@ async def blur_objects(
 @app.get("/download/")
 async def download_root():
     """List available files for download"""
-    available_files = []
-    for file_path in detection_service.output_dir.glob("*.jpg"):
-        available_files.append({
-            "filename": file_path.name,
-            "size_bytes": file_path.stat().st_size,
-            "created_at": file_path.stat().st_ctime
-        })
+    available_files = detection_service.list_outputs()
     
     return {
         "message": "Download endpoint requires a filename. Use /download/{filename}",
@@ -167,22 +187,42 @@ async def download_root():
     }
 
 @app.get("/download/{filename}")
-async def download_file(filename: str):
-    """Download a processed image file"""
+async def download_file(filename: str, request: Request):
+    """Download a processed image file (ETag / 304 for repeat views)"""
     file_path = detection_service.output_dir / filename
     
-    if not file_path.exists():
+    # The blurred JPEG may still be encoding in the background (await it, don't block the loop)
+    pending = detection_service.pending_write(file_path)
+    if pending is not None:
+        try:
+            await asyncio.wrap_future(pending)
+        except Exception as e:
+            # failed writes never publish a file, so this falls through to the 404
+            log.warning("Background write of %s failed: %s", filename, e)
+    
+    try:
+        stat = file_path.stat()
+    except FileNotFoundError:
         # List available files for debugging
-        available_files = [f.name for f in detection_service.output_dir.glob("*.jpg")]
+        available_files = [f["filename"] for f in detection_service.list_outputs()]
         raise HTTPException(
             status_code=404, 
             detail=f"File '{filename}' not found. Available files: {available_files[:5]}{'...' if len(available_files) > 5 else ''}"
         )
     
+    headers = {
+        "ETag": f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"',
+        "Cache-Control": "public, max-age=3600"
+    }
+    if headers["ETag"] in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    
     return FileResponse(
         path=str(file_path),
         filename=filename,
-        media_type='image/jpeg'
+        media_type='image/jpeg',
+        stat_result=stat,
+        headers=headers
     )
 
 @app.post("/process-parallel")
@@ -210,9 +250,9 @@ async def process_images_parallel(
             if not file.content_type.startswith('image/'):
                 continue  # Skip non-image files
             
-            file_content = await file.read()
+            # Raw bytes cross the process boundary; each worker decodes once
             file_data_list.append({
-                'content': file_content,
+                'content': await file.read(),
                 'filename': file.filename
             })
         
@@ -223,7 +263,8 @@ async def process_images_parallel(
         parallel_processor = get_parallel_processor(max_workers)
         
         # Process images in parallel
-        result = parallel_processor.process_images_parallel(
+        result = await asyncio.to_thread(
+            parallel_processor.process_images_parallel,
             files=file_data_list,
             detect_face=detect_face,
             detect_license_plate=detect_license_plate,
@@ -242,21 +283,34 @@ async def process_images_parallel(
 @app.get("/outputs")
 async def list_output_files():
     """List all available output files"""
-    output_files = []
-    for file_path in detection_service.output_dir.glob("*.jpg"):
-        output_files.append({
-            "filename": file_path.name,
-            "size_bytes": file_path.stat().st_size,
-            "created_at": file_path.stat().st_ctime
-        })
+    output_files = detection_service.list_outputs()
     
     return {
         "files": output_files,
         "total_count": len(output_files)
     }
 
+# /s3/view-image: presigned URLs reused within a minute (get_s3_client caches the client per credential set)
+_MAX_PRESIGN_SECONDS = 7 * 24 * 3600  # SigV4 limit
+
+@lru_cache(maxsize=4096)
+def _signed_url(credentials: tuple, bucket_name: str, object_key: str, expiration: int, minute: int) -> str:
+    """credentials: (aws_access_key_id, aws_secret_access_key, aws_session_token)"""
+    client = get_s3_client(*credentials, region_name='ap-south-1')  # Default region
+    # signed 60 s longer so a URL served late in its minute still lasts `expiration`
+    return client.generate_presigned_url(
+        'get_object',
+        Params={
+            'Bucket': bucket_name, 
+            'Key': object_key,
+            'ResponseContentType': 'image/jpeg',  # Force image content type
+            'ResponseContentDisposition': 'inline'  # Display inline in browser
+        },
+        ExpiresIn=min(expiration + 60, _MAX_PRESIGN_SECONDS)
+    )
+
 # S3 Processing Endpoints
-@app.post("/s3/process-single", response_model=S3SingleImageResponse)
+@app.post("/s3/process-single", response_model=None, responses={200: {"model": S3SingleImageResponse}})
 async def process_s3_single_image(request: S3SingleImageRequest):
     """
     Process a single image from S3
@@ -270,8 +324,8 @@ async def process_s3_single_image(request: S3SingleImageRequest):
     - **plate_blur_strength**: Blur strength for license plates (default: 20)
     """
     try:
-        result = s3_service.process_single_image(request.dict())
-        return result
+        result = await asyncio.to_thread(s3_service.process_single_image, request)
+        return _json_response(result)
     except Exception as e:
         return S3SingleImageResponse(
             success=False,
@@ -280,7 +334,7 @@ async def process_s3_single_image(request: S3SingleImageRequest):
             processing_time_seconds=0.0
         )
 
-@app.post("/s3/process-folder", response_model=S3FolderResponse)
+@app.post("/s3/process-folder", response_model=None, responses={200: {"model": S3FolderResponse}})
 async def process_s3_folder(request: S3FolderRequest):
     """
     Process all images in an S3 folder
@@ -294,8 +348,8 @@ async def process_s3_folder(request: S3FolderRequest):
     - **plate_blur_strength**: Blur strength for license plates (default: 20)
     """
     try:
-        result = s3_service.process_folder(request.dict())
-        return result
+        result = await asyncio.to_thread(s3_service.process_folder, request)
+        return _json_response(result)
     except Exception as e:
         return S3FolderResponse(
             success=False,
@@ -310,7 +364,7 @@ async def process_s3_folder(request: S3FolderRequest):
             average_time_per_image=0.0
         )
 
-@app.post("/s3/process-folder-parallel", response_model=S3FolderResponse)
+@app.post("/s3/process-folder-parallel", response_model=None, responses={200: {"model": S3FolderResponse}})
 async def process_s3_folder_parallel(request: S3FolderRequest):
     """
     Process all images in an S3 folder using parallel processing for faster results
@@ -325,12 +379,10 @@ async def process_s3_folder_parallel(request: S3FolderRequest):
     - **max_workers**: Number of parallel workers (default: 4, max: 8)
     """
     try:
-        # Add max_workers parameter to request data
-        request_data = request.dict()
-        request_data['max_workers'] = min(request_data.get('max_workers', 4), 8)  # Cap at 8 workers
+        max_workers = min(getattr(request, 'max_workers', 4), 8)  # Cap at 8 workers
         
-        result = s3_service.process_folder_parallel(request_data)
-        return result
+        result = await asyncio.to_thread(s3_service.process_folder_parallel, request, max_workers)
+        return _json_response(result)
     except Exception as e:
         return S3FolderResponse(
             success=False,
@@ -345,6 +397,28 @@ async def process_s3_folder_parallel(request: S3FolderRequest):
             average_time_per_image=0.0
         )
 
+@app.post("/s3/process-folder-fanout", response_model=None, responses={200: {"model": S3FolderResponse}})
+async def process_s3_folder_fanout(request: S3FolderRequest):
+    """
+    Process all images in an S3 folder with one Step Functions execution per image
+    (requires S3_FANOUT_STATE_MACHINE; see lambda_handler.py)
+    """
+    return _json_response(await asyncio.to_thread(s3_service.process_folder_fanout, request))
+
+@app.post("/s3/process-folder-stream", response_model=None, responses={200: {"model": S3ImageResult}})
+async def process_s3_folder_stream(request: S3FolderRequest):
+    """
+    Same as /s3/process-folder-parallel, but streams one S3ImageResult per line
+    (application/x-ndjson) as each image finishes, instead of one response at the end
+    """
+    max_workers = min(getattr(request, 'max_workers', 4), 8)  # Cap at 8 workers
+    try:
+        results = await asyncio.to_thread(s3_service.process_folder_stream, request, max_workers)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to list S3 folder: {str(e)}")
+    # Sync generator: Starlette iterates it in the threadpool, so the wait loop never blocks the event loop
+    return StreamingResponse((r.model_dump_json() + "\n" for r in results), media_type="application/x-ndjson")
+
 @app.post("/s3/list-folder")
 async def list_s3_folder(request: Dict[str, Any]):
     """
@@ -357,13 +431,7 @@ async def list_s3_folder(request: Dict[str, Any]):
         credentials = request['credentials']
         s3_folder_path = request['s3_folder_path']
         
-        from s3_processor import S3ImageProcessor
-        
-        processor = S3ImageProcessor(
-            aws_access_key_id=credentials['aws_access_key_id'],
-            aws_secret_access_key=credentials['aws_secret_access_key'],
-            aws_session_token=credentials.get('aws_session_token')
-        )
+        processor = await asyncio.to_thread(s3_service.get_processor, S3Credentials(**credentials))
         
         # List images in folder
         image_paths = processor._list_images_in_s3_folder(s3_folder_path)
@@ -394,7 +462,7 @@ async def list_s3_folder(request: Dict[str, Any]):
             "total_count": 0
         }
 
-@app.post("/s3/view-image", response_model=S3ViewResponse)
+@app.post("/s3/view-image", response_model=None, responses={200: {"model": S3ViewResponse}})
 async def view_s3_image(request: S3ViewRequest):
     """
     Generate presigned URL for viewing S3 image
@@ -404,8 +472,6 @@ async def view_s3_image(request: S3ViewRequest):
     - **expiration**: URL expiration time in seconds (default: 300)
     """
     try:
-        import boto3
-        from boto3.session import Config
         from botocore.exceptions import ClientError
         
         # Parse S3 URI to extract bucket and key
@@ -421,26 +487,14 @@ async def view_s3_image(request: S3ViewRequest):
                 expiration=request.expiration
             )
         
-        # Create S3 client with provided credentials
-        s3_client = boto3.client(
-            's3',
-            aws_access_key_id=request.credentials.aws_access_key_id,
-            aws_secret_access_key=request.credentials.aws_secret_access_key,
-            aws_session_token=request.credentials.aws_session_token,
-            region_name='ap-south-1',  # Default region
-            config=Config(s3={'addressing_style': 'virtual'})  # Use virtual-hosted-style URLs
-        )
-        
-        # Generate presigned URL
-        presigned_url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={
-                'Bucket': bucket_name, 
-                'Key': object_key,
-                'ResponseContentType': 'image/jpeg',  # Force image content type
-                'ResponseContentDisposition': 'inline'  # Display inline in browser
-            },
-            ExpiresIn=request.expiration
+        # Cached client + presigned URL (re-signed once a minute)
+        credentials = request.credentials
+        presigned_url = _signed_url(
+            (credentials.aws_access_key_id, credentials.aws_secret_access_key, credentials.aws_session_token),
+            bucket_name,
+            object_key,
+            request.expiration,
+            int(time.time() // 60)
         )
         
         return S3ViewResponse(
@@ -481,13 +535,13 @@ async def test_s3_credentials(
     - **aws_session_token**: Optional AWS session token
     """
     try:
-        from s3_processor import S3ImageProcessor
-        
-        processor = S3ImageProcessor(
+        processor = await asyncio.to_thread(s3_service.get_processor, S3Credentials(
             aws_access_key_id=aws_access_key_id,
             aws_secret_access_key=aws_secret_access_key,
             aws_session_token=aws_session_token
-        )
+        ))
+        # building a processor makes no request; this is the credential check
+        await asyncio.to_thread(processor.s3_client.list_buckets)
         
         return {
             "success": True,
@@ -500,10 +554,17 @@ async def test_s3_credentials(
         }
 
 if __name__ == "__main__":
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        log_level="info"
-    )
+    # DEBUG=True: single auto-reloading process. Every worker loads its own copy of the
+    # models (and GPU memory), so one worker is the default; WEB_CONCURRENCY opts into more
+    if os.getenv("DEBUG", "False").lower() == "true":
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True, log_level="info")
+    else:
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=8000,
+            workers=int(os.getenv("WEB_CONCURRENCY", 1)),
+            loop="uvloop",
+            http="httptools",
+            log_level="info"
+        )
@@ -2,17 +2,21 @@
 API Request and Response Models
 """
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, TypeAdapter
 from typing import List, Optional, Dict, Any
 from enum import Enum
 
+class _Response(BaseModel):
+    """Response models are built once and only read (model_copy(update=...) still works)"""
+    model_config = ConfigDict(frozen=True)
+
 class DetectionType(str, Enum):
     """Detection type options"""
     FACE = "face"
     LICENSE_PLATE = "license_plate"
     BOTH = "both"
 
-class BoundingBox(BaseModel):
+class BoundingBox(_Response):
     """Bounding box coordinates and metadata"""
     x1: int
     y1: int
@@ -21,7 +25,7 @@ class BoundingBox(BaseModel):
     confidence: float
     label: str
 
-class DetectionResponse(BaseModel):
+class DetectionResponse(_Response):
     """Response model for detection endpoint"""
     success: bool
     message: str
@@ -37,7 +41,7 @@ class BlurRequest(BaseModel):
     face_blur_strength: int = 15
     plate_blur_strength: int = 15
 
-class BlurResponse(BaseModel):
+class BlurResponse(_Response):
     """Response model for blur endpoint"""
     success: bool
     message: str
@@ -45,7 +49,7 @@ class BlurResponse(BaseModel):
     detections_applied: int
     processing_time_ms: float
 
-class ErrorResponse(BaseModel):
+class ErrorResponse(_Response):
     """Error response model"""
     success: bool = False
     message: str
@@ -78,26 +82,30 @@ class S3FolderRequest(BaseModel):
     face_blur_strength: int = 25
     plate_blur_strength: int = 20
 
-class S3ImageResult(BaseModel):
+class S3ImageResult(_Response):
     """Result for a single processed image"""
     success: bool
     input_s3_path: str
-    output_s3_path: str
+    output_s3_path: str = ""
     output_s3_url: Optional[str] = None
     original_filename: Optional[str] = None
     faces_detected: int = 0
     license_plates_detected: int = 0
     processing_time_seconds: float = 0.0
     error: Optional[str] = None
+    skipped: bool = False  # output already written from the same source ETag
+
+# Validates a whole list of processor result dicts in one call
+S3ImageResultList = TypeAdapter(List[S3ImageResult])
 
-class S3SingleImageResponse(BaseModel):
+class S3SingleImageResponse(_Response):
     """Response model for single S3 image processing"""
     success: bool
     message: str
     result: Optional[S3ImageResult] = None
     processing_time_seconds: float
 
-class S3FolderResponse(BaseModel):
+class S3FolderResponse(_Response):
     """Response model for S3 folder processing"""
     success: bool
     message: str
@@ -116,7 +124,7 @@ class S3ViewRequest(BaseModel):
     s3_uri: str
     expiration: int = 300  # 5 minutes default
 
-class S3ViewResponse(BaseModel):
+class S3ViewResponse(_Response):
     """Response for S3 image view"""
     success: bool
     presigned_url: Optional[str] = None
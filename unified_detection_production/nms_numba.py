@@ -0,0 +1,42 @@
+"""
+Numba NMS Kernel
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:  # fall back to the NumPy loop in the callers
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        def wrap(fn):
+            return fn
+        return wrap
+
+@njit(cache=True, fastmath=True)
+def nms_core(B, S, iou_thr):
+    """Greedy NMS over float32 B[N,4] (xyxy) / S[N]; returns int32 keep indices"""
+    n = B.shape[0]
+    order = np.argsort(S)[::-1]
+    areas = (B[:, 2] - B[:, 0]) * (B[:, 3] - B[:, 1])
+    suppressed = np.zeros(n, np.bool_)
+    keep = np.empty(n, np.int32)
+    k = 0
+    for a in range(n):
+        i = order[a]
+        if suppressed[i]:
+            continue
+        keep[k] = i; k += 1
+        for b in range(a + 1, n):
+            j = order[b]
+            if suppressed[j]:
+                continue
+            iw = max(0.0, min(B[i, 2], B[j, 2]) - max(B[i, 0], B[j, 0]))
+            ih = max(0.0, min(B[i, 3], B[j, 3]) - max(B[i, 1], B[j, 1]))
+            inter = iw * ih
+            iou = inter / (areas[i] + areas[j] - inter + 1e-6)
+            if iou > iou_thr:
+                suppressed[j] = True
+    return keep[:k]
@@ -4,11 +4,229 @@ Uses the same detection and blur APIs as sequential processing
 """
 
 import time
-from concurrent.futures import ThreadPoolExecutor
-from typing import List, Dict, Any
-import tempfile
-import os
+import uuid
+import urllib.request
+import atexit
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError, as_completed
+from typing import List, Dict, Any, Optional, Tuple
+import cv2
+import numpy as np
+from pathlib import Path
 from detection_service import DetectionService
+from visualizer import exif_orientation
+
+# Per-process detection service, built by _init_worker inside each child
+_worker_service = None
+
+# Images per worker task: each task runs one batched detection pass
+BATCH_SIZE = 16
+
+def _decode(image_data: Dict[str, Any]) -> Tuple[bytes, np.ndarray]:
+    content = image_data['file_content']
+    if content is None:
+        # Presigned entry: fetch the bytes straight from S3
+        with urllib.request.urlopen(image_data['get_url'], timeout=60) as response:
+            content = response.read()
+    image = cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Invalid image file")
+    return content, image
+
+def _strip_metadata(content: bytes) -> Optional[bytes]:
+    """
+    The JPEG without its EXIF/XMP/IPTC/comment segments, pixels untouched (no re-encode)
+    
+    Returns None for anything that is not a plain JPEG, or whose EXIF orientation is not 1
+    (dropping the tag would turn the picture); those have to be re-encoded from the decoded array.
+    """
+    if content[:2] != b'\xff\xd8':
+        return None
+    out = [content[:2]]
+    pos, n = 2, len(content)
+    while pos + 4 <= n and content[pos] == 0xFF:
+        marker = content[pos + 1]
+        if marker == 0xDA:  # start of scan: compressed data runs to the end
+            out.append(content[pos:])
+            return b''.join(out)
+        end = pos + 2 + int.from_bytes(content[pos + 2:pos + 4], 'big')
+        if end > n:
+            return None
+        if marker == 0xE1 and content[pos + 4:pos + 10] == b'Exif\x00\x00' \
+                and exif_orientation(content[pos + 10:end]) != 1:
+            return None
+        # APP0 (JFIF) and APP2 (ICC profile) stay; other APPn and COM segments carry the metadata
+        if not (0xE1 <= marker <= 0xEF and marker != 0xE2 or marker == 0xFE):
+            out.append(content[pos:end])
+        pos = end
+    return None
+
+def _put_presigned(url: str, body: bytes):
+    """PUT an encoded JPEG to a presigned URL (signed with ContentType image/jpeg)"""
+    request = urllib.request.Request(url, data=body, method='PUT', headers={'Content-Type': 'image/jpeg'})
+    with urllib.request.urlopen(request, timeout=60):
+        pass
+
+def _process_batch(detection_service: DetectionService, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Process a batch of images: one batched detection call, then per-image blur
+    
+    Args:
+        batch: List of dictionaries with image bytes and processing options
+               (the options are the same for every entry)
+        
+    Returns:
+        List with one result dictionary per entry, in input order
+    """
+    results = [None] * len(batch)
+    
+    # Decode once; detection and blur both work on the arrays
+    images = []
+    for i, image_data in enumerate(batch):
+        try:
+            images.append((i,) + _decode(image_data))
+        except Exception as e:
+            results[i] = {
+                'success': False,
+                'filename': image_data['filename'],
+                'error': str(e),
+                'processing_time': 0
+            }
+    if not images:
+        return results
+    
+    options = batch[0]
+    detect_face = options['detect_face']
+    detect_license_plate = options['detect_license_plate']
+    enable_blur = options.get('enable_blur', False)
+    face_blur_strength = options.get('face_blur_strength', 25)
+    plate_blur_strength = options.get('plate_blur_strength', 20)
+    return_bytes = options.get('return_bytes', False)
+    
+    # One batched forward pass for the whole chunk; its results feed the blur step directly
+    detection_results = detection_service.detect_batch(
+        [image for _, _, image in images],
+        detect_face=detect_face,
+        detect_license_plate=detect_license_plate,
+        return_results=True
+    )
+    
+    for (i, content, image), (detection_result, raw_results) in zip(images, detection_results):
+        filename = batch[i]['filename']
+        try:
+            if not detection_result.success:
+                raise ValueError(f"Detection failed: {detection_result.message}")
+            
+            # Use detection service for blur (same as sequential)
+            blur_result = None
+            blur_data = None
+            put_url = batch[i].get('put_url')
+            detections_applied = detection_result.total_faces + detection_result.total_license_plates
+            if enable_blur and return_bytes:
+                # Encoded JPEG goes back to the parent in the result (or straight to S3), no output file
+                blur_start = time.time()
+                # nothing to blur: publish the original minus its metadata instead of re-encoding it
+                blurred_bytes = None if detections_applied else _strip_metadata(content)
+                if blurred_bytes is None:
+                    blurred_bytes = detection_service.encode_blurred(
+                        image, raw_results,
+                        face_blur_strength=face_blur_strength,
+                        plate_blur_strength=plate_blur_strength,
+                        inplace=True  # the decoded frame is not used again
+                    )
+                if put_url:
+                    _put_presigned(put_url, blurred_bytes)
+                blur_data = {
+                    "success": True,
+                    "message": "Uploaded by worker" if put_url else "Blurred in memory",
+                    "blurred_image_path": None,
+                    "blurred_bytes": None if put_url else blurred_bytes,
+                    "uploaded": bool(put_url),
+                    "detections_applied": detections_applied,
+                    "processing_time_ms": round((time.time() - blur_start) * 1000, 2)
+                }
+            elif enable_blur:
+                blur_result = detection_service.blur_objects_in_image(
+                    image_path=image,
+                    detect_face=detect_face,
+                    detect_license_plate=detect_license_plate,
+                    face_blur_strength=face_blur_strength,
+                    plate_blur_strength=plate_blur_strength,
+                    output_name=f"{Path(filename).stem}_{uuid.uuid4().hex[:8]}",
+                    wait_for_write=True,  # the parent process reads the file
+                    results=raw_results
+                )
+                
+                if not blur_result.success:
+                    print(f"Warning: Blur failed for {filename}: {blur_result.message}")
+                    blur_result = None
+            
+            # Convert to the format expected by frontend
+            detection_data = {
+                "success": detection_result.success,
+                "message": detection_result.message,
+                "detections": detection_result.detections,
+                "total_faces": detection_result.total_faces,
+                "total_license_plates": detection_result.total_license_plates,
+                "processing_time_ms": detection_result.processing_time_ms
+            }
+            
+            if blur_result:
+                blur_data = {
+                    "success": blur_result.success,
+                    "message": blur_result.message,
+                    "blurred_image_path": blur_result.blurred_image_path,
+                    "detections_applied": blur_result.detections_applied,
+                    "processing_time_ms": blur_result.processing_time_ms
+                }
+            
+            total_processing_time = detection_result.processing_time_ms
+            if blur_data:
+                total_processing_time += blur_data['processing_time_ms']
+            
+            results[i] = {
+                'success': True,
+                'filename': filename,
+                'detection': detection_data,
+                'blur': blur_data,
+                'processing_time': total_processing_time
+            }
+                    
+        except Exception as e:
+            results[i] = {
+                'success': False,
+                'filename': filename,
+                'error': str(e),
+                'processing_time': 0
+            }
+    
+    return results
+
+def _image_data(file_data: Dict[str, Any], options: Dict[str, Any]) -> Dict[str, Any]:
+    """Worker task entry: the encoded bytes (or presigned URLs) plus the processing options"""
+    return {
+        'file_content': file_data.get('content'),
+        'get_url': file_data.get('get_url'),
+        'put_url': file_data.get('put_url'),
+        'filename': file_data['filename'],
+        'detect_face': options.get('detect_face', True),
+        'detect_license_plate': options.get('detect_license_plate', True),
+        'enable_blur': options.get('enable_blur', False),
+        'face_blur_strength': options.get('face_blur_strength', 25),
+        'plate_blur_strength': options.get('plate_blur_strength', 20),
+        'return_bytes': options.get('return_bytes', False)
+    }
+
+def _init_worker():
+    """Load the models in the child process (ORT sessions are not fork-safe)"""
+    global _worker_service
+    from api import _get_detector
+    _get_detector()
+    _worker_service = DetectionService()
+
+def _process_in_worker(batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Pool entry point; each entry carries raw encoded bytes, not an ndarray"""
+    return _process_batch(_worker_service, batch)
 
 class ParallelProcessor:
     def __init__(self, max_workers: int = 4):
@@ -19,113 +237,41 @@ class ParallelProcessor:
             max_workers: Maximum number of concurrent workers
         """
         self.max_workers = max_workers
-        self.detection_service = None
+        self.pool = None
         self._initialize_components()
     
     def _initialize_components(self):
         """Initialize detection components"""
         try:
             print("🚀 Initializing Parallel Processing Components")
-            self.detection_service = DetectionService()
-            print("✅ Parallel processing components ready")
+            # spawn: children start clean and build their own models in _init_worker
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker
+            )
+            atexit.register(self.pool.shutdown, wait=False)
+            print(f"✅ Parallel processing components ready ({self.max_workers} worker processes)")
         except Exception as e:
             print(f"❌ Error initializing parallel components: {e}")
             raise
     
-    def _process_single_image(self, image_data: Dict[str, Any]) -> Dict[str, Any]:
+    def batch_size(self, total: int) -> int:
+        """Images per task: one batch per worker, capped at BATCH_SIZE images per forward pass"""
+        return min(BATCH_SIZE, max(1, -(-total // self.max_workers)))
+    
+    def submit_batch(self, files: List[Dict[str, Any]], **options) -> Future:
         """
-        Process a single image using the same APIs as sequential processing
+        Queue one batch on a worker without waiting for it
         
         Args:
-            image_data: Dictionary containing image file and processing options
+            files: File data dictionaries ('content', 'filename'), at most BATCH_SIZE
+            **options: process_images_parallel() keyword options
             
         Returns:
-            Dictionary with processing results
+            Future with one result dictionary per file, in input order
         """
-        try:
-            file_content = image_data['file_content']
-            filename = image_data['filename']
-            detect_face = image_data['detect_face']
-            detect_license_plate = image_data['detect_license_plate']
-            enable_blur = image_data.get('enable_blur', False)
-            face_blur_strength = image_data.get('face_blur_strength', 25)
-            plate_blur_strength = image_data.get('plate_blur_strength', 20)
-            
-            # Save uploaded file temporarily
-            with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp_file:
-                temp_input = tmp_file.name
-                tmp_file.write(file_content)
-            
-            try:
-                # Use detection service for detection (same as sequential)
-                detection_result = self.detection_service.detect_objects_in_image(
-                    image_path=temp_input,
-                    detect_face=detect_face,
-                    detect_license_plate=detect_license_plate
-                )
-                
-                if not detection_result.success:
-                    raise ValueError(f"Detection failed: {detection_result.message}")
-                
-                # Use detection service for blur (same as sequential)
-                blur_result = None
-                if enable_blur:
-                    blur_result = self.detection_service.blur_objects_in_image(
-                        image_path=temp_input,
-                        detect_face=detect_face,
-                        detect_license_plate=detect_license_plate,
-                        face_blur_strength=face_blur_strength,
-                        plate_blur_strength=plate_blur_strength
-                    )
-                    
-                    if not blur_result.success:
-                        print(f"Warning: Blur failed for {filename}: {blur_result.message}")
-                        blur_result = None
-                
-                # Convert to the format expected by frontend
-                detection_data = {
-                    "success": detection_result.success,
-                    "message": detection_result.message,
-                    "detections": detection_result.detections,
-                    "total_faces": detection_result.total_faces,
-                    "total_license_plates": detection_result.total_license_plates,
-                    "processing_time_ms": detection_result.processing_time_ms
-                }
-                
-                blur_data = None
-                if blur_result:
-                    blur_data = {
-                        "success": blur_result.success,
-                        "message": blur_result.message,
-                        "blurred_image_path": blur_result.blurred_image_path,
-                        "detections_applied": blur_result.detections_applied,
-                        "processing_time_ms": blur_result.processing_time_ms
-                    }
-                
-                total_processing_time = detection_result.processing_time_ms
-                if blur_result:
-                    total_processing_time += blur_result.processing_time_ms
-                
-                return {
-                    'success': True,
-                    'filename': filename,
-                    'detection': detection_data,
-                    'blur': blur_data,
-                    'processing_time': total_processing_time
-                }
-                
-            finally:
-                # Clean up temporary file
-                if os.path.exists(temp_input):
-                    os.remove(temp_input)
-                    
-        except Exception as e:
-            return {
-                'success': False,
-                'filename': filename,
-                'error': str(e),
-                'processing_time': 0
-            }
+        return self.pool.submit(_process_in_worker, [_image_data(file_data, options) for file_data in files])
     
     def process_images_parallel(self, 
                               files: List[Dict[str, Any]], 
@@ -133,7 +279,8 @@ class ParallelProcessor:
                               detect_license_plate: bool = True,
                               enable_blur: bool = False,
                               face_blur_strength: int = 25,
-                              plate_blur_strength: int = 20) -> Dict[str, Any]:
+                              plate_blur_strength: int = 20,
+                              return_bytes: bool = False) -> Dict[str, Any]:
         """
         Process multiple images in parallel using the same APIs as sequential processing
         
@@ -144,6 +291,7 @@ class ParallelProcessor:
             enable_blur: Whether to apply blur
             face_blur_strength: Blur strength for faces
             plate_blur_strength: Blur strength for license plates
+            return_bytes: Return blurred JPEGs as result['blur']['blurred_bytes'] instead of writing files
             
         Returns:
             Dictionary with processing results
@@ -151,40 +299,47 @@ class ParallelProcessor:
         start_time = time.time()
         
         # Prepare image data for parallel processing
-        image_data_list = []
-        for file_data in files:
-            image_data = {
-                'file_content': file_data['content'],
-                'filename': file_data['filename'],
-                'detect_face': detect_face,
-                'detect_license_plate': detect_license_plate,
-                'enable_blur': enable_blur,
-                'face_blur_strength': face_blur_strength,
-                'plate_blur_strength': plate_blur_strength
-            }
-            image_data_list.append(image_data)
+        options = dict(detect_face=detect_face, detect_license_plate=detect_license_plate,
+                       enable_blur=enable_blur, face_blur_strength=face_blur_strength,
+                       plate_blur_strength=plate_blur_strength, return_bytes=return_bytes)
+        image_data_list = [_image_data(file_data, options) for file_data in files]
         
-        # Process images in parallel using ThreadPoolExecutor
-        results = []
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            # Submit all tasks and wait for completion
-            future_to_data = {
-                executor.submit(self._process_single_image, image_data): image_data 
-                for image_data in image_data_list
-            }
-            
-            for future in future_to_data:
+        # Split into one batch per worker (capped at BATCH_SIZE images per forward pass)
+        size = self.batch_size(len(image_data_list))
+        batches = [image_data_list[i:i + size] for i in range(0, len(image_data_list), size)]
+        
+        # Process batches in parallel on the worker processes
+        future_to_index = {
+            self.pool.submit(_process_in_worker, batch): i 
+            for i, batch in enumerate(batches)
+        }
+        batch_results = [None] * len(batches)
+        
+        def failed(batch, error):
+            return [{
+                'success': False,
+                'filename': image_data['filename'],
+                'error': error,
+                'processing_time': 0
+            } for image_data in batch]
+        
+        # Take batches as they finish; 5 minutes per image in the busiest worker's queue, for the whole call
+        budget = 300 * size * -(-len(batches) // self.max_workers)
+        try:
+            for future in as_completed(future_to_index, timeout=budget):
+                i = future_to_index[future]
                 try:
-                    result = future.result(timeout=300)  # 5 minute timeout per image
-                    results.append(result)
+                    batch_results[i] = future.result()
                 except Exception as e:
-                    image_data = future_to_data[future]
-                    results.append({
-                        'success': False,
-                        'filename': image_data['filename'],
-                        'error': str(e),
-                        'processing_time': 0
-                    })
+                    batch_results[i] = failed(batches[i], str(e))
+        except TimeoutError:
+            for future, i in future_to_index.items():
+                if batch_results[i] is None:
+                    future.cancel()
+                    batch_results[i] = failed(batches[i], "Timed out")
+        
+        # Back in upload order
+        results = [result for batch in batch_results for result in batch]
         
         # Process results
         successful_results = []
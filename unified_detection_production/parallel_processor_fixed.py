@@ -4,10 +4,13 @@ Uses the same detection and blur APIs as sequential processing
 """
 
 import time
-from concurrent.futures import ThreadPoolExecutor
+import atexit
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
 from typing import List, Dict, Any
-import tempfile
-import os
+import uuid
+import cv2
+import numpy as np
+from pathlib import Path
 from detection_service import DetectionService
 
 class ParallelProcessor:
@@ -20,6 +23,7 @@ class ParallelProcessor:
         """
         self.max_workers = max_workers
         self.detection_service = None
+        self._executor = None
         self._initialize_components()
     
     def _initialize_components(self):
@@ -27,6 +31,9 @@ class ParallelProcessor:
         try:
             print("🚀 Initializing Parallel Processing Components")
             self.detection_service = DetectionService()
+            # One bounded pool for the processor's lifetime, not one per batch
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="det")
+            atexit.register(self._executor.shutdown)
             print("✅ Parallel processing components ready")
         except Exception as e:
             print(f"❌ Error initializing parallel components: {e}")
@@ -51,74 +58,69 @@ class ParallelProcessor:
             face_blur_strength = image_data.get('face_blur_strength', 25)
             plate_blur_strength = image_data.get('plate_blur_strength', 20)
             
-            # Save uploaded file temporarily
-            with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp_file:
-                temp_input = tmp_file.name
-                tmp_file.write(file_content)
+            # Decode in memory once; detection and blur both work on the array
+            image = cv2.imdecode(np.frombuffer(file_content, np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                raise ValueError("Invalid image file")
             
-            try:
-                # Use detection service for detection (same as sequential)
+            # Detection and blur share one detection pass
+            blur_result = None
+            if enable_blur:
+                detection_result, blur_result = self.detection_service.detect_then_blur(
+                    image_path=image,
+                    detect_face=detect_face,
+                    detect_license_plate=detect_license_plate,
+                    face_blur_strength=face_blur_strength,
+                    plate_blur_strength=plate_blur_strength,
+                    output_name=f"{Path(filename).stem}_{uuid.uuid4().hex[:8]}"
+                )
+            else:
                 detection_result = self.detection_service.detect_objects_in_image(
-                    image_path=temp_input,
+                    image_path=image,
                     detect_face=detect_face,
                     detect_license_plate=detect_license_plate
                 )
-                
-                if not detection_result.success:
-                    raise ValueError(f"Detection failed: {detection_result.message}")
-                
-                # Use detection service for blur (same as sequential)
-                blur_result = None
-                if enable_blur:
-                    blur_result = self.detection_service.blur_objects_in_image(
-                        image_path=temp_input,
-                        detect_face=detect_face,
-                        detect_license_plate=detect_license_plate,
-                        face_blur_strength=face_blur_strength,
-                        plate_blur_strength=plate_blur_strength
-                    )
-                    
-                    if not blur_result.success:
-                        print(f"Warning: Blur failed for {filename}: {blur_result.message}")
-                        blur_result = None
-                
-                # Convert to the format expected by frontend
-                detection_data = {
-                    "success": detection_result.success,
-                    "message": detection_result.message,
-                    "detections": detection_result.detections,
-                    "total_faces": detection_result.total_faces,
-                    "total_license_plates": detection_result.total_license_plates,
-                    "processing_time_ms": detection_result.processing_time_ms
-                }
-                
-                blur_data = None
-                if blur_result:
-                    blur_data = {
-                        "success": blur_result.success,
-                        "message": blur_result.message,
-                        "blurred_image_path": blur_result.blurred_image_path,
-                        "detections_applied": blur_result.detections_applied,
-                        "processing_time_ms": blur_result.processing_time_ms
-                    }
-                
-                total_processing_time = detection_result.processing_time_ms
-                if blur_result:
-                    total_processing_time += blur_result.processing_time_ms
-                
-                return {
-                    'success': True,
-                    'filename': filename,
-                    'detection': detection_data,
-                    'blur': blur_data,
-                    'processing_time': total_processing_time
+            
+            if not detection_result.success:
+                raise ValueError(f"Detection failed: {detection_result.message}")
+            
+            if blur_result is not None:
+                if not blur_result.success:
+                    print(f"Warning: Blur failed for {filename}: {blur_result.message}")
+                    blur_result = None
+            
+            # Convert to the format expected by frontend
+            detection_data = {
+                "success": detection_result.success,
+                "message": detection_result.message,
+                "detections": detection_result.detections,
+                "total_faces": detection_result.total_faces,
+                "total_license_plates": detection_result.total_license_plates,
+                "processing_time_ms": detection_result.processing_time_ms
+            }
+            
+            blur_data = None
+            if blur_result:
+                blur_data = {
+                    "success": blur_result.success,
+                    "message": blur_result.message,
+                    "blurred_image_path": blur_result.blurred_image_path,
+                    "detections_applied": blur_result.detections_applied,
+                    "processing_time_ms": blur_result.processing_time_ms
                 }
-                
-            finally:
-                # Clean up temporary file
-                if os.path.exists(temp_input):
-                    os.remove(temp_input)
-                    
+            
+            total_processing_time = detection_result.processing_time_ms
+            if blur_result:
+                total_processing_time += blur_result.processing_time_ms
+            
+            return {
+                'success': True,
+                'filename': filename,
+                'detection': detection_data,
+                'blur': blur_data,
+                'processing_time': total_processing_time
+            }
+
         except Exception as e:
             return {
                 'success': False,
@@ -164,27 +166,35 @@ class ParallelProcessor:
             }
             image_data_list.append(image_data)
         
-        # Process images in parallel using ThreadPoolExecutor
-        results = []
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            # Submit all tasks and wait for completion
-            future_to_data = {
-                executor.submit(self._process_single_image, image_data): image_data 
-                for image_data in image_data_list
+        # Process images in parallel on the shared executor
+        future_to_index = {
+            self._executor.submit(self._process_single_image, image_data): i 
+            for i, image_data in enumerate(image_data_list)
+        }
+        results = [None] * len(image_data_list)
+        
+        def failed(image_data, error):
+            return {
+                'success': False,
+                'filename': image_data['filename'],
+                'error': error,
+                'processing_time': 0
             }
-            
-            for future in future_to_data:
+        
+        # Take results as they finish; 5 minutes per image in the busiest worker's queue, for the whole call
+        budget = 300 * -(-len(image_data_list) // self.max_workers)
+        try:
+            for future in as_completed(future_to_index, timeout=budget):
+                i = future_to_index[future]
                 try:
-                    result = future.result(timeout=300)  # 5 minute timeout per image
-                    results.append(result)
+                    results[i] = future.result()
                 except Exception as e:
-                    image_data = future_to_data[future]
-                    results.append({
-                        'success': False,
-                        'filename': image_data['filename'],
-                        'error': str(e),
-                        'processing_time': 0
-                    })
+                    results[i] = failed(image_data_list[i], str(e))
+        except TimeoutError:
+            for future, i in future_to_index.items():
+                if results[i] is None:
+                    future.cancel()
+                    results[i] = failed(image_data_list[i], "Timed out")
         
         # Process results
         successful_results = []
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+INT8 Model Quantization
+Static ONNX Runtime quantization of SCRFD (buffalo_l det_10g) and the YOLO
+person model, calibrated on a folder of representative images.
+Enable the results at runtime with IDEN_HIDE_QUANT=int8.
+"""
+
+import os
+import glob
+import shutil
+import argparse
+import cv2
+import numpy as np
+import onnxruntime
+from onnxruntime.quantization import (
+    CalibrationDataReader, QuantFormat, QuantType, quantize_static
+)
+
+from detect_face_v2 import letterbox
+
+def _list_images(folder, limit):
+    paths = []
+    for ext in ("*.jpg", "*.jpeg", "*.png", "*.bmp"):
+        paths.extend(glob.glob(os.path.join(folder, ext)))
+    return sorted(paths)[:limit]
+
+class ImageCalibrationReader(CalibrationDataReader):
+    """Feeds letterboxed, model-normalized images one at a time"""
+
+    def __init__(self, model_path, image_paths, size, preprocess):
+        sess = onnxruntime.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+        self.input_name = sess.get_inputs()[0].name
+        self.image_paths = image_paths
+        self.size = size
+        self.preprocess = preprocess
+        self._iter = iter(image_paths)
+
+    def get_next(self):
+        for path in self._iter:
+            img = cv2.imread(path)
+            if img is None:
+                continue
+            canvas = letterbox(img, self.size)[0]
+            return {self.input_name: self.preprocess(canvas)[None]}
+        return None
+
+    def rewind(self):
+        self._iter = iter(self.image_paths)
+
+def scrfd_preprocess(canvas):
+    """Same normalization as insightface SCRFD: RGB, (x - 127.5) / 128"""
+    return ((canvas[..., ::-1].transpose(2, 0, 1).astype(np.float32) - 127.5) / 128.0)
+
+def yolo_preprocess(canvas):
+    """Ultralytics input: RGB, x / 255"""
+    return canvas[..., ::-1].transpose(2, 0, 1).astype(np.float32) / 255.0
+
+def quantize(model_in, model_out, reader):
+    """INT8 QDQ with per-channel weights (u8 activations / s8 weights map to VNNI)"""
+    print(f"🔧 Quantizing {model_in} -> {model_out}")
+    quantize_static(
+        model_in, model_out, reader,
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True
+    )
+    print(f"✅ Wrote {model_out}")
+
+def quantize_scrfd(image_paths, face_size, pack="buffalo_l"):
+    """det_10g.onnx -> ~/.insightface/models/<pack>_int8/det_10g.onnx"""
+    root = os.path.join(os.path.expanduser("~/.insightface"), "models")
+    src = os.path.join(root, pack, "det_10g.onnx")
+    if not os.path.exists(src):
+        # let insightface download the pack first
+        from insightface.app import FaceAnalysis
+        FaceAnalysis(name=pack, allowed_modules=['detection'])
+    out_dir = os.path.join(root, f"{pack}_int8")
+    os.makedirs(out_dir, exist_ok=True)
+    dst = os.path.join(out_dir, "det_10g.onnx")
+    quantize(src, dst, ImageCalibrationReader(src, image_paths, face_size, scrfd_preprocess))
+    return dst
+
+def quantize_yolo(weights, image_paths, imgsz):
+    """<stem>.pt -> <stem>.onnx (FP32 export) -> <stem>_int8.onnx"""
+    from ultralytics import YOLO
+    stem = os.path.splitext(weights)[0]
+    fp32 = YOLO(weights).export(format="onnx", imgsz=imgsz, dynamic=True)
+    if os.path.abspath(fp32) != os.path.abspath(stem + ".onnx"):
+        shutil.move(fp32, stem + ".onnx")
+    dst = stem + "_int8.onnx"
+    quantize(stem + ".onnx", dst, ImageCalibrationReader(stem + ".onnx", image_paths, imgsz, yolo_preprocess))
+    return dst
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Static INT8 quantization of SCRFD and YOLO")
+    ap.add_argument("--images", required=True, help="folder of representative calibration images")
+    ap.add_argument("--num", type=int, default=100, help="number of calibration images")
+    ap.add_argument("--fsize", type=int, default=1280, help="SCRFD canvas (square)")
+    ap.add_argument("--yolo", default="yolo11s.pt", help="YOLO person weights (the ones detect_face_v2_wrapper loads)")
+    ap.add_argument("--imgsz", type=int, default=960, help="YOLO inference size")
+    ap.add_argument("--skip_scrfd", action="store_true")
+    ap.add_argument("--skip_yolo", action="store_true")
+    a = ap.parse_args()
+
+    paths = _list_images(a.images, a.num)
+    if not paths:
+        raise SystemExit(f"No images found in {a.images}")
+    print(f"📸 Calibrating on {len(paths)} images")
+
+    if not a.skip_scrfd:
+        quantize_scrfd(paths, a.fsize)
+    if not a.skip_yolo:
+        quantize_yolo(a.yolo, paths, a.imgsz)
+    print("💡 Re-check face_det_thresh on a validation set: INT8 scores shift by ~1-2%")
@@ -5,9 +5,13 @@ Quick Start Script for Unified Detection Production System
 
 import os
 import sys
+import socket
+import threading
+import importlib.util
 import subprocess
 import time
 import requests
+from http_session import SESSION
 from pathlib import Path
 
 def print_banner():
@@ -35,23 +39,15 @@ def check_dependencies():
         'fastapi', 'uvicorn', 'requests'
     ]
     
-    missing_packages = []
-    for package in required_packages:
-        try:
-            if package == 'cv2':
-                import cv2
-            else:
-                __import__(package)
-            print(f"✅ {package} - OK")
-        except ImportError:
-            print(f"❌ {package} - Missing")
-            missing_packages.append(package)
+    # find_spec locates a package without executing it
+    missing_packages = [p for p in required_packages if importlib.util.find_spec(p) is None]
     
     if missing_packages:
         print(f"\n⚠️  Missing packages: {', '.join(missing_packages)}")
         print("💡 Install with: pip install -r requirements.txt")
         return False
     
+    print(f"✅ All {len(required_packages)} packages found")
     return True
 
 def check_models():
@@ -138,13 +134,19 @@ def start_server():
             sys.executable, "main.py"
         ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         
-        # Wait a bit for server to start
+        # Poll until the port accepts connections (or the server exits)
         print("   Waiting for server to start...")
-        time.sleep(5)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline and process.poll() is None:
+            try:
+                with socket.create_connection(("localhost", 8000), timeout=0.25):
+                    break
+            except OSError:
+                time.sleep(0.05)
         
         # Check if server is running
         try:
-            response = requests.get("http://localhost:8000/health", timeout=5)
+            response = SESSION.get("http://localhost:8000/health", timeout=5)
             if response.status_code == 200:
                 print("✅ Server started successfully on http://localhost:8000")
                 return process
@@ -235,6 +237,10 @@ def main():
         print("   pip install -r requirements.txt")
         sys.exit(1)
     
+    # Load the models in the background while the remaining checks run
+    from api import prewarm
+    prewarm()
+    
     if not check_models():
         print("\n⚠️  Some models are missing but will be downloaded automatically")
     
@@ -253,13 +259,18 @@ def main():
         print("\n❌ Failed to start server")
         sys.exit(1)
     
-    # Run API tests
-    if not run_api_tests():
-        print("\n⚠️  API tests failed, but server is running")
+    # Run API tests while the next steps are shown
+    api_tests = {}
+    tests_thread = threading.Thread(target=lambda: api_tests.update(ok=run_api_tests()), daemon=True)
+    tests_thread.start()
     
     # Show next steps
     show_next_steps()
     
+    tests_thread.join()
+    if not api_tests.get('ok'):
+        print("\n⚠️  API tests failed, but server is running")
+    
     print("\n🎯 Server is running! Press Ctrl+C to stop.")
     try:
         server_process.wait()
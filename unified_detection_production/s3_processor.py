@@ -3,20 +3,172 @@ S3 Image Processor
 Processes images from S3, applies detection and blur, uploads results back to S3
 """
 
+import io
 import os
-import boto3
-from boto3.session import Config
-import tempfile
+import weakref
+import hashlib
+import logging
+import time
+import atexit
+import queue
+import random
+import threading
 import json
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, NamedTuple, Optional, TYPE_CHECKING
 from botocore.exceptions import ClientError, NoCredentialsError
-import cv2
-import numpy as np
-from datetime import datetime
+from collections import OrderedDict, deque
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from unified_detector import UnifiedDetector
-from visualizer import DetectionVisualizer
+if TYPE_CHECKING:
+    import numpy as np
+
+log = logging.getLogger(__name__)
+
+# Keys with these extensions (lower-case, no dot) are treated as images
+IMAGE_EXTENSIONS = frozenset({'jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp'})
+
+# Concurrent S3 transfers per direction (requests are RTT-bound, not CPU-bound)
+S3_IO_WORKERS = int(os.getenv("S3_IO_WORKERS", 32))
+
+# Process-wide transfer pools: in-flight S3 requests stay bounded across concurrent folder jobs
+S3_DOWNLOAD_POOL = ThreadPoolExecutor(max_workers=S3_IO_WORKERS, thread_name_prefix="s3-get")
+S3_UPLOAD_POOL = ThreadPoolExecutor(max_workers=S3_IO_WORKERS, thread_name_prefix="s3-put")
+atexit.register(S3_DOWNLOAD_POOL.shutdown)
+atexit.register(S3_UPLOAD_POOL.shutdown)
+
+# Folder pipeline: download+decode -> batched detect -> blur+encode+upload.
+# S3_WORKERS threads run the last stage; decoded images waiting for the
+# detector are capped at S3_PIPELINE_DEPTH, taken S3_DETECT_BATCH at a time
+S3_WORKERS = int(os.getenv("S3_WORKERS", 16))
+S3_FOLDER_POOL = ThreadPoolExecutor(max_workers=S3_WORKERS, thread_name_prefix="s3-image")
+atexit.register(S3_FOLDER_POOL.shutdown)
+S3_PIPELINE_DEPTH = 32
+S3_DETECT_BATCH = 8
+
+# Connections per client: both transfer pools plus the ranged-GET pool (botocore's default is 10)
+S3_MAX_CONNECTIONS = 2 * S3_IO_WORKERS + 16
+
+# Blurred outputs are re-encoded as optimized progressive JPEG at this quality
+S3_JPEG_QUALITY = int(os.getenv("S3_JPEG_QUALITY", 85))
+
+# Input folder listings are reused for this many seconds
+S3_LISTING_TTL = 60.0
+
+# With S3_PRESIGNED=1 the parallel workers GET/PUT image bytes through presigned
+# URLs (valid S3_PRESIGN_TTL seconds) instead of through this process
+S3_PRESIGNED = os.getenv("S3_PRESIGNED", "").strip().lower() in ("1", "true", "yes")
+S3_PRESIGN_TTL = int(os.getenv("S3_PRESIGN_TTL", 3600))
+
+# Large objects are fetched as parallel byte-range GETs of this size
+S3_PART_SIZE = 8 * 1024 * 1024
+_RANGE_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix="s3-range")
+atexit.register(_RANGE_POOL.shutdown)
+
+
+class DetectParams(NamedTuple):
+    """Detection/blur options, in the positional order process_single_image/process_s3_folder take them"""
+    detect_face: bool = True
+    detect_license_plate: bool = True
+    face_blur_strength: int = 25
+    plate_blur_strength: int = 20
+    
+    @classmethod
+    def from_request(cls, request) -> 'DetectParams':
+        """Read the options off an S3 request model once"""
+        return cls(request.detect_face, request.detect_license_plate,
+                   request.face_blur_strength, request.plate_blur_strength)
+
+
+# One boto3 Session per credential set and one client per (credentials, region); clients are
+# thread-safe and keep their connection pool and TLS sessions warm across processors and requests.
+# Entries live while something uses them; the S3_MAX_CLIENTS most recently requested are pinned,
+# so rotating credentials do not accumulate sessions and connection pools
+S3_MAX_CLIENTS = 16
+_SESSIONS = weakref.WeakValueDictionary()
+_CLIENTS = weakref.WeakValueDictionary()
+_RECENT_CLIENTS = OrderedDict()  # (credentials, region) -> (session, client)
+_CLIENTS_LOCK = threading.Lock()
+
+@atexit.register
+def _close_clients():
+    for client in list(_CLIENTS.values()):
+        client.close()
+
+def credentials_key(aws_access_key_id: str, aws_secret_access_key: str, aws_session_token: Optional[str] = None) -> tuple:
+    """Cache key for a credential set (no raw secret in the key)"""
+    return (aws_access_key_id, hashlib.sha256(aws_secret_access_key.encode()).hexdigest(), aws_session_token)
+
+def get_s3_client(aws_access_key_id: str, aws_secret_access_key: str, aws_session_token: Optional[str] = None,
+                  region_name: str = 'us-east-1'):
+    """Cached S3 client for the credentials (session and botocore model loading happen once)"""
+    cred_key = credentials_key(aws_access_key_id, aws_secret_access_key, aws_session_token)
+    key = (cred_key, region_name)
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            import boto3
+            from boto3.session import Config
+            session = _SESSIONS.get(cred_key)
+            if session is None:
+                session = _SESSIONS[cred_key] = boto3.Session(
+                    aws_access_key_id=aws_access_key_id,
+                    aws_secret_access_key=aws_secret_access_key,
+                    aws_session_token=aws_session_token or None
+                )
+            client = _CLIENTS[key] = session.client('s3', region_name=region_name, config=Config(
+                s3={'addressing_style': 'virtual'},
+                max_pool_connections=S3_MAX_CONNECTIONS,
+                retries={'mode': 'adaptive', 'max_attempts': 5},
+                tcp_keepalive=True
+            ))
+            _RECENT_CLIENTS[key] = (session, client)
+        else:
+            _RECENT_CLIENTS[key] = (_SESSIONS.get(cred_key), client)
+        _RECENT_CLIENTS.move_to_end(key)
+        if len(_RECENT_CLIENTS) > S3_MAX_CLIENTS:
+            _RECENT_CLIENTS.popitem(last=False)
+    return client
+
+
+@lru_cache(maxsize=1024)
+def _split_s3_path(s3_path: str) -> tuple:
+    """'s3://bucket/key' -> (bucket, key); pure, so memoized"""
+    if not s3_path.startswith('s3://'):
+        raise ValueError("S3 path must start with 's3://'")
+    parts = s3_path[5:].split('/', 1)
+    if len(parts) != 2:
+        raise ValueError("Invalid S3 path format. Use: s3://bucket-name/path/to/file")
+    return tuple(parts)
+
+
+# Download buffers for decode-and-discard reads; they only grow, so after
+# warm-up downloads stop allocating (LIFO hands back the most recently used)
+_BUFFER_POOL = queue.LifoQueue(maxsize=S3_IO_WORKERS)
+
+def _acquire_buffer() -> bytearray:
+    try:
+        return _BUFFER_POOL.get_nowait()
+    except queue.Empty:
+        return bytearray()
+
+def _release_buffer(buf: bytearray):
+    try:
+        _BUFFER_POOL.put_nowait(buf)
+    except queue.Full:
+        pass
+
+
+def _read_into(body, view: memoryview):
+    """Fill view from a streaming body in 1 MB reads (no whole-body bytes object)"""
+    offset = 0
+    while offset < len(view):
+        chunk = body.read(min(1 << 20, len(view) - offset))
+        if not chunk:
+            raise Exception(f"S3 body ended after {offset} of {len(view)} bytes")
+        view[offset:offset + len(chunk)] = chunk
+        offset += len(chunk)
 
 
 class S3ImageProcessor:
@@ -37,37 +189,33 @@ class S3ImageProcessor:
         
         # Initialize S3 client
         self.s3_client = self._create_s3_client()
+        from boto3.s3.transfer import TransferConfig
+        self._transfer_cfg = TransferConfig(multipart_threshold=S3_PART_SIZE, multipart_chunksize=S3_PART_SIZE,
+                                            max_concurrency=8, use_threads=True)
+        self._listing_cache = {}  # s3 folder path -> (monotonic time, {image s3 path: ETag})
+        self._listing_lock = threading.Lock()
         
-        # Initialize detection system
-        self.detector = UnifiedDetector()
-        self.visualizer = DetectionVisualizer()
+        # Process-wide detection system shared with the API (imported here: pulls in cv2/torch)
+        from api import _get_detector, _get_visualizer, _INFER_LOCK
+        self.detector = _get_detector()
+        self.visualizer = _get_visualizer()
+        self._detect_lock = _INFER_LOCK  # models are not reentrant; blur/IO stay concurrent
         
         print("✅ S3 Image Processor initialized")
     
     def _create_s3_client(self):
-        """Create S3 client with credentials"""
+        """Shared S3 client for these credentials; no request is made here,
+        bad credentials surface on the first real call (or validate())"""
+        return get_s3_client(self.aws_access_key_id, self.aws_secret_access_key, self.aws_session_token)
+    
+    def validate(self, bucket_name: str):
+        """Check the credentials can reach a bucket (one HEAD request)"""
         try:
-            session_kwargs = {
-                'aws_access_key_id': self.aws_access_key_id,
-                'aws_secret_access_key': self.aws_secret_access_key,
-                'region_name': 'us-east-1'  # Default region
-            }
-            
-            if self.aws_session_token:
-                session_kwargs['aws_session_token'] = self.aws_session_token
-            
-            session = boto3.Session(**session_kwargs)
-            s3_client = session.client('s3', config=Config(s3={'addressing_style': 'virtual'}))
-            
-            # Test connection
-            s3_client.list_buckets()
-            print("✅ S3 connection established")
-            return s3_client
-            
+            self.s3_client.head_bucket(Bucket=bucket_name)
         except NoCredentialsError:
             raise Exception("AWS credentials not found or invalid")
         except ClientError as e:
-            raise Exception(f"Failed to create S3 client: {str(e)}")
+            raise Exception(f"Cannot access bucket {bucket_name}: {str(e)}")
     
     def _parse_s3_path(self, s3_path: str) -> tuple:
         """
@@ -79,94 +227,115 @@ class S3ImageProcessor:
         Returns:
             tuple: (bucket_name, key)
         """
-        if not s3_path.startswith('s3://'):
-            raise ValueError("S3 path must start with 's3://'")
+        return _split_s3_path(s3_path)
+    
+    def _get_range(self, bucket_name: str, key: str, start: int, end: int) -> dict:
+        return self.s3_client.get_object(Bucket=bucket_name, Key=key, Range=f"bytes={start}-{end}")
+    
+    def _get_object_bytes(self, bucket_name: str, key: str, buf: Optional[bytearray] = None,
+                          size: Optional[int] = None):
+        """
+        Read an S3 object body into one buffer (parallel ranged GETs above S3_PART_SIZE)
         
-        # Remove 's3://' prefix
-        path_without_prefix = s3_path[5:]
+        Without buf a new bytearray is returned; with buf (grown as needed) a
+        memoryview of its first object-size bytes, to be released by the caller.
+        A size known from the listing lets large objects fetch every part at once
+        instead of learning the size from the first part.
+        """
+        if size is not None and size > S3_PART_SIZE:
+            first, length, total = None, 0, size
+        else:
+            try:
+                first = self._get_range(bucket_name, key, 0, S3_PART_SIZE - 1)
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') == 'InvalidRange':  # empty object
+                    return bytearray() if buf is None else memoryview(buf)[:0]
+                raise
+            length = first['ContentLength']
+            total = int(first.get('ContentRange', '').rpartition('/')[2] or length)
+        if buf is None:
+            buf = result = bytearray(total)
+        else:
+            if len(buf) < total:
+                buf.extend(bytes(total - len(buf)))
+            result = memoryview(buf)[:total]
+        view = memoryview(buf)
+        if first is not None:
+            _read_into(first['Body'], view[:length])
         
-        # Split into bucket and key
-        parts = path_without_prefix.split('/', 1)
-        if len(parts) != 2:
-            raise ValueError("Invalid S3 path format. Use: s3://bucket-name/path/to/file")
+        def fetch(start):
+            end = min(start + S3_PART_SIZE, total) - 1
+            _read_into(self._get_range(bucket_name, key, start, end)['Body'], view[start:end + 1])
         
-        bucket_name, key = parts
-        return bucket_name, key
+        if total > length:
+            list(_RANGE_POOL.map(fetch, range(length, total, S3_PART_SIZE)))
+        view.release()
+        return result
     
     def _download_image_from_s3(self, s3_path: str) -> tuple:
         """
-        Download image from S3 to temporary file
+        Download image from S3 straight into memory
         
         Args:
             s3_path: S3 path to image
             
         Returns:
-            tuple: (local_file_path, original_filename)
+            tuple: (image as BGR numpy array, original_filename)
         """
         try:
             bucket_name, key = self._parse_s3_path(s3_path)
             
-            # Create temporary file
-            temp_file = tempfile.NamedTemporaryFile(suffix='.jpg', delete=False)
-            temp_path = temp_file.name
-            temp_file.close()
-            
-            # Download from S3
-            self.s3_client.download_file(bucket_name, key, temp_path)
+            import cv2
+            import numpy as np
+            # Fetch the object bytes into a pooled buffer and decode in memory (no temp file)
+            buf = _acquire_buffer()
+            body = self._get_object_bytes(bucket_name, key, buf)
+            size = len(body)
+            try:
+                image = cv2.imdecode(np.frombuffer(body, np.uint8), cv2.IMREAD_COLOR)
+            finally:
+                body.release()
+                _release_buffer(buf)
+            if image is None:
+                raise Exception(f"Failed to decode image: {s3_path}")
             
             # Get original filename
             original_filename = Path(key).name
             
-            print(f"📥 Downloaded: {s3_path} -> {temp_path}")
-            return temp_path, original_filename
+            log.debug("📥 Downloaded: %s (%d bytes)", s3_path, size)
+            return image, original_filename
             
         except ClientError as e:
             raise Exception(f"Failed to download from S3: {str(e)}")
     
-    def _upload_image_to_s3(self, local_path: str, s3_path: str) -> str:
+    def _upload_image_to_s3(self, image: 'np.ndarray', s3_path: str, metadata: Optional[Dict] = None) -> str:
         """
-        Upload image to S3
+        Encode image in memory and upload it to S3
         
         Args:
-            local_path: Local file path
+            image: BGR numpy array
             s3_path: S3 destination path
+            metadata: Optional x-amz-meta-* values stored with the object
             
         Returns:
             str: S3 URL of uploaded file
         """
+        import cv2
         try:
-            # Check if local file exists
-            if not os.path.exists(local_path):
-                raise Exception(f"Local file does not exist: {local_path}")
-            
-            # Check file size
-            file_size = os.path.getsize(local_path)
-            if file_size == 0:
-                raise Exception(f"Local file is empty: {local_path}")
+            ok, buf = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, S3_JPEG_QUALITY,
+                                                   cv2.IMWRITE_JPEG_OPTIMIZE, 1,
+                                                   cv2.IMWRITE_JPEG_PROGRESSIVE, 1])
+            if not ok:
+                raise Exception(f"Failed to encode image for: {s3_path}")
+            body = buf.data  # no tobytes() copy
             
             bucket_name, key = self._parse_s3_path(s3_path)
-            print(f"📤 Uploading: {local_path} ({file_size} bytes) -> s3://{bucket_name}/{key}")
-            
-            # Upload to S3 with extra parameters
-            self.s3_client.upload_file(
-                local_path, 
-                bucket_name, 
-                key,
-                ExtraArgs={
-                    'ContentType': 'image/jpeg',
-                    'ACL': 'private'  # Make sure file is accessible
-                }
-            )
-            
-            # Verify upload by checking if object exists
-            try:
-                self.s3_client.head_object(Bucket=bucket_name, Key=key)
-                print(f"✅ Upload verified: s3://{bucket_name}/{key}")
-            except ClientError as e:
-                print(f"⚠️ Upload verification failed: {e}")
             
+            # S3 is read-after-write consistent and the upload raises on failure,
+            # so no follow-up HEAD is needed
+            self._put_bytes(bucket_name, key, body, 'image/jpeg', metadata)
             s3_url = f"https://{bucket_name}.s3.amazonaws.com/{key}"
-            print(f"📤 Uploaded: {local_path} -> {s3_url}")
+            log.debug("📤 Uploaded: %d bytes -> %s", len(body), s3_url)
             return s3_url
             
         except ClientError as e:
@@ -176,6 +345,17 @@ class S3ImageProcessor:
         except Exception as e:
             raise Exception(f"Upload error: {str(e)}")
     
+    def _put_bytes(self, bucket_name: str, key: str, body, content_type: str, metadata: Optional[Dict] = None):
+        """PUT an in-memory body; at or above S3_PART_SIZE as a parallel multipart upload"""
+        extra = {'ContentType': content_type, 'ACL': 'private'}
+        if metadata:
+            extra['Metadata'] = metadata
+        if len(body) < S3_PART_SIZE:
+            self.s3_client.put_object(Bucket=bucket_name, Key=key, Body=body, **extra)
+        else:
+            self.s3_client.upload_fileobj(io.BytesIO(body), bucket_name, key,
+                                          ExtraArgs=extra, Config=self._transfer_cfg)
+    
     def _list_images_in_s3_folder(self, s3_folder_path: str) -> List[str]:
         """
         List all image files in S3 folder
@@ -186,44 +366,48 @@ class S3ImageProcessor:
         Returns:
             List[str]: List of S3 paths to image files
         """
+        return list(self._list_image_etags(s3_folder_path))
+    
+    def _list_image_etags(self, s3_folder_path: str, use_cache: bool = True) -> Dict[str, str]:
+        """{image s3 path: ETag} for a folder, reused for S3_LISTING_TTL seconds"""
+        now = time.monotonic()
+        if use_cache:
+            with self._listing_lock:
+                cached = self._listing_cache.get(s3_folder_path)
+            if cached and now - cached[0] < S3_LISTING_TTL:
+                return cached[1]
+        images = self._fetch_image_etags(s3_folder_path)
+        with self._listing_lock:
+            self._listing_cache[s3_folder_path] = (now, images)
+        return images
+    
+    def _iter_objects(self, bucket_name: str, prefix: str):
+        """Every object under a prefix (a single list_objects_v2 call stops at 1000 keys)"""
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix,
+                                       PaginationConfig={'PageSize': 1000}):
+            yield from page.get('Contents', ())
+    
+    def _fetch_image_etags(self, s3_folder_path: str) -> Dict[str, str]:
         try:
             bucket_name, prefix = self._parse_s3_path(s3_folder_path)
-            print(f"📁 Listing S3 folder: s3://{bucket_name}/{prefix}")
             
             # Ensure prefix ends with '/'
             if not prefix.endswith('/'):
                 prefix += '/'
             
-            # List objects in folder
-            response = self.s3_client.list_objects_v2(
-                Bucket=bucket_name,
-                Prefix=prefix
-            )
-            
-            print(f"📊 S3 response: {response.get('KeyCount', 0)} objects found")
-            
-            image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
-            image_paths = []
-            
-            if 'Contents' in response:
-                for obj in response['Contents']:
-                    key = obj['Key']
-                    file_ext = Path(key).suffix.lower()
-                    file_size = obj.get('Size', 0)
-                    
-                    print(f"📄 Found file: {key} ({file_size} bytes, ext: {file_ext})")
-                    
-                    if file_ext in image_extensions:
-                        s3_path = f"s3://{bucket_name}/{key}"
-                        image_paths.append(s3_path)
-                        print(f"✅ Added image: {s3_path}")
-                    else:
-                        print(f"⏭️ Skipped non-image: {key}")
-            else:
-                print(f"⚠️ No objects found in s3://{bucket_name}/{prefix}")
+            images = {}
+            skipped = 0
+            for obj in self._iter_objects(bucket_name, prefix):
+                key = obj['Key']
+                if key.rpartition('.')[2].lower() in IMAGE_EXTENSIONS:
+                    images[f"s3://{bucket_name}/{key}"] = obj['ETag']
+                else:
+                    skipped += 1
             
-            print(f"📁 Found {len(image_paths)} images in {s3_folder_path}")
-            return image_paths
+            log.info("📁 Listed %d images in %s (%d non-image objects skipped)",
+                     len(images), s3_folder_path, skipped)
+            return images
             
         except ClientError as e:
             error_code = e.response['Error']['Code']
@@ -232,13 +416,72 @@ class S3ImageProcessor:
         except Exception as e:
             raise Exception(f"Folder listing error: {str(e)}")
     
+    def list_s3_images(self, s3_folder_path: str) -> List[str]:
+        """List image files in an S3 folder"""
+        return self._list_images_in_s3_folder(s3_folder_path)
+    
+    def list_s3_images_detailed(self, s3_folder_path: str) -> Dict[str, Dict]:
+        """{image s3 path: {'etag', 'size', 'last_modified'}} straight from the listing (no HEADs)"""
+        bucket_name, prefix = self._parse_s3_path(s3_folder_path)
+        if not prefix.endswith('/'):
+            prefix += '/'
+        return {f"s3://{bucket_name}/{obj['Key']}": {'etag': obj['ETag'], 'size': obj['Size'],
+                                                     'last_modified': obj['LastModified']}
+                for obj in self._iter_objects(bucket_name, prefix)
+                if obj['Key'].rpartition('.')[2].lower() in IMAGE_EXTENSIONS}
+    
+    def download_s3_image(self, s3_path: str, size: Optional[int] = None) -> Dict:
+        """Download raw (still encoded) image bytes: {'content', 'filename'}; size from the listing if known"""
+        bucket_name, key = self._parse_s3_path(s3_path)
+        return {'content': self._get_object_bytes(bucket_name, key, size=size), 'filename': Path(key).name}
+    
+    def upload_s3_image(self, content: bytes, s3_path: str, content_type: str = 'image/jpeg') -> Dict:
+        """Upload already encoded image bytes: {'success', 'url'} or {'success', 'error'}"""
+        try:
+            bucket_name, key = self._parse_s3_path(s3_path)
+            self._put_bytes(bucket_name, key, content, content_type)
+            return {'success': True, 'url': f"https://{bucket_name}.s3.amazonaws.com/{key}"}
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+    
+    def presign_get(self, s3_path: str, expires: int = S3_PRESIGN_TTL) -> str:
+        """Presigned GET URL for an object (signed locally, no request)"""
+        bucket_name, key = self._parse_s3_path(s3_path)
+        return self.s3_client.generate_presigned_url(
+            'get_object', Params={'Bucket': bucket_name, 'Key': key}, ExpiresIn=expires)
+    
+    def presign_put(self, s3_path: str, content_type: str = 'image/jpeg', expires: int = S3_PRESIGN_TTL) -> str:
+        """Presigned PUT URL; the uploader must send the same Content-Type header"""
+        bucket_name, key = self._parse_s3_path(s3_path)
+        return self.s3_client.generate_presigned_url(
+            'put_object', Params={'Bucket': bucket_name, 'Key': key, 'ContentType': content_type},
+            ExpiresIn=expires)
+    
+    def _detect_and_blur(self, image: 'np.ndarray', detect_face: bool, detect_license_plate: bool,
+                         face_blur_strength: int, plate_blur_strength: int) -> tuple:
+        """Run detection on a decoded image and return (detection_results, blurred_image)"""
+        with self._detect_lock:
+            detection_results = self.detector.detect_objects(
+                image, 
+                detect_face=detect_face, 
+                detect_lp=detect_license_plate
+            )
+        blurred_image = self.visualizer.blur_detections(
+            image, 
+            detection_results,
+            face_blur_strength=face_blur_strength,
+            plate_blur_strength=plate_blur_strength
+        )
+        return detection_results, blurred_image
+    
     def process_single_image(self, 
                            input_s3_path: str, 
                            output_s3_path: str,
                            detect_face: bool = True,
                            detect_license_plate: bool = True,
                            face_blur_strength: int = 25,
-                           plate_blur_strength: int = 20) -> Dict:
+                           plate_blur_strength: int = 20,
+                           dry_run: bool = False) -> Dict:
         """
         Process a single image from S3
         
@@ -249,80 +492,144 @@ class S3ImageProcessor:
             detect_license_plate: Whether to detect license plates
             face_blur_strength: Blur strength for faces
             plate_blur_strength: Blur strength for license plates
+            dry_run: Skip detection and blur; the image still round-trips through S3
             
         Returns:
             Dict: Processing results
         """
-        start_time = datetime.now()
+        start_time = time.perf_counter()
         
         try:
             # Download image from S3
-            local_input_path, original_filename = self._download_image_from_s3(input_s3_path)
-            
-            # Load image
-            image = cv2.imread(local_input_path)
-            if image is None:
-                raise Exception(f"Failed to load image: {local_input_path}")
-            
-            # Detect objects
-            detection_results = self.detector.detect_objects(
-                image, 
-                detect_face=detect_face, 
-                detect_lp=detect_license_plate
-            )
-            
-            # Apply blur
-            blurred_image = self.visualizer.blur_detections(
-                image, 
-                detection_results,
-                face_blur_strength=face_blur_strength,
-                plate_blur_strength=plate_blur_strength
-            )
+            image, original_filename = self._download_image_from_s3(input_s3_path)
             
-            # Save blurred image to temporary file
-            temp_output = tempfile.NamedTemporaryFile(suffix='.jpg', delete=False)
-            temp_output_path = temp_output.name
-            temp_output.close()
-            
-            cv2.imwrite(temp_output_path, blurred_image)
+            # Detect objects and apply blur
+            if dry_run:
+                detection_results, blurred_image = {'faces': [], 'license_plates': []}, image
+            else:
+                detection_results, blurred_image = self._detect_and_blur(
+                    image, detect_face, detect_license_plate, face_blur_strength, plate_blur_strength
+                )
             
             # Upload to S3
-            s3_url = self._upload_image_to_s3(temp_output_path, output_s3_path)
-            
-            # Clean up temporary files
-            os.unlink(local_input_path)
-            os.unlink(temp_output_path)
+            s3_url = self._upload_image_to_s3(blurred_image, output_s3_path)
             
-            processing_time = (datetime.now() - start_time).total_seconds()
-            
-            return {
-                'success': True,
-                'input_s3_path': input_s3_path,
-                'output_s3_path': output_s3_path,
-                'output_s3_url': s3_url,
-                'original_filename': original_filename,
-                'detection_results': detection_results,
-                'faces_detected': len(detection_results.get('faces', [])),
-                'license_plates_detected': len(detection_results.get('license_plates', [])),
-                'processing_time_seconds': round(processing_time, 2)
-            }
+            return self._image_result(input_s3_path, output_s3_path, s3_url, original_filename,
+                                      detection_results, start_time)
             
         except Exception as e:
-            # Clean up temporary files on error
-            try:
-                if 'local_input_path' in locals():
-                    os.unlink(local_input_path)
-                if 'temp_output_path' in locals():
-                    os.unlink(temp_output_path)
-            except:
-                pass
-            
-            return {
-                'success': False,
-                'error': str(e),
-                'input_s3_path': input_s3_path,
-                'processing_time_seconds': round((datetime.now() - start_time).total_seconds(), 2)
-            }
+            return self._failed_result(input_s3_path, e, start_time)
+    
+    def _image_result(self, input_s3_path: str, output_s3_path: str, s3_url: str, original_filename: str,
+                      detection_results: Dict, start_time: float) -> Dict:
+        processing_time = time.perf_counter() - start_time
+        return {
+            'success': True,
+            'input_s3_path': input_s3_path,
+            'output_s3_path': output_s3_path,
+            'output_s3_url': s3_url,
+            'original_filename': original_filename,
+            'detection_results': detection_results,
+            'faces_detected': len(detection_results.get('faces', [])),
+            'license_plates_detected': len(detection_results.get('license_plates', [])),
+            'processing_time_seconds': round(processing_time, 2)
+        }
+    
+    def _failed_result(self, input_s3_path: str, error: Exception, start_time: float) -> Dict:
+        return {
+            'success': False,
+            'error': str(error),
+            'input_s3_path': input_s3_path,
+            'processing_time_seconds': round(time.perf_counter() - start_time, 2)
+        }
+    
+    def _fetch_decoded(self, input_s3_path: str) -> tuple:
+        """Pipeline stage 1: (image, original_filename, start_time, error)"""
+        start_time = time.perf_counter()
+        try:
+            image, original_filename = self._download_image_from_s3(input_s3_path)
+            return image, original_filename, start_time, None
+        except Exception as e:
+            return None, None, start_time, e
+    
+    def _feed_decoded(self, jobs: List[tuple], indices: List[int], decoded: queue.Queue, stop: threading.Event):
+        """Download+decode jobs[indices] in order on the download pool, queue (index, ...) items, then None
+        (at most S3_PIPELINE_DEPTH // 2 decodes in flight on top of the queue)"""
+        window = deque()
+        try:
+            for i in indices:
+                if stop.is_set():
+                    break
+                window.append((i, S3_DOWNLOAD_POOL.submit(self._fetch_decoded, jobs[i][0])))
+                if len(window) >= S3_PIPELINE_DEPTH // 2:
+                    i, future = window.popleft()
+                    decoded.put((i,) + future.result())
+            while window and not stop.is_set():
+                i, future = window.popleft()
+                decoded.put((i,) + future.result())
+        finally:
+            decoded.put(None)
+    
+    @staticmethod
+    def _params_tag(detect_face: bool, detect_license_plate: bool,
+                    face_blur_strength: int, plate_blur_strength: int) -> str:
+        """Short hash of the settings an output was produced with"""
+        params = f"face={int(detect_face)};plate={int(detect_license_plate)};fbs={face_blur_strength};pbs={plate_blur_strength}"
+        return hashlib.sha256(params.encode()).hexdigest()[:16]
+    
+    def _already_processed(self, job: tuple, source_etag: str, params_tag: str) -> Optional[Dict]:
+        """Skipped-result dict when the output was written from this exact source ETag and settings, else None"""
+        input_s3_path, output_s3_path = job
+        bucket_name, key = self._parse_s3_path(output_s3_path)
+        try:
+            meta = self.s3_client.head_object(Bucket=bucket_name, Key=key).get('Metadata', {})
+        except ClientError:
+            return None
+        if meta.get('source-etag') != source_etag or meta.get('params-hash') != params_tag:
+            return None
+        return {
+            'success': True,
+            'skipped': True,
+            'input_s3_path': input_s3_path,
+            'output_s3_path': output_s3_path,
+            'output_s3_url': f"https://{bucket_name}.s3.amazonaws.com/{key}",
+            'original_filename': Path(input_s3_path).name,
+            'faces_detected': int(meta.get('faces-detected', 0)),
+            'license_plates_detected': int(meta.get('plates-detected', 0)),
+            'processing_time_seconds': 0.0
+        }
+    
+    def _blur_and_upload(self, job: tuple, image: 'np.ndarray', original_filename: str, start_time: float,
+                         detection_results: Dict, face_blur_strength: int, plate_blur_strength: int,
+                         source_etag: Optional[str] = None, params_tag: Optional[str] = None) -> Dict:
+        """Pipeline stage 3: blur, encode and upload one detected image (re-encoded even with nothing
+        to blur, so the source's EXIF/GPS metadata is never published)"""
+        input_s3_path, output_s3_path = job
+        try:
+            has_boxes = bool(detection_results.get('faces') or detection_results.get('license_plates'))
+            metadata = None
+            if source_etag:
+                # lets a rerun with the same settings skip this image while the source is unchanged
+                metadata = {
+                    'source-etag': source_etag,
+                    'params-hash': params_tag or '',
+                    'faces-detected': str(len(detection_results.get('faces', []))),
+                    'plates-detected': str(len(detection_results.get('license_plates', [])))
+                }
+            blurred_image = image
+            if has_boxes:
+                blurred_image = self.visualizer.blur_detections(
+                    image,
+                    detection_results,
+                    face_blur_strength=face_blur_strength,
+                    plate_blur_strength=plate_blur_strength,
+                    inplace=True  # decoded for this job only
+                )
+            s3_url = self._upload_image_to_s3(blurred_image, output_s3_path, metadata)
+            return self._image_result(input_s3_path, output_s3_path, s3_url, original_filename,
+                                      detection_results, start_time)
+        except Exception as e:
+            return self._failed_result(input_s3_path, e, start_time)
     
     def process_s3_folder(self, 
                          input_s3_folder: str,
@@ -330,7 +637,9 @@ class S3ImageProcessor:
                          detect_face: bool = True,
                          detect_license_plate: bool = True,
                          face_blur_strength: int = 25,
-                         plate_blur_strength: int = 20) -> Dict:
+                         plate_blur_strength: int = 20,
+                         dry_run: bool = False,
+                         sample_n: Optional[int] = None) -> Dict:
         """
         Process all images in an S3 folder
         
@@ -341,15 +650,20 @@ class S3ImageProcessor:
             detect_license_plate: Whether to detect license plates
             face_blur_strength: Blur strength for faces
             plate_blur_strength: Blur strength for license plates
+            dry_run: Skip detection and blur; images still round-trip through S3
+            sample_n: Only process this many randomly chosen images
             
         Returns:
             Dict: Batch processing results
         """
-        start_time = datetime.now()
+        start_time = time.perf_counter()
         
         try:
             # List all images in input folder
-            input_images = self._list_images_in_s3_folder(input_s3_folder)
+            input_etags = self._list_image_etags(input_s3_folder)
+            input_images = list(input_etags)
+            if sample_n:
+                input_images = random.sample(input_images, min(sample_n, len(input_images)))
             
             if not input_images:
                 return {
@@ -360,43 +674,102 @@ class S3ImageProcessor:
                     'total_count': 0
                 }
             
-            # Process each image
-            results = []
-            successful_count = 0
+            # Parse output folder to get the correct bucket and prefix
+            output_bucket, output_prefix = self._parse_s3_path(output_s3_folder)
             
-            for i, input_s3_path in enumerate(input_images):
-                print(f"🔄 Processing {i+1}/{len(input_images)}: {input_s3_path}")
-                
-                # Generate output path - preserve original filename
-                bucket_name, input_key = self._parse_s3_path(input_s3_path)
-                filename = Path(input_key).name
-                
-                # Parse output folder to get the correct bucket and prefix
-                output_bucket, output_prefix = self._parse_s3_path(output_s3_folder)
-                
-                # Keep original filename without adding _blurred suffix
-                output_key = f"{output_prefix.rstrip('/')}/{filename}"
-                output_s3_path = f"s3://{output_bucket}/{output_key}"
-                
-                # Process image
-                result = self.process_single_image(
-                    input_s3_path,
-                    output_s3_path,
-                    detect_face,
-                    detect_license_plate,
-                    face_blur_strength,
-                    plate_blur_strength
-                )
-                
-                results.append(result)
-                
-                if result['success']:
-                    successful_count += 1
-                    print(f"✅ Success: {result['original_filename']}")
-                else:
-                    print(f"❌ Failed: {result['error']}")
+            # Keep original filename without adding _blurred suffix
+            output_base = f"s3://{output_bucket}/{output_prefix.rstrip('/')}/"
+            jobs = [(path, output_base + path.rpartition('/')[2]) for path in input_images]
             
-            total_time = (datetime.now() - start_time).total_seconds()
+            # Outputs already written from an unchanged source are not reprocessed
+            results = [None] * len(jobs)
+            try:
+                existing = self._list_image_etags(output_s3_folder, use_cache=False)
+            except Exception:
+                existing = {}
+            params_tag = self._params_tag(detect_face, detect_license_plate, face_blur_strength, plate_blur_strength)
+            checks = {S3_DOWNLOAD_POOL.submit(self._already_processed, job, input_etags[job[0]], params_tag): i
+                      for i, job in enumerate(jobs) if job[1] in existing}
+            for future in as_completed(checks):
+                results[checks[future]] = future.result()
+            pending = [i for i, result in enumerate(results) if result is None]
+            if len(pending) < len(jobs):
+                log.info("⏭️ %d images already processed", len(jobs) - len(pending))
+            
+            # Three overlapping stages: a feeder thread downloads and decodes ahead, this
+            # thread runs the detector on batches of whatever is decoded, and the folder
+            # pool blurs, encodes and uploads while the next batch is being detected
+            finishing = {}
+            decoded = queue.Queue(maxsize=S3_PIPELINE_DEPTH)
+            stop = threading.Event()
+            feeder = threading.Thread(target=self._feed_decoded, args=(jobs, pending, decoded, stop),
+                                      name="s3-decode", daemon=True)
+            feeder.start()
+            drained = False
+            try:
+                while not drained:
+                    batch = [decoded.get()]
+                    while len(batch) < S3_DETECT_BATCH and batch[-1] is not None:
+                        try:
+                            batch.append(decoded.get_nowait())
+                        except queue.Empty:
+                            break
+                    if batch[-1] is None:
+                        drained = True
+                        batch.pop()
+                    
+                    ready = []
+                    for i, image, original_filename, item_start, error in batch:
+                        if error is None:
+                            ready.append((i, image, original_filename, item_start))
+                        else:
+                            results[i] = self._failed_result(jobs[i][0], error, item_start)
+                    if not ready:
+                        continue
+                    
+                    try:
+                        if dry_run:
+                            detections = [{'faces': [], 'license_plates': []} for _ in ready]
+                        else:
+                            with self._detect_lock:
+                                detections = self.detector.detect_objects_batch(
+                                    [item[1] for item in ready],
+                                    detect_face=detect_face,
+                                    detect_lp=detect_license_plate
+                                )
+                    except Exception as e:
+                        for i, _, _, item_start in ready:
+                            results[i] = self._failed_result(jobs[i][0], e, item_start)
+                        continue
+                    
+                    for (i, image, original_filename, item_start), detection_results in zip(ready, detections):
+                        future = S3_FOLDER_POOL.submit(
+                            self._blur_and_upload, jobs[i], image, original_filename, item_start,
+                            detection_results, face_blur_strength, plate_blur_strength,
+                            None if dry_run else input_etags[jobs[i][0]], params_tag
+                        )
+                        if log.isEnabledFor(logging.DEBUG):
+                            future.add_done_callback(
+                                lambda f, n=i + 1, path=jobs[i][0]: log.debug("🔄 Processed %d/%d: %s", n, len(jobs), path)
+                            )
+                        finishing[future] = i
+            finally:
+                # unblock the feeder if detection stopped early
+                stop.set()
+                while not drained:
+                    drained = decoded.get() is None
+                feeder.join()
+            
+            for future in as_completed(finishing):
+                results[finishing[future]] = future.result()
+            
+            successful_count = sum(result['success'] for result in results)
+            for result in results:
+                if not result['success']:
+                    log.debug("❌ Failed: %s: %s", result['input_s3_path'], result['error'])
+            
+            total_time = time.perf_counter() - start_time
+            log.info("✅ %s: %d/%d images in %.2fs", input_s3_folder, successful_count, len(results), total_time)
             
             return {
                 'success': True,
@@ -420,8 +793,8 @@ class S3ImageProcessor:
             }
 
 
-def test_s3_processor():
-    """Test S3 processor functionality"""
+def test_s3_processor(bucket_name: str):
+    """Test S3 processor functionality (the credentials can reach bucket_name)"""
     try:
         # Test with environment variables
         aws_access_key_id = os.getenv('AWS_ACCESS_KEY_ID')
@@ -437,8 +810,9 @@ def test_s3_processor():
             aws_secret_access_key=aws_secret_access_key,
             aws_session_token=aws_session_token
         )
+        processor.validate(bucket_name)
         
-        print("✅ S3 Processor test successful")
+        print(f"✅ S3 Processor test successful (bucket {bucket_name} reachable)")
         return True
         
     except Exception as e:
@@ -447,4 +821,26 @@ def test_s3_processor():
 
 
 if __name__ == "__main__":
-    test_s3_processor()
+    import argparse
+    ap = argparse.ArgumentParser(description="Check S3 access, or process an S3 folder")
+    ap.add_argument("input_folder", nargs="?", help="s3://bucket/input/ (omit to only test credentials with --bucket)")
+    ap.add_argument("output_folder", nargs="?", help="s3://bucket/output/")
+    ap.add_argument("--dry-run", action="store_true", help="skip detection and blur, only round-trip the images")
+    ap.add_argument("--sample-n", type=int, default=None, help="process this many random images")
+    ap.add_argument("--bucket", help="bucket the credentials test checks access to")
+    a = ap.parse_args()
+    
+    if not a.input_folder:
+        if not a.bucket:
+            ap.error("--bucket is required without input_folder")
+        test_s3_processor(a.bucket)
+    elif not a.output_folder:
+        ap.error("output_folder is required with input_folder")
+    else:
+        logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+        processor = S3ImageProcessor(os.getenv('AWS_ACCESS_KEY_ID'), os.getenv('AWS_SECRET_ACCESS_KEY'),
+                                     os.getenv('AWS_SESSION_TOKEN'))
+        summary = processor.process_s3_folder(a.input_folder, a.output_folder,
+                                              dry_run=a.dry_run, sample_n=a.sample_n)
+        summary.pop('results', None)
+        print(json.dumps(summary, indent=2))
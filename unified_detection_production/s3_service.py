@@ -3,76 +3,116 @@ S3 Processing Service
 Handles S3 image processing requests
 """
 
+import os
+import json
 import time
-from typing import Dict, Any, List
-from s3_processor import S3ImageProcessor
-from models import S3ImageResult, S3SingleImageResponse, S3FolderResponse
+import atexit
+import logging
+import threading
+from typing import Dict, Any, Iterator, List, Optional
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from s3_processor import (
+    S3ImageProcessor, S3_DOWNLOAD_POOL, S3_UPLOAD_POOL, S3_PRESIGNED, DetectParams, credentials_key
+)
+from models import (
+    S3Credentials, S3SingleImageRequest, S3FolderRequest,
+    S3ImageResult, S3ImageResultList, S3SingleImageResponse, S3FolderResponse
+)
 from parallel_processor import get_parallel_processor
 
+log = logging.getLogger(__name__)
+
+# Processors kept for this many recently used credential sets (temporary credentials rotate)
+MAX_PROCESSORS = 32
+
+# Fan-out mode: one Step Functions execution per image (lambda_handler.py does the work).
+# The state machine runs under its own IAM role; request credentials only list and start
+S3_FANOUT_STATE_MACHINE = os.getenv("S3_FANOUT_STATE_MACHINE", "")
+S3_FANOUT_TIMEOUT = float(os.getenv("S3_FANOUT_TIMEOUT", 900))
+S3_FANOUT_POLL = 2.0  # first DescribeExecution round; the interval doubles up to S3_FANOUT_POLL_MAX
+S3_FANOUT_POLL_MAX = 30.0
+# Step Functions calls get a small pool of their own: the control-plane APIs throttle far
+# below S3 request rates, and S3 transfers must not queue behind them
+_SFN_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="sfn")
+atexit.register(_SFN_POOL.shutdown)
+
+
+# Failed results are copies of this prototype (model_copy skips per-field validation)
+_FAILED = S3ImageResult(success=False, input_s3_path='')
+
+def _failed_result(s3_path: str, error: str, filename: str = None) -> S3ImageResult:
+    """Failed S3ImageResult for one input image"""
+    return _FAILED.model_copy(update={'input_s3_path': s3_path, 'error': error,
+                                      'original_filename': filename or s3_path.rpartition('/')[2]})
+
+def _output_paths(image_paths: List[str], input_s3_folder: str, output_s3_folder: str) -> List[str]:
+    """Output path per listed image: the input folder prefix swapped for the output folder"""
+    in_prefix = input_s3_folder.rstrip('/') + '/'
+    out_prefix = output_s3_folder.rstrip('/') + '/'
+    cut = len(in_prefix)
+    for s3_path in image_paths:
+        if not s3_path.startswith(in_prefix):
+            raise ValueError(f"{s3_path} is not under {in_prefix}")
+    return [out_prefix + s3_path[cut:] for s3_path in image_paths]
+
 
 class S3ProcessingService:
     """Service for processing S3 images"""
     
     def __init__(self):
         """Initialize S3 processing service"""
-        self.processors = {}  # Cache processors by credentials
+        self.processors = OrderedDict()  # Cache processors by credentials, least recently used first
+        self._lock = threading.Lock()
     
-    def _get_processor(self, credentials: Dict[str, str]) -> S3ImageProcessor:
-        """Get or create S3 processor for credentials"""
-        # Create a key for caching processors
-        cred_key = f"{credentials['aws_access_key_id']}_{credentials['aws_secret_access_key']}"
-        
-        if cred_key not in self.processors:
-            self.processors[cred_key] = S3ImageProcessor(
-                aws_access_key_id=credentials['aws_access_key_id'],
-                aws_secret_access_key=credentials['aws_secret_access_key'],
-                aws_session_token=credentials.get('aws_session_token')
-            )
+    def get_processor(self, credentials: S3Credentials) -> S3ImageProcessor:
+        """Get or create S3 processor (session, client, detector) for credentials"""
+        # Create a key for caching processors (no raw secret in the key)
+        cred_key = credentials_key(
+            credentials.aws_access_key_id,
+            credentials.aws_secret_access_key,
+            credentials.aws_session_token
+        )
         
-        return self.processors[cred_key]
+        with self._lock:
+            processor = self.processors.get(cred_key)
+            if processor is None:
+                processor = self.processors[cred_key] = S3ImageProcessor(
+                    aws_access_key_id=credentials.aws_access_key_id,
+                    aws_secret_access_key=credentials.aws_secret_access_key,
+                    aws_session_token=credentials.aws_session_token
+                )
+                if len(self.processors) > MAX_PROCESSORS:
+                    self.processors.popitem(last=False)
+            else:
+                self.processors.move_to_end(cred_key)
+            return processor
     
-    def process_single_image(self, request_data: Dict[str, Any]) -> S3SingleImageResponse:
+    def process_single_image(self, request: S3SingleImageRequest) -> S3SingleImageResponse:
         """Process a single image from S3"""
-        start_time = time.time()
+        start_time = time.perf_counter_ns()
         
         try:
             # Extract credentials and parameters
-            credentials = request_data['credentials']
-            input_s3_path = request_data['input_s3_path']
-            output_s3_path = request_data['output_s3_path']
-            detect_face = request_data.get('detect_face', True)
-            detect_license_plate = request_data.get('detect_license_plate', True)
-            face_blur_strength = request_data.get('face_blur_strength', 25)
-            plate_blur_strength = request_data.get('plate_blur_strength', 20)
+            credentials = request.credentials
+            input_s3_path = request.input_s3_path
+            output_s3_path = request.output_s3_path
+            params = DetectParams.from_request(request)
             
             # Get processor
-            processor = self._get_processor(credentials)
+            processor = self.get_processor(credentials)
             
             # Process image
-            result = processor.process_single_image(
-                input_s3_path=input_s3_path,
-                output_s3_path=output_s3_path,
-                detect_face=detect_face,
-                detect_license_plate=detect_license_plate,
-                face_blur_strength=face_blur_strength,
-                plate_blur_strength=plate_blur_strength
-            )
+            result = processor.process_single_image(input_s3_path, output_s3_path, *params)
             
-            processing_time = time.time() - start_time
+            processing_time = (time.perf_counter_ns() - start_time) / 1e9
+            
+            # Convert to S3ImageResult (one validation pass; extra keys are ignored)
+            s3_result = S3ImageResult.model_validate(result)
             
             if result['success']:
-                # Convert to S3ImageResult
-                s3_result = S3ImageResult(
-                    success=True,
-                    input_s3_path=result['input_s3_path'],
-                    output_s3_path=result['output_s3_path'],
-                    output_s3_url=result['output_s3_url'],
-                    original_filename=result['original_filename'],
-                    faces_detected=result['faces_detected'],
-                    license_plates_detected=result['license_plates_detected'],
-                    processing_time_seconds=result['processing_time_seconds']
-                )
-                
                 return S3SingleImageResponse(
                     success=True,
                     message=f"Successfully processed {result['original_filename']}",
@@ -81,14 +121,6 @@ class S3ProcessingService:
                 )
             else:
                 # Handle error case
-                s3_result = S3ImageResult(
-                    success=False,
-                    input_s3_path=result['input_s3_path'],
-                    output_s3_path="",
-                    error=result['error'],
-                    processing_time_seconds=result['processing_time_seconds']
-                )
-                
                 return S3SingleImageResponse(
                     success=False,
                     message=f"Failed to process image: {result['error']}",
@@ -97,7 +129,7 @@ class S3ProcessingService:
                 )
                 
         except Exception as e:
-            processing_time = time.time() - start_time
+            processing_time = (time.perf_counter_ns() - start_time) / 1e9
             return S3SingleImageResponse(
                 success=False,
                 message=f"Processing failed: {str(e)}",
@@ -105,51 +137,28 @@ class S3ProcessingService:
                 processing_time_seconds=round(processing_time, 2)
             )
     
-    def process_folder(self, request_data: Dict[str, Any]) -> S3FolderResponse:
+    def process_folder(self, request: S3FolderRequest) -> S3FolderResponse:
         """Process all images in an S3 folder"""
-        start_time = time.time()
+        start_time = time.perf_counter_ns()
         
         try:
             # Extract credentials and parameters
-            credentials = request_data['credentials']
-            input_s3_folder = request_data['input_s3_folder']
-            output_s3_folder = request_data['output_s3_folder']
-            detect_face = request_data.get('detect_face', True)
-            detect_license_plate = request_data.get('detect_license_plate', True)
-            face_blur_strength = request_data.get('face_blur_strength', 25)
-            plate_blur_strength = request_data.get('plate_blur_strength', 20)
+            credentials = request.credentials
+            input_s3_folder = request.input_s3_folder
+            output_s3_folder = request.output_s3_folder
+            params = DetectParams.from_request(request)
             
             # Get processor
-            processor = self._get_processor(credentials)
+            processor = self.get_processor(credentials)
             
             # Process folder
-            result = processor.process_s3_folder(
-                input_s3_folder=input_s3_folder,
-                output_s3_folder=output_s3_folder,
-                detect_face=detect_face,
-                detect_license_plate=detect_license_plate,
-                face_blur_strength=face_blur_strength,
-                plate_blur_strength=plate_blur_strength
-            )
+            result = processor.process_s3_folder(input_s3_folder, output_s3_folder, *params)
             
-            processing_time = time.time() - start_time
+            processing_time = (time.perf_counter_ns() - start_time) / 1e9
             
             if result['success']:
-                # Convert results to S3ImageResult objects
-                s3_results = []
-                for img_result in result['results']:
-                    s3_result = S3ImageResult(
-                        success=img_result['success'],
-                        input_s3_path=img_result['input_s3_path'],
-                        output_s3_path=img_result.get('output_s3_path', ''),
-                        output_s3_url=img_result.get('output_s3_url'),
-                        original_filename=img_result.get('original_filename'),
-                        faces_detected=img_result.get('faces_detected', 0),
-                        license_plates_detected=img_result.get('license_plates_detected', 0),
-                        processing_time_seconds=img_result.get('processing_time_seconds', 0.0),
-                        error=img_result.get('error')
-                    )
-                    s3_results.append(s3_result)
+                # Convert results to S3ImageResult objects (one validation pass)
+                s3_results = S3ImageResultList.validate_python(result['results'])
                 
                 return S3FolderResponse(
                     success=True,
@@ -178,12 +187,12 @@ class S3ProcessingService:
                 )
                 
         except Exception as e:
-            processing_time = time.time() - start_time
+            processing_time = (time.perf_counter_ns() - start_time) / 1e9
             return S3FolderResponse(
                 success=False,
                 message=f"Folder processing failed: {str(e)}",
-                input_folder=request_data.get('input_s3_folder', ''),
-                output_folder=request_data.get('output_s3_folder', ''),
+                input_folder=request.input_s3_folder,
+                output_folder=request.output_s3_folder,
                 total_images=0,
                 successful_count=0,
                 failed_count=0,
@@ -192,26 +201,181 @@ class S3ProcessingService:
                 average_time_per_image=0.0
             )
     
-    def process_folder_parallel(self, request_data: Dict[str, Any]) -> S3FolderResponse:
+    def _parallel_result(self, processor: S3ImageProcessor, downloaded_file: Dict[str, Any],
+                         result: Dict[str, Any]) -> S3ImageResult:
+        """Upload one parallel-worker result and describe it"""
+        if not result['success']:
+            return _failed_result(downloaded_file['s3_path'], result.get('error', 'Processing failed'),
+                                  result['filename'])
+        
+        detection = result['detection']
+        url, error = None, None
+        if result['blur'] and result['blur'].get('uploaded'):
+            # The worker already PUT the JPEG through its presigned URL
+            bucket_name, key = processor._parse_s3_path(downloaded_file['output_s3_path'])
+            url = f"https://{bucket_name}.s3.amazonaws.com/{key}"
+        elif result['blur'] and result['blur'].get('blurred_bytes'):
+            # The workers return the encoded JPEG; it goes straight to S3
+            upload_result = processor.upload_s3_image(
+                content=result['blur']['blurred_bytes'],
+                s3_path=downloaded_file['output_s3_path'],
+                content_type='image/jpeg'
+            )
+            url = upload_result.get('url')
+            if not upload_result['success']:
+                error = f"Upload failed: {upload_result.get('error', 'Unknown error')}"
+        else:
+            error = "No blur result available"
+        
+        return S3ImageResult(
+            success=error is None,
+            input_s3_path=downloaded_file['s3_path'],
+            output_s3_path=downloaded_file['output_s3_path'],
+            output_s3_url=url,
+            original_filename=result['filename'],
+            faces_detected=detection.get('total_faces', 0),
+            license_plates_detected=detection.get('total_license_plates', 0),
+            processing_time_seconds=result['processing_time'] / 1000.0,
+            error=error
+        )
+    
+    def _iter_parallel(self, processor, params: DetectParams, images: Dict[str, Dict], input_s3_folder: str,
+                       output_s3_folder: str, max_workers: int = 4):
+        """Yield (listing index, S3ImageResult) for every image as soon as its result is final"""
+        image_paths = list(images)
+        output_paths = _output_paths(image_paths, input_s3_folder, output_s3_folder)
+        if len(image_paths) == 1:
+            # Nothing to overlap: the in-process detector beats starting the worker pool
+            result = processor.process_single_image(image_paths[0], output_paths[0], *params)
+            yield 0, S3ImageResult.model_validate(result)
+            return
+        # Three overlapping stages: every finished download joins the next worker batch,
+        # and every finished batch fans its uploads out at once, so S3 transfers run
+        # while the workers detect instead of before and after them
+        parallel_processor = get_parallel_processor(max_workers)
+        size = parallel_processor.batch_size(len(image_paths))
+        options = dict(params._asdict(), enable_blur=True, return_bytes=True)
+        
+        def finish(downloaded_file, result):
+            # Upload the worker's JPEG (the original minus its metadata when there was nothing to blur)
+            try:
+                return self._parallel_result(processor, downloaded_file, result)
+            except Exception as e:
+                return _failed_result(downloaded_file['s3_path'], f"Upload error: {e}")
+        
+        def submit_ready():
+            # Full batches go to the workers as soon as they are downloaded, the rest once downloads end
+            nonlocal ready
+            downloading = any(f in downloads for f in pending)
+            while len(ready) >= size or (ready and not downloading):
+                batch, ready = ready[:size], ready[size:]
+                future = parallel_processor.submit_batch(batch, **options)
+                batches[future] = batch
+                pending.add(future)
+        
+        batches = {}   # worker future -> downloaded files
+        uploads = {}   # upload future -> image index
+        if S3_PRESIGNED:
+            # Workers fetch and push the bytes themselves; nothing passes through this process
+            downloads = {}
+            ready = [{
+                'index': i,
+                'filename': s3_path.rpartition('/')[2],
+                's3_path': s3_path,
+                'output_s3_path': output_paths[i],
+                'get_url': processor.presign_get(s3_path),
+                'put_url': processor.presign_put(output_paths[i])
+            } for i, s3_path in enumerate(image_paths)]
+        else:
+            downloads = {S3_DOWNLOAD_POOL.submit(processor.download_s3_image, s3_path, images[s3_path]['size']): i
+                         for i, s3_path in enumerate(image_paths)}
+            ready = []
+        pending = set(downloads)
+        submit_ready()
+        left = set(range(len(image_paths)))
+        # 5 minutes per image in the busiest worker's queue, for the whole folder
+        budget = 300 * size * -(-len(image_paths) // (size * max_workers))
+        deadline = time.monotonic() + budget
+        
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()),
+                                     return_when=FIRST_COMPLETED)
+                if not done:
+                    break  # out of time
+                for future in done:
+                    if future in downloads:
+                        i = downloads[future]
+                        s3_path = image_paths[i]
+                        try:
+                            temp_file = future.result()
+                        except Exception as e:
+                            log.warning("⚠️ Failed to download %s: %s", s3_path, e)
+                            left.discard(i)
+                            yield i, _failed_result(s3_path, f"Download failed: {e}")
+                            continue
+                        ready.append({
+                            'index': i,
+                            'content': temp_file['content'],
+                            'filename': temp_file['filename'],
+                            's3_path': s3_path,
+                            'output_s3_path': output_paths[i]
+                        })
+                    elif future in batches:
+                        batch = batches.pop(future)
+                        try:
+                            batch_results = future.result()
+                        except Exception as e:
+                            batch_results = [{'success': False, 'filename': f['filename'], 'error': str(e)}
+                                             for f in batch]
+                        for downloaded_file, result in zip(batch, batch_results):
+                            upload = S3_UPLOAD_POOL.submit(finish, downloaded_file, result)
+                            uploads[upload] = downloaded_file['index']
+                            pending.add(upload)
+                    else:
+                        i = uploads[future]
+                        left.discard(i)
+                        yield i, future.result()
+                submit_ready()
+            # Anything the budget ran out on, in listing order
+            for i in sorted(left):
+                yield i, _failed_result(image_paths[i], "Timed out")
+        finally:
+            # Still queued or running: out of time, or the consumer stopped early
+            for future in pending:
+                future.cancel()
+
+    def process_folder_stream(self, request: S3FolderRequest, max_workers: int = 4) -> Iterator[S3ImageResult]:
+        """
+        Like process_folder_parallel, but yields each S3ImageResult as soon as it is
+        final (completion order). Listing happens up front so bad credentials or paths
+        raise here, before any streaming starts.
+        """
+        params = DetectParams.from_request(request)
+        processor = self.get_processor(request.credentials)
+        images = processor.list_s3_images_detailed(request.input_s3_folder)
+        log.info("⚡ Streaming %d images in parallel with %d workers...", len(images), max_workers)
+        results = self._iter_parallel(processor, params, images, request.input_s3_folder,
+                                      request.output_s3_folder, max_workers)
+        return (result for _, result in results)
+
+    def process_folder_parallel(self, request: S3FolderRequest, max_workers: int = 4) -> S3FolderResponse:
         """Process all images in an S3 folder using parallel processing"""
-        start_time = time.time()
+        start_time = time.perf_counter_ns()
         
         try:
             # Extract credentials and parameters
-            credentials = request_data['credentials']
-            input_s3_folder = request_data['input_s3_folder']
-            output_s3_folder = request_data['output_s3_folder']
-            detect_face = request_data.get('detect_face', True)
-            detect_license_plate = request_data.get('detect_license_plate', True)
-            face_blur_strength = request_data.get('face_blur_strength', 25)
-            plate_blur_strength = request_data.get('plate_blur_strength', 20)
-            max_workers = request_data.get('max_workers', 4)
+            credentials = request.credentials
+            input_s3_folder = request.input_s3_folder
+            output_s3_folder = request.output_s3_folder
+            params = DetectParams.from_request(request)
             
             # Get processor
-            processor = self._get_processor(credentials)
+            processor = self.get_processor(credentials)
             
             # List all images in the S3 folder
-            image_paths = processor.list_s3_images(input_s3_folder)
+            images = processor.list_s3_images_detailed(input_s3_folder)
+            image_paths = list(images)
             
             if not image_paths:
                 return S3FolderResponse(
@@ -227,171 +391,132 @@ class S3ProcessingService:
                     average_time_per_image=0.0
                 )
             
-            # Download images for parallel processing
-            print(f"🔄 Downloading {len(image_paths)} images for parallel processing...")
-            downloaded_files = []
-            for i, s3_path in enumerate(image_paths):
-                try:
-                    # Download image to temporary file
-                    temp_file = processor.download_s3_image(s3_path)
-                    if temp_file:
-                        downloaded_files.append({
-                            'content': temp_file['content'],
-                            'filename': temp_file['filename'],
-                            's3_path': s3_path,
-                            'output_s3_path': s3_path.replace(input_s3_folder, output_s3_folder)
-                        })
-                except Exception as e:
-                    print(f"⚠️ Failed to download {s3_path}: {e}")
+            log.info("⚡ Processing %d images in parallel with %d workers...", len(image_paths), max_workers)
+            s3_results = [None] * len(image_paths)
+            for i, result in self._iter_parallel(processor, params, images,
+                                                 input_s3_folder, output_s3_folder, max_workers):
+                s3_results[i] = result
             
-            if not downloaded_files:
-                return S3FolderResponse(
-                    success=False,
-                    message="Failed to download any images from S3 folder",
-                    input_folder=input_s3_folder,
-                    output_folder=output_s3_folder,
-                    total_images=len(image_paths),
-                    successful_count=0,
-                    failed_count=len(image_paths),
-                    results=[],
-                    total_processing_time_seconds=time.time() - start_time,
-                    average_time_per_image=0.0
-                )
+            successful_count = sum(r.success for r in s3_results)
+            failed_count = len(s3_results) - successful_count
             
-            # Process images in parallel
-            print(f"⚡ Processing {len(downloaded_files)} images in parallel with {max_workers} workers...")
-            parallel_processor = get_parallel_processor(max_workers)
+            processing_time = (time.perf_counter_ns() - start_time) / 1e9
             
-            parallel_result = parallel_processor.process_images_parallel(
-                files=downloaded_files,
-                detect_face=detect_face,
-                detect_license_plate=detect_license_plate,
-                enable_blur=True,
-                face_blur_strength=face_blur_strength,
-                plate_blur_strength=plate_blur_strength
+            return S3FolderResponse(
+                success=True,
+                message=f"Parallel processing completed: {successful_count}/{len(image_paths)} images processed in {processing_time:.2f}s",
+                input_folder=input_s3_folder,
+                output_folder=output_s3_folder,
+                total_images=len(image_paths),
+                successful_count=successful_count,
+                failed_count=failed_count,
+                results=s3_results,
+                total_processing_time_seconds=round(processing_time, 2),
+                average_time_per_image=processing_time / len(image_paths) if len(image_paths) > 0 else 0.0
             )
             
-            if not parallel_result['success']:
-                raise Exception(f"Parallel processing failed: {parallel_result.get('message', 'Unknown error')}")
+        except Exception as e:
+            processing_time = (time.perf_counter_ns() - start_time) / 1e9
+            return S3FolderResponse(
+                success=False,
+                message=f"Failed to process S3 folder in parallel: {str(e)}",
+                input_folder=request.input_s3_folder,
+                output_folder=request.output_s3_folder,
+                total_images=0,
+                successful_count=0,
+                failed_count=0,
+                results=[],
+                total_processing_time_seconds=round(processing_time, 2),
+                average_time_per_image=0.0
+            )
+    
+    def _fanout_result(self, s3_path: str, execution: Dict[str, Any]) -> S3ImageResult:
+        """S3ImageResult from a finished DescribeExecution response"""
+        if execution['status'] == 'SUCCEEDED':
+            result = json.loads(execution.get('output') or '{}')
+            result.setdefault('input_s3_path', s3_path)
+            result.setdefault('success', False)
+            return S3ImageResult.model_validate(result)
+        return _failed_result(s3_path, f"{execution['status']}: {execution.get('error') or execution.get('cause') or ''}")
+    
+    def process_folder_fanout(self, request: S3FolderRequest) -> S3FolderResponse:
+        """
+        Process an S3 folder with one Step Functions execution per image instead of this host's
+        workers; results are polled with DescribeExecution (backing off from S3_FANOUT_POLL to
+        S3_FANOUT_POLL_MAX) until S3_FANOUT_TIMEOUT
+        """
+        start_time = time.perf_counter_ns()
+        
+        try:
+            if not S3_FANOUT_STATE_MACHINE:
+                raise ValueError("S3_FANOUT_STATE_MACHINE is not set")
+            credentials = request.credentials
+            input_s3_folder = request.input_s3_folder
+            output_s3_folder = request.output_s3_folder
+            params = DetectParams.from_request(request)
+            processor = self.get_processor(credentials)
+            image_paths = processor.list_s3_images(input_s3_folder)
+            
+            import boto3
+            sfn = boto3.client(
+                'stepfunctions',
+                region_name=S3_FANOUT_STATE_MACHINE.split(':')[3],  # arn:aws:states:<region>:...
+                aws_access_key_id=credentials.aws_access_key_id,
+                aws_secret_access_key=credentials.aws_secret_access_key,
+                aws_session_token=credentials.aws_session_token or None,
+                config=Config(retries={'mode': 'adaptive', 'max_attempts': 10})
+            )
+            
+            output_paths = _output_paths(image_paths, input_s3_folder, output_s3_folder)
             
-            # Upload processed images back to S3
-            print(f"📤 Uploading {len(parallel_result['results'])} processed images to S3...")
-            s3_results = []
-            successful_count = 0
-            failed_count = 0
+            def start(s3_path, output_s3_path):
+                payload = dict(params._asdict(), input_s3_path=s3_path, output_s3_path=output_s3_path)
+                return sfn.start_execution(stateMachineArn=S3_FANOUT_STATE_MACHINE,
+                                           input=json.dumps(payload))['executionArn']
             
-            for result in parallel_result['results']:
+            log.info("🚀 Fanning out %d images to %s...", len(image_paths), S3_FANOUT_STATE_MACHINE)
+            s3_results = [None] * len(image_paths)
+            running = {}  # execution ARN -> image index
+            for i, future in enumerate([_SFN_POOL.submit(start, p, o) for p, o in zip(image_paths, output_paths)]):
                 try:
-                    # Find the corresponding downloaded file
-                    downloaded_file = next(
-                        (f for f in downloaded_files if f['filename'] == result['filename']), 
-                        None
-                    )
-                    
-                    if not downloaded_file:
-                        s3_results.append(S3ImageResult(
-                            success=False,
-                            input_s3_path=result['filename'],
-                            output_s3_path="",
-                            output_s3_url=None,
-                            original_filename=result['filename'],
-                            faces_detected=0,
-                            license_plates_detected=0,
-                            processing_time_seconds=0.0,
-                            error="File not found in downloaded files"
-                        ))
-                        failed_count += 1
-                        continue
-                    
-                    # Upload blurred image to S3
-                    if result['blur'] and result['blur'].get('blurred_image_path'):
-                        # Read the blurred image file
-                        with open(result['blur']['blurred_image_path'], 'rb') as f:
-                            blurred_content = f.read()
-                        
-                        # Upload to S3
-                        output_s3_path = downloaded_file['output_s3_path']
-                        upload_result = processor.upload_s3_image(
-                            content=blurred_content,
-                            s3_path=output_s3_path,
-                            content_type='image/png'
-                        )
-                        
-                        if upload_result['success']:
-                            s3_results.append(S3ImageResult(
-                                success=True,
-                                input_s3_path=downloaded_file['s3_path'],
-                                output_s3_path=output_s3_path,
-                                output_s3_url=upload_result['url'],
-                                original_filename=result['filename'],
-                                faces_detected=result['detection'].get('total_faces', 0),
-                                license_plates_detected=result['detection'].get('total_license_plates', 0),
-                                processing_time_seconds=result['processing_time'] / 1000.0,
-                                error=None
-                            ))
-                            successful_count += 1
-                        else:
-                            s3_results.append(S3ImageResult(
-                                success=False,
-                                input_s3_path=downloaded_file['s3_path'],
-                                output_s3_path=output_s3_path,
-                                output_s3_url=None,
-                                original_filename=result['filename'],
-                                faces_detected=result['detection'].get('total_faces', 0),
-                                license_plates_detected=result['detection'].get('total_license_plates', 0),
-                                processing_time_seconds=result['processing_time'] / 1000.0,
-                                error=f"Upload failed: {upload_result.get('error', 'Unknown error')}"
-                            ))
-                            failed_count += 1
-                    else:
-                        # No blur result, upload original
-                        s3_results.append(S3ImageResult(
-                            success=False,
-                            input_s3_path=downloaded_file['s3_path'],
-                            output_s3_path=downloaded_file['output_s3_path'],
-                            output_s3_url=None,
-                            original_filename=result['filename'],
-                            faces_detected=result['detection'].get('total_faces', 0),
-                            license_plates_detected=result['detection'].get('total_license_plates', 0),
-                            processing_time_seconds=result['processing_time'] / 1000.0,
-                            error="No blur result available"
-                        ))
-                        failed_count += 1
-                
+                    running[future.result()] = i
                 except Exception as e:
-                    s3_results.append(S3ImageResult(
-                        success=False,
-                        input_s3_path=result['filename'],
-                        output_s3_path="",
-                        output_s3_url=None,
-                        original_filename=result['filename'],
-                        faces_detected=0,
-                        license_plates_detected=0,
-                        processing_time_seconds=0.0,
-                        error=f"Upload error: {str(e)}"
-                    ))
-                    failed_count += 1
+                    s3_results[i] = _failed_result(image_paths[i], f"Start failed: {e}")
             
-            # Add failed results from parallel processing
-            for failed_result in parallel_result.get('failed_results', []):
-                s3_results.append(S3ImageResult(
-                    success=False,
-                    input_s3_path=failed_result['filename'],
-                    output_s3_path="",
-                    output_s3_url=None,
-                    original_filename=failed_result['filename'],
-                    faces_detected=0,
-                    license_plates_detected=0,
-                    processing_time_seconds=0.0,
-                    error=failed_result.get('error', 'Processing failed')
-                ))
-                failed_count += 1
+            def describe(arn) -> Optional[Dict[str, Any]]:
+                try:
+                    return sfn.describe_execution(executionArn=arn)
+                except ClientError as e:
+                    # throttled past the client's retries (or transient): ask again next round
+                    log.debug("DescribeExecution %s: %s", arn, e)
+                    return None
             
-            processing_time = time.time() - start_time
+            deadline = time.monotonic() + S3_FANOUT_TIMEOUT
+            delay = S3_FANOUT_POLL
+            while running and time.monotonic() < deadline:
+                time.sleep(min(delay, max(deadline - time.monotonic(), 0)))
+                delay = min(delay * 2, S3_FANOUT_POLL_MAX)
+                arns = list(running)
+                for arn, execution in zip(arns, _SFN_POOL.map(describe, arns)):
+                    if execution is not None and execution['status'] != 'RUNNING':
+                        i = running.pop(arn)
+                        s3_results[i] = self._fanout_result(image_paths[i], execution)
+            
+            # Still running at the deadline: stop them rather than leave orphaned work
+            for arn, i in running.items():
+                try:
+                    sfn.stop_execution(executionArn=arn, cause="Folder job timed out")
+                except Exception:
+                    pass
+                s3_results[i] = _failed_result(image_paths[i], "Timed out")
+            
+            successful_count = sum(r.success for r in s3_results)
+            failed_count = len(s3_results) - successful_count
+            processing_time = (time.perf_counter_ns() - start_time) / 1e9
             
             return S3FolderResponse(
                 success=True,
-                message=f"Parallel processing completed: {successful_count}/{len(image_paths)} images processed in {processing_time:.2f}s",
+                message=f"Fan-out processing completed: {successful_count}/{len(image_paths)} images processed in {processing_time:.2f}s",
                 input_folder=input_s3_folder,
                 output_folder=output_s3_folder,
                 total_images=len(image_paths),
@@ -403,12 +528,12 @@ class S3ProcessingService:
             )
             
         except Exception as e:
-            processing_time = time.time() - start_time
+            processing_time = (time.perf_counter_ns() - start_time) / 1e9
             return S3FolderResponse(
                 success=False,
-                message=f"Failed to process S3 folder in parallel: {str(e)}",
-                input_folder=request_data.get('input_s3_folder', ''),
-                output_folder=request_data.get('output_s3_folder', ''),
+                message=f"Failed to fan out S3 folder: {str(e)}",
+                input_folder=request.input_s3_folder,
+                output_folder=request.output_s3_folder,
                 total_images=0,
                 successful_count=0,
                 failed_count=0,
@@ -5,26 +5,41 @@ Demonstrates different endpoints with a single image and visualization
 """
 
 import requests
+import orjson
+from http_session import SESSION
+from requests_toolbelt import MultipartEncoder
 import cv2
-import json
+import numpy as np
 import os
+import shutil
 from pathlib import Path
+from functools import lru_cache
+from visualizer import CLASS_COLORS, DEBUG_JPEG, box_quads, detections_soa, fit_for_display, read_image, show_image, text_size
 
 # Configuration
 BASE_URL = "http://localhost:8000"
 IMAGE_PATH = "test_images/frame_000000.png"  # Change this to your image path
 OUTPUT_DIR = "demo_output"
 
+# Label/box style, resolved once instead of per box
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+FSCALE = 0.7
+FTHICK = 2
+BOX_THICK = 3
+WHITE = (255, 255, 255)
+LABELS = ('license_plate', 'face')  # indexed by is_face
+
 def print_header(title):
     """Print a formatted header"""
     print("\n" + "="*60)
     print(f"  {title}")
     print("="*60)
 
+@lru_cache(maxsize=1)
 def check_server():
-    """Check if server is running"""
+    """Check if server is running (once per run)"""
     try:
-        response = requests.get(f"{BASE_URL}/health", timeout=5)
+        response = SESSION.get(f"{BASE_URL}/health", timeout=5)
         if response.status_code == 200:
             print("✅ Server is running")
             return True
@@ -36,101 +51,91 @@ def check_server():
         print("💡 Make sure to start the server first: python main.py")
         return False
 
-def detect_objects(image_path, detect_face=True, detect_lp=True):
-    """Call detection API"""
-    print(f"\n🔍 Detecting objects in: {os.path.basename(image_path)}")
+def detect_objects(image_bytes, filename, detect_face=True, detect_lp=True):
+    """Call detection API with already-read image bytes"""
+    print(f"\n🔍 Detecting objects in: {filename}")
     print(f"   Face detection: {detect_face}")
     print(f"   License plate detection: {detect_lp}")
     
     try:
-        with open(image_path, 'rb') as f:
-            files = {'file': (os.path.basename(image_path), f, 'image/png')}
-            data = {
-                'detect_face': detect_face,
-                'detect_license_plate': detect_lp
-            }
-            
-            response = requests.post(f"{BASE_URL}/detect", files=files, data=data, timeout=30)
+        # Streamed straight from image_bytes (no second in-memory multipart body)
+        form = MultipartEncoder(fields={
+            'file': (filename, image_bytes, 'image/png'),
+            'detect_face': str(detect_face),
+            'detect_license_plate': str(detect_lp)
+        })
+        
+        response = SESSION.post(f"{BASE_URL}/detect", data=form,
+                                headers={'Content-Type': form.content_type}, timeout=30)
+        
+        if response.status_code == 200:
+            result = orjson.loads(response.content)
+            print(f"✅ Detection successful!")
+            print(f"   📊 Faces: {result['total_faces']}, License Plates: {result['total_license_plates']}")
+            print(f"   ⏱️  Processing time: {result['processing_time_ms']}ms")
+            return result
+        else:
+            print(f"❌ Detection failed: {response.status_code}")
+            print(f"   Error: {response.text}")
+            return None
             
-            if response.status_code == 200:
-                result = response.json()
-                print(f"✅ Detection successful!")
-                print(f"   📊 Faces: {result['total_faces']}, License Plates: {result['total_license_plates']}")
-                print(f"   ⏱️  Processing time: {result['processing_time_ms']}ms")
-                return result
-            else:
-                print(f"❌ Detection failed: {response.status_code}")
-                print(f"   Error: {response.text}")
-                return None
-                
     except Exception as e:
         print(f"❌ Error during detection: {e}")
         return None
 
-def blur_objects(image_path, detect_face=True, detect_lp=True, face_blur=25, plate_blur=20):
-    """Call blur API"""
-    print(f"\n🔒 Blurring objects in: {os.path.basename(image_path)}")
+def blur_objects(image_bytes, filename, detect_face=True, detect_lp=True, face_blur=25, plate_blur=20):
+    """Call blur API with already-read image bytes"""
+    print(f"\n🔒 Blurring objects in: {filename}")
     print(f"   Face blur strength: {face_blur}")
     print(f"   License plate blur strength: {plate_blur}")
     
     try:
-        with open(image_path, 'rb') as f:
-            files = {'file': (os.path.basename(image_path), f, 'image/png')}
-            data = {
-                'detect_face': detect_face,
-                'detect_license_plate': detect_lp,
-                'face_blur_strength': face_blur,
-                'plate_blur_strength': plate_blur
-            }
-            
-            response = requests.post(f"{BASE_URL}/blur", files=files, data=data, timeout=30)
+        form = MultipartEncoder(fields={
+            'file': (filename, image_bytes, 'image/png'),
+            'detect_face': str(detect_face),
+            'detect_license_plate': str(detect_lp),
+            'face_blur_strength': str(face_blur),
+            'plate_blur_strength': str(plate_blur)
+        })
+        
+        response = SESSION.post(f"{BASE_URL}/blur", data=form,
+                                headers={'Content-Type': form.content_type}, timeout=30)
+        
+        if response.status_code == 200:
+            result = orjson.loads(response.content)
+            print(f"✅ Blur successful!")
+            print(f"   🔒 Objects blurred: {result['detections_applied']}")
+            print(f"   💾 Output saved: {result['blurred_image_path']}")
+            print(f"   ⏱️  Processing time: {result['processing_time_ms']}ms")
+            return result
+        else:
+            print(f"❌ Blur failed: {response.status_code}")
+            print(f"   Error: {response.text}")
+            return None
             
-            if response.status_code == 200:
-                result = response.json()
-                print(f"✅ Blur successful!")
-                print(f"   🔒 Objects blurred: {result['detections_applied']}")
-                print(f"   💾 Output saved: {result['blurred_image_path']}")
-                print(f"   ⏱️  Processing time: {result['processing_time_ms']}ms")
-                return result
-            else:
-                print(f"❌ Blur failed: {response.status_code}")
-                print(f"   Error: {response.text}")
-                return None
-                
     except Exception as e:
         print(f"❌ Error during blur: {e}")
         return None
 
-def visualize_detections(image_path, detections, save_path=None):
-    """Visualize detections on image"""
+def visualize_detections(source, detections, save_path=None):
+    """Visualize detections on a copy of the decoded source image"""
     print(f"\n👀 Visualizing detections...")
     
-    # Load image
-    image = cv2.imread(image_path)
-    if image is None:
-        print(f"❌ Could not load image: {image_path}")
-        return None
+    image = source.copy()
     
-    # Draw bounding boxes
-    for detection in detections['detections']:
-        x1, y1, x2, y2 = detection['x1'], detection['y1'], detection['x2'], detection['y2']
-        confidence = detection['confidence']
-        label = detection['label']
-        
-        # Choose color based on label
-        if label == 'face':
-            color = (0, 255, 0)  # Green for faces
-            thickness = 3
-        else:  # license_plate
-            color = (0, 0, 255)  # Red for license plates
-            thickness = 3
-        
-        # Draw rectangle
-        cv2.rectangle(image, (x1, y1), (x2, y2), color, thickness)
+    # Draw bounding boxes: one polylines call per class
+    boxes, conf, faces = detections_soa(detections['detections'])
+    cv2.polylines(image, list(box_quads(boxes[faces])), True, CLASS_COLORS[1], BOX_THICK)   # Green for faces
+    cv2.polylines(image, list(box_quads(boxes[~faces])), True, CLASS_COLORS[0], BOX_THICK)  # Red for license plates
+    
+    # Labels stay per box (putText has no batched form)
+    for (x1, y1, x2, y2), confidence, is_face in zip(boxes.tolist(), conf.tolist(), faces.tolist()):
+        label = LABELS[is_face]
+        color = CLASS_COLORS[is_face]
         
         # Draw label with confidence
         label_text = f"{label}: {confidence:.3f}"
-        label_size = cv2.getTextSize(label_text, cv2.FONT_HERSHEY_SIMPLEX, 0.7, 2)[0]
+        label_size = text_size(label_text, FSCALE, FTHICK)
         
         # Draw background for text
         cv2.rectangle(image, (x1, y1 - label_size[1] - 10), 
@@ -138,14 +143,14 @@ def visualize_detections(image_path, detections, save_path=None):
         
         # Draw text
         cv2.putText(image, label_text, (x1, y1 - 5), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+                   FONT, FSCALE, WHITE, FTHICK)
         
         print(f"   📍 {label}: BBox({x1}, {y1}, {x2}, {y2}) - Conf: {confidence:.3f}")
     
     # Save image if path provided
     if save_path:
         os.makedirs(os.path.dirname(save_path), exist_ok=True)
-        cv2.imwrite(save_path, image)
+        cv2.imwrite(save_path, image, DEBUG_JPEG)
         print(f"💾 Visualization saved: {save_path}")
     
     return image
@@ -153,17 +158,9 @@ def visualize_detections(image_path, detections, save_path=None):
 def display_image(image, title="Detection Results"):
     """Display image with OpenCV"""
     # Resize image if too large
-    height, width = image.shape[:2]
-    if width > 1200 or height > 800:
-        scale = min(1200/width, 800/height)
-        new_width = int(width * scale)
-        new_height = int(height * scale)
-        image = cv2.resize(image, (new_width, new_height))
-    
-    cv2.imshow(title, image)
-    print(f"\n⌨️  Press any key to continue...")
-    cv2.waitKey(0)
-    cv2.destroyAllWindows()
+    image = fit_for_display(image)
+    
+    show_image(image, title)
 
 def main():
     """Main demo function"""
@@ -182,60 +179,69 @@ def main():
     # Create output directory
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     
+    # Read and decode the image once; every demo below reuses them
+    with open(IMAGE_PATH, 'rb') as f:
+        image_bytes = f.read()
+    filename = os.path.basename(IMAGE_PATH)
+    source = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if source is None:
+        print(f"❌ Could not load image: {IMAGE_PATH}")
+        return
+    
     # Demo 1: Detect both faces and license plates
     print_header("DEMO 1: DETECT FACES AND LICENSE PLATES")
-    detections = detect_objects(IMAGE_PATH, detect_face=True, detect_lp=True)
+    detections = detect_objects(image_bytes, filename, detect_face=True, detect_lp=True)
     
     if detections and detections['detections']:
         # Visualize detections
-        image = visualize_detections(IMAGE_PATH, detections, 
+        image = visualize_detections(source, detections, 
                                    f"{OUTPUT_DIR}/detections.jpg")
         if image is not None:
             display_image(image, "Detections - Faces & License Plates")
     
     # Demo 2: Detect only faces
     print_header("DEMO 2: DETECT FACES ONLY")
-    face_detections = detect_objects(IMAGE_PATH, detect_face=True, detect_lp=False)
+    face_detections = detect_objects(image_bytes, filename, detect_face=True, detect_lp=False)
     
     if face_detections and face_detections['detections']:
-        image = visualize_detections(IMAGE_PATH, face_detections, 
+        image = visualize_detections(source, face_detections, 
                                    f"{OUTPUT_DIR}/faces_only.jpg")
         if image is not None:
             display_image(image, "Detections - Faces Only")
     
     # Demo 3: Detect only license plates
     print_header("DEMO 3: DETECT LICENSE PLATES ONLY")
-    plate_detections = detect_objects(IMAGE_PATH, detect_face=False, detect_lp=True)
+    plate_detections = detect_objects(image_bytes, filename, detect_face=False, detect_lp=True)
     
     if plate_detections and plate_detections['detections']:
-        image = visualize_detections(IMAGE_PATH, plate_detections, 
+        image = visualize_detections(source, plate_detections, 
                                    f"{OUTPUT_DIR}/plates_only.jpg")
         if image is not None:
             display_image(image, "Detections - License Plates Only")
     
     # Demo 4: Blur objects
     print_header("DEMO 4: BLUR DETECTED OBJECTS")
-    blur_result = blur_objects(IMAGE_PATH, detect_face=True, detect_lp=True, 
+    blur_result = blur_objects(image_bytes, filename, detect_face=True, detect_lp=True, 
                               face_blur=30, plate_blur=25)
     
     if blur_result:
         # Load and display blurred image
         blurred_path = blur_result['blurred_image_path']
         if os.path.exists(blurred_path):
-            blurred_image = cv2.imread(blurred_path)
+            blurred_image = read_image(blurred_path)
             if blurred_image is not None:
-                # Copy to output directory
+                # Copy to output directory (the file as-is, no re-encode)
                 output_blur_path = f"{OUTPUT_DIR}/blurred_result.jpg"
-                cv2.imwrite(output_blur_path, blurred_image)
+                shutil.copyfile(blurred_path, output_blur_path)
                 print(f"💾 Blurred image copied to: {output_blur_path}")
                 display_image(blurred_image, "Blurred Image")
     
     # Demo 5: Show API information
     print_header("DEMO 5: API INFORMATION")
     try:
-        response = requests.get(f"{BASE_URL}/", timeout=5)
+        response = SESSION.get(f"{BASE_URL}/", timeout=5)
         if response.status_code == 200:
-            api_info = response.json()
+            api_info = orjson.loads(response.content)
             print("📋 API Information:")
             print(f"   Name: {api_info.get('message', 'N/A')}")
             print(f"   Version: {api_info.get('version', 'N/A')}")
@@ -3,74 +3,80 @@
 Show Detection Results with OpenCV
 """
 
-import requests
+import asyncio
+import orjson
+from http_session import SESSION
+import aiohttp
 import cv2
 import os
 import time
+from visualizer import CLASS_COLORS, box_quads, detections_soa, make_grid, read_image, show_image
 
-def show_image_detections(server_url, image_path):
-    """Show detections for a single image"""
-    print(f"\n📸 Processing: {os.path.basename(image_path)}")
-    print("-" * 50)
-    
-    # Call detection API
+# Label/box style, resolved once instead of per box
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+FSCALE = 0.6
+FTHICK = 2
+BOX_THICK = 2
+LABELS = ('license_plate', 'face')  # indexed by is_face
+
+async def fetch_detections(session, server_url, image_path, limit):
+    """Call the detection API for one image; the parsed result, or None on error"""
     try:
         with open(image_path, 'rb') as f:
-            files = {'file': (os.path.basename(image_path), f, 'image/png')}
-            data = {'detect_face': True, 'detect_license_plate': True}
-            
-            response = requests.post(f"{server_url}/detect", files=files, data=data, timeout=60)
-            
-            if response.status_code == 200:
-                result = response.json()
-                print(f"✅ API Response: {result['message']}")
-                print(f"📊 Faces: {result['total_faces']}, License Plates: {result['total_license_plates']}")
-                print(f"⏱️  Processing time: {result['processing_time_ms']}ms")
-                
-                # Load and display image
-                image = cv2.imread(image_path)
-                if image is None:
-                    print("❌ Could not load image")
-                    return
-                
-                # Draw bounding boxes
-                for detection in result['detections']:
-                    x1, y1, x2, y2 = detection['x1'], detection['y1'], detection['x2'], detection['y2']
-                    confidence = detection['confidence']
-                    label = detection['label']
-                    
-                    # Choose color
-                    color = (0, 255, 0) if label == 'face' else (0, 0, 255)  # Green for faces, Red for plates
-                    
-                    # Draw box
-                    cv2.rectangle(image, (x1, y1), (x2, y2), color, 2)
-                    
-                    # Draw label
-                    label_text = f"{label}: {confidence:.3f}"
-                    cv2.putText(image, label_text, (x1, y1-10), 
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-                    
-                    print(f"   📍 {label}: BBox({x1}, {y1}, {x2}, {y2}) - Conf: {confidence:.3f}")
-                
-                # Resize for display
-                height, width = image.shape[:2]
-                if width > 1200 or height > 800:
-                    scale = min(1200/width, 800/height)
-                    new_width = int(width * scale)
-                    new_height = int(height * scale)
-                    image = cv2.resize(image, (new_width, new_height))
-                
-                # Show image
-                cv2.imshow(f"Detections: {os.path.basename(image_path)}", image)
-                print(f"\n⌨️  Press any key to continue to next image...")
-                cv2.waitKey(0)
-                cv2.destroyAllWindows()
-                
-            else:
-                print(f"❌ API Error: {response.status_code}")
-                
+            content = f.read()
+        form = aiohttp.FormData()
+        form.add_field('file', content, filename=os.path.basename(image_path), content_type='image/png')
+        form.add_field('detect_face', 'true')
+        form.add_field('detect_license_plate', 'true')
+        async with limit, session.post(f"{server_url}/detect", data=form) as response:
+            if response.status == 200:
+                return await response.json(loads=orjson.loads)
+            print(f"❌ API Error for {os.path.basename(image_path)}: {response.status}")
     except Exception as e:
-        print(f"❌ Error: {e}")
+        print(f"❌ Error for {os.path.basename(image_path)}: {e}")
+    return None
+
+async def fetch_all(server_url, images, concurrency=4):
+    """Detections for every image, requested concurrently before anything is shown"""
+    limit = asyncio.Semaphore(concurrency)
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=60 * len(images))) as session:
+        return await asyncio.gather(*(fetch_detections(session, server_url, p, limit) for p in images))
+
+def draw_image_detections(image_path, result):
+    """Print and draw the detections for one image; the annotated frame, or None"""
+    print(f"\n📸 Processing: {os.path.basename(image_path)}")
+    print("-" * 50)
+    
+    if result is None:
+        return None
+    
+    print(f"✅ API Response: {result['message']}")
+    print(f"📊 Faces: {result['total_faces']}, License Plates: {result['total_license_plates']}")
+    print(f"⏱️  Processing time: {result['processing_time_ms']}ms")
+    
+    # Load and display image
+    image = read_image(image_path)
+    if image is None:
+        print("❌ Could not load image")
+        return None
+    
+    # Draw bounding boxes: one polylines call per class
+    boxes, conf, faces = detections_soa(result['detections'])
+    cv2.polylines(image, list(box_quads(boxes[faces])), True, CLASS_COLORS[1], BOX_THICK)   # Green for faces
+    cv2.polylines(image, list(box_quads(boxes[~faces])), True, CLASS_COLORS[0], BOX_THICK)  # Red for plates
+    
+    for (x1, y1, x2, y2), confidence, is_face in zip(boxes.tolist(), conf.tolist(), faces.tolist()):
+        label = LABELS[is_face]
+        color = CLASS_COLORS[is_face]
+        
+        # Draw label
+        label_text = f"{label}: {confidence:.3f}"
+        cv2.putText(image, label_text, (x1, y1-10), 
+                   FONT, FSCALE, color, FTHICK)
+        
+        print(f"   📍 {label}: BBox({x1}, {y1}, {x2}, {y2}) - Conf: {confidence:.3f}")
+    
+    return image
 
 def main():
     """Main function"""
@@ -81,7 +87,7 @@ def main():
     
     # Check server
     try:
-        response = requests.get(f"{server_url}/health", timeout=5)
+        response = SESSION.get(f"{server_url}/health", timeout=5)
         if response.status_code != 200:
             print("❌ Server not running")
             return
@@ -99,14 +105,27 @@ def main():
     
     print(f"\n📸 Showing detections for {len(images)} images...")
     
-    for i, image_path in enumerate(images):
-        if os.path.exists(image_path):
-            print(f"\n{'='*60}")
-            print(f"IMAGE {i+1}/{len(images)}")
-            show_image_detections(server_url, image_path)
-        else:
+    found = [p for p in images if os.path.exists(p)]
+    for image_path in images:
+        if image_path not in found:
             print(f"⚠️  Image not found: {image_path}")
     
+    # All API calls up front, then every annotated frame in one window
+    start = time.perf_counter()
+    results = asyncio.run(fetch_all(server_url, found))
+    print(f"⏱️  {len(found)} detections fetched in {time.perf_counter() - start:.2f}s")
+    
+    frames = []
+    for i, (image_path, result) in enumerate(zip(found, results)):
+        print(f"\n{'='*60}")
+        print(f"IMAGE {i+1}/{len(found)}")
+        frame = draw_image_detections(image_path, result)
+        if frame is not None:
+            frames.append(frame)
+    
+    if frames:
+        show_image(make_grid(frames), f"Detections ({len(frames)} images)", "close")
+    
     print(f"\n🎉 All images processed!")
 
 if __name__ == "__main__":
@@ -3,75 +3,78 @@
 Simple Test Script - One Image, All Endpoints
 """
 
-import requests
+import orjson
+from http_session import SESSION
+from requests_toolbelt import MultipartEncoder
 import cv2
+import numpy as np
 import os
+from functools import lru_cache
+from visualizer import CLASS_COLORS, DEBUG_JPEG, detections_soa, read_image, show_image
 
 # Configuration
 BASE_URL = "http://localhost:8000"
 IMAGE_PATH = "test_images/frame_000000.png"  # Change this to your image
 
+@lru_cache(maxsize=1)
+def image_bytes():
+    """IMAGE_PATH read once; both tests upload (and decode) these bytes"""
+    with open(IMAGE_PATH, 'rb') as f:
+        return f.read()
+
 def test_detection():
     """Test detection endpoint"""
     print("🔍 Testing Detection API...")
     
-    with open(IMAGE_PATH, 'rb') as f:
-        files = {'file': (os.path.basename(IMAGE_PATH), f, 'image/png')}
-        data = {'detect_face': True, 'detect_license_plate': True}
+    form = MultipartEncoder(fields={'file': (os.path.basename(IMAGE_PATH), image_bytes(), 'image/png'),
+                                    'detect_face': 'True', 'detect_license_plate': 'True'})
+    
+    response = SESSION.post(f"{BASE_URL}/detect", data=form, headers={'Content-Type': form.content_type})
+    
+    if response.status_code == 200:
+        result = orjson.loads(response.content)
+        print(f"✅ Found {result['total_faces']} faces, {result['total_license_plates']} license plates")
+        
+        # Draw bounding boxes on the uploaded bytes, decoded in memory (no second file read)
+        image = cv2.imdecode(np.frombuffer(image_bytes(), np.uint8), cv2.IMREAD_COLOR)
+        boxes, conf, faces = detections_soa(result['detections'])
+        for (x1, y1, x2, y2), confidence, is_face in zip(boxes.tolist(), conf.tolist(), faces.tolist()):
+            color = CLASS_COLORS[is_face]
+            cv2.rectangle(image, (x1, y1), (x2, y2), color, 2)
+            cv2.putText(image, f"{'face' if is_face else 'license_plate'}: {confidence:.3f}", 
+                       (x1, y1-10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
         
-        response = requests.post(f"{BASE_URL}/detect", files=files, data=data)
+        # Save and show
+        cv2.imwrite("demo_output.jpg", image, DEBUG_JPEG)
+        print("💾 Saved: demo_output.jpg")
         
-        if response.status_code == 200:
-            result = response.json()
-            print(f"✅ Found {result['total_faces']} faces, {result['total_license_plates']} license plates")
-            
-            # Draw bounding boxes
-            image = cv2.imread(IMAGE_PATH)
-            for detection in result['detections']:
-                x1, y1, x2, y2 = detection['x1'], detection['y1'], detection['x2'], detection['y2']
-                color = (0, 255, 0) if detection['label'] == 'face' else (0, 0, 255)
-                cv2.rectangle(image, (x1, y1), (x2, y2), color, 2)
-                cv2.putText(image, f"{detection['label']}: {detection['confidence']:.3f}", 
-                           (x1, y1-10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-            
-            # Save and show
-            cv2.imwrite("demo_output.jpg", image)
-            print("💾 Saved: demo_output.jpg")
-            
-            # Display
-            cv2.imshow("Detection Results", image)
-            print("⌨️  Press any key to continue...")
-            cv2.waitKey(0)
-            cv2.destroyAllWindows()
-            
-        else:
-            print(f"❌ Error: {response.status_code}")
+        # Display
+        show_image(image, "Detection Results")
+        
+    else:
+        print(f"❌ Error: {response.status_code}")
 
 def test_blur():
     """Test blur endpoint"""
     print("\n🔒 Testing Blur API...")
     
-    with open(IMAGE_PATH, 'rb') as f:
-        files = {'file': (os.path.basename(IMAGE_PATH), f, 'image/png')}
-        data = {'detect_face': True, 'detect_license_plate': True, 
-                'face_blur_strength': 25, 'plate_blur_strength': 20}
-        
-        response = requests.post(f"{BASE_URL}/blur", files=files, data=data)
+    form = MultipartEncoder(fields={'file': (os.path.basename(IMAGE_PATH), image_bytes(), 'image/png'),
+                                    'detect_face': 'True', 'detect_license_plate': 'True',
+                                    'face_blur_strength': '25', 'plate_blur_strength': '20'})
+    
+    response = SESSION.post(f"{BASE_URL}/blur", data=form, headers={'Content-Type': form.content_type})
+    
+    if response.status_code == 200:
+        result = orjson.loads(response.content)
+        print(f"✅ Blurred {result['detections_applied']} objects")
+        print(f"💾 Saved: {result['blurred_image_path']}")
         
-        if response.status_code == 200:
-            result = response.json()
-            print(f"✅ Blurred {result['detections_applied']} objects")
-            print(f"💾 Saved: {result['blurred_image_path']}")
-            
-            # Load and show blurred image
-            blurred_image = cv2.imread(result['blurred_image_path'])
-            if blurred_image is not None:
-                cv2.imshow("Blurred Image", blurred_image)
-                print("⌨️  Press any key to continue...")
-                cv2.waitKey(0)
-                cv2.destroyAllWindows()
-        else:
-            print(f"❌ Error: {response.status_code}")
+        # Load and show blurred image
+        blurred_image = read_image(result['blurred_image_path'])
+        if blurred_image is not None:
+            show_image(blurred_image, "Blurred Image")
+    else:
+        print(f"❌ Error: {response.status_code}")
 
 def main():
     print("🚀 Simple Detection Test")
@@ -84,7 +87,7 @@ def main():
     
     # Check server
     try:
-        response = requests.get(f"{BASE_URL}/health", timeout=5)
+        response = SESSION.get(f"{BASE_URL}/health", timeout=5)
         if response.status_code != 200:
             print("❌ Server not running")
             return
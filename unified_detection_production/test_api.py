@@ -3,79 +3,133 @@
 Test the Unified Detection API
 """
 
-import requests
-import json
+import asyncio
+import orjson
+from http_session import SESSION
 import time
 import os
-from pathlib import Path
+from functools import lru_cache
+import aiohttp
 
-def test_detection_api(server_url, image_path):
+# Cap on requests in flight (the server overlaps uploads with inference)
+MAX_CONCURRENCY = 16
+
+def _form(image_path, content, **fields):
+    """Multipart body for one image; the bytes are read once and reused by every request"""
+    form = aiohttp.FormData()
+    form.add_field('file', content, filename=os.path.basename(image_path), content_type='image/png')
+    for name, value in fields.items():
+        form.add_field(name, str(value).lower() if isinstance(value, bool) else str(value))
+    return form
+
+async def test_detection_api(session, server_url, image_path, content, limit):
     """Test detection API"""
-    print(f"🔍 Testing detection API with {os.path.basename(image_path)}")
+    # Lines are printed together once the response is in, so concurrent tests don't interleave
+    lines = [f"🔍 Testing detection API with {os.path.basename(image_path)}"]
     
     try:
-        with open(image_path, 'rb') as f:
-            files = {'file': (os.path.basename(image_path), f, 'image/png')}
-            data = {
-                'detect_face': True,
-                'detect_license_plate': True
-            }
-            
-            response = requests.post(f"{server_url}/detect", files=files, data=data, timeout=60)
-            
-            if response.status_code == 200:
-                result = response.json()
-                print(f"   ✅ Success: {result['message']}")
-                print(f"   📊 Faces: {result['total_faces']}, License Plates: {result['total_license_plates']}")
-                print(f"   ⏱️  Processing time: {result['processing_time_ms']}ms")
+        form = _form(image_path, content, detect_face=True, detect_license_plate=True)
+        async with limit, session.post(f"{server_url}/detect", data=form) as response:
+            if response.status == 200:
+                result = await response.json(loads=orjson.loads)
+                lines.append(f"   ✅ Success: {result['message']}")
+                lines.append(f"   📊 Faces: {result['total_faces']}, License Plates: {result['total_license_plates']}")
+                lines.append(f"   ⏱️  Processing time: {result['processing_time_ms']}ms")
                 
                 for i, detection in enumerate(result['detections']):
-                    print(f"      {i+1}. {detection['label']}: BBox({detection['x1']}, {detection['y1']}, {detection['x2']}, {detection['y2']}) - Conf: {detection['confidence']:.3f}")
+                    lines.append(f"      {i+1}. {detection['label']}: BBox({detection['x1']}, {detection['y1']}, {detection['x2']}, {detection['y2']}) - Conf: {detection['confidence']:.3f}")
                 
                 return True
             else:
-                print(f"   ❌ Error: {response.status_code} - {response.text}")
+                lines.append(f"   ❌ Error: {response.status} - {await response.text()}")
                 return False
                 
     except Exception as e:
-        print(f"   ❌ Exception: {str(e)}")
+        lines.append(f"   ❌ Exception: {str(e)}")
         return False
+    finally:
+        print("\n".join(lines))
 
-def test_blur_api(server_url, image_path):
+async def test_blur_api(session, server_url, image_path, content, limit):
     """Test blur API"""
-    print(f"🔒 Testing blur API with {os.path.basename(image_path)}")
+    lines = [f"🔒 Testing blur API with {os.path.basename(image_path)}"]
     
     try:
-        with open(image_path, 'rb') as f:
-            files = {'file': (os.path.basename(image_path), f, 'image/png')}
-            data = {
-                'detect_face': True,
-                'detect_license_plate': True,
-                'face_blur_strength': 25,
-                'plate_blur_strength': 20
-            }
-            
-            response = requests.post(f"{server_url}/blur", files=files, data=data, timeout=60)
-            
-            if response.status_code == 200:
-                result = response.json()
-                print(f"   ✅ Success: {result['message']}")
-                print(f"   🔒 Objects blurred: {result['detections_applied']}")
-                print(f"   💾 Output: {result['blurred_image_path']}")
-                print(f"   ⏱️  Processing time: {result['processing_time_ms']}ms")
+        form = _form(image_path, content, detect_face=True, detect_license_plate=True,
+                     face_blur_strength=25, plate_blur_strength=20)
+        async with limit, session.post(f"{server_url}/blur", data=form) as response:
+            if response.status == 200:
+                result = await response.json(loads=orjson.loads)
+                lines.append(f"   ✅ Success: {result['message']}")
+                lines.append(f"   🔒 Objects blurred: {result['detections_applied']}")
+                lines.append(f"   💾 Output: {result['blurred_image_path']}")
+                lines.append(f"   ⏱️  Processing time: {result['processing_time_ms']}ms")
                 return True
             else:
-                print(f"   ❌ Error: {response.status_code} - {response.text}")
+                lines.append(f"   ❌ Error: {response.status} - {await response.text()}")
                 return False
                 
     except Exception as e:
-        print(f"   ❌ Exception: {str(e)}")
+        lines.append(f"   ❌ Exception: {str(e)}")
         return False
+    finally:
+        print("\n".join(lines))
 
+async def detect_many(session, server_url, images, max_workers=4):
+    """Detect on {path: bytes} with one multipart upload to /process-parallel (one inference round)"""
+    form = aiohttp.FormData()
+    for image_path, content in images.items():
+        form.add_field('files', content, filename=os.path.basename(image_path), content_type='image/png')
+    form.add_field('detect_face', 'true')
+    form.add_field('detect_license_plate', 'true')
+    form.add_field('max_workers', str(max_workers))
+    async with session.post(f"{server_url}/process-parallel", data=form) as response:
+        response.raise_for_status()
+        return await response.json(loads=orjson.loads)
+
+async def test_batch_api(server_url, test_images):
+    """Test batched detection: every image in a single request"""
+    lines = [f"📦 Testing batched detection with {len(test_images)} images"]
+    images = {}
+    for image_path in test_images:
+        with open(image_path, 'rb') as f:
+            images[image_path] = f.read()
+    
+    try:
+        timeout = aiohttp.ClientTimeout(total=60 * len(test_images))
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            result = await detect_many(session, server_url, images)
+        lines.append(f"   ✅ Success: {result['message']}")
+        for item in result['results']:
+            detection = item['detection']
+            lines.append(f"      {item['filename']}: {detection['total_faces']} faces, {detection['total_license_plates']} plates")
+        lines.append(f"   ⏱️  Total: {result['total_processing_time_ms']:.1f}ms, {result['average_time_per_image_ms']:.1f}ms/image")
+        return result['failed_count'] == 0
+    except Exception as e:
+        lines.append(f"   ❌ Exception: {str(e)}")
+        return False
+    finally:
+        print("\n".join(lines))
+
+async def run_tests(server_url, test_images, concurrency=None):
+    """Detection + blur for every image, all dispatched at once (at most `concurrency` in flight)"""
+    # Default: every request at once, up to MAX_CONCURRENCY
+    limit = asyncio.Semaphore(concurrency or min(MAX_CONCURRENCY, 2 * len(test_images)) or 1)
+    timeout = aiohttp.ClientTimeout(total=60 * len(test_images))
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        tests = []
+        for image_path in test_images:
+            with open(image_path, 'rb') as f:
+                content = f.read()
+            tests.append(test_detection_api(session, server_url, image_path, content, limit))
+            tests.append(test_blur_api(session, server_url, image_path, content, limit))
+        return await asyncio.gather(*tests)
+
+@lru_cache(maxsize=4)
 def test_health(server_url):
-    """Test health endpoint"""
+    """Test health endpoint (once per server per run)"""
     try:
-        response = requests.get(f"{server_url}/health", timeout=5)
+        response = SESSION.get(f"{server_url}/health", timeout=5)
         if response.status_code == 200:
             print("✅ Health check passed")
             return True
@@ -108,25 +162,25 @@ def main():
     
     print(f"\n📸 Testing with {len(test_images)} images...")
     
-    success_count = 0
     total_tests = len(test_images) * 2  # detection + blur for each image
     
-    for i, image_path in enumerate(test_images):
-        if not os.path.exists(image_path):
+    found = []
+    for image_path in test_images:
+        if os.path.exists(image_path):
+            found.append(image_path)
+        else:
             print(f"⚠️  Image not found: {image_path}")
-            continue
-        
-        print(f"\n{'='*60}")
-        print(f"📸 Image {i+1}: {os.path.basename(image_path)}")
-        print('='*60)
-        
-        # Test detection
-        if test_detection_api(server_url, image_path):
-            success_count += 1
-        
-        # Test blur
-        if test_blur_api(server_url, image_path):
-            success_count += 1
+    
+    start = time.perf_counter()
+    success_count = sum(asyncio.run(run_tests(server_url, found)))
+    print(f"\n⏱️  {len(found) * 2} requests in {time.perf_counter() - start:.2f}s")
+    
+    if found:
+        start = time.perf_counter()
+        batch_ok = asyncio.run(test_batch_api(server_url, found))
+        print(f"⏱️  1 batched request in {time.perf_counter() - start:.2f}s")
+        success_count += batch_ok
+        total_tests += 1
     
     print(f"\n🎉 Testing completed!")
     print(f"📊 Success rate: {success_count}/{total_tests} ({success_count/total_tests*100:.1f}%)")
@@ -6,6 +6,7 @@ Test script for license plate detection with maximum confidence selection
 import cv2
 import numpy as np
 from detect_lp import DetectLP
+from visualizer import DEBUG_JPEG, box_quads, read_image
 
 def test_license_plate_detection():
     """Test the updated license plate detection"""
@@ -25,7 +26,7 @@ def test_license_plate_detection():
     
     try:
         # Load test image
-        image = cv2.imread(test_image_path)
+        image = read_image(test_image_path)
         if image is None:
             print(f"❌ Could not load test image: {test_image_path}")
             print("Please ensure you have a test image available")
@@ -83,37 +84,35 @@ def test_license_plate_detection():
         import traceback
         traceback.print_exc()
 
+# Blank white frame; each test image starts from a copy
+_BLANK = np.full((600, 800, 3), 255, dtype=np.uint8)
+
 def create_test_image():
     """Create a simple test image with multiple rectangles to simulate vehicles"""
     print("\n🎨 Creating test image...")
+    img = _BLANK.copy()
     
-    # Create a white image
-    img = np.ones((600, 800, 3), dtype=np.uint8) * 255
-    
-    # Draw some rectangles to simulate vehicles
-    vehicles = [
+    # Rectangles simulating vehicles, with a plate-sized box inside each
+    vehicles = np.array([
         (100, 100, 200, 150),  # Vehicle 1
         (300, 200, 450, 280),  # Vehicle 2
         (500, 100, 650, 180),  # Vehicle 3
-    ]
+    ], np.int32)
+    plates = np.empty_like(vehicles)
+    plates[:, 0] = vehicles[:, 0] + 10
+    plates[:, 1] = (vehicles[:, 1] + vehicles[:, 3]) // 2
+    plates[:, 2:] = plates[:, :2] + (80, 20)
     
-    for i, (x1, y1, x2, y2) in enumerate(vehicles):
-        # Draw vehicle rectangle
-        cv2.rectangle(img, (x1, y1), (x2, y2), (0, 0, 255), 2)
+    # All boxes of one color in a single call; text has no batched form
+    cv2.polylines(img, list(box_quads(vehicles)), True, (0, 0, 255), 2)
+    cv2.polylines(img, list(box_quads(plates)), True, (0, 255, 0), 2)
+    for i, ((x1, y1, _, _), (px1, py1, _, _)) in enumerate(zip(vehicles.tolist(), plates.tolist())):
         cv2.putText(img, f"Vehicle {i+1}", (x1, y1-10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-        
-        # Draw some rectangles inside to simulate license plates
-        plate_x1 = x1 + 10
-        plate_y1 = y1 + (y2-y1)//2
-        plate_x2 = plate_x1 + 80
-        plate_y2 = plate_y1 + 20
-        
-        cv2.rectangle(img, (plate_x1, plate_y1), (plate_x2, plate_y2), (0, 255, 0), 2)
-        cv2.putText(img, f"LP{i+1}", (plate_x1, plate_y1-5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+        cv2.putText(img, f"LP{i+1}", (px1, py1-5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
     
     # Save test image
     test_path = "test_vehicles.jpg"
-    cv2.imwrite(test_path, img)
+    cv2.imwrite(test_path, img, DEBUG_JPEG)
     print(f"✅ Test image created: {test_path}")
     return test_path
 
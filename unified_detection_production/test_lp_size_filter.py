@@ -3,9 +3,9 @@
 Test script for license plate detection with 30% vehicle area size filter
 """
 
-import cv2
 import numpy as np
 from detect_lp import DetectLP
+from visualizer import read_image
 
 def test_license_plate_size_filter():
     """Test the updated license plate detection with size filtering"""
@@ -25,7 +25,7 @@ def test_license_plate_size_filter():
     
     try:
         # Load test image
-        image = cv2.imread(test_image_path)
+        image = read_image(test_image_path)
         if image is None:
             print(f"❌ Could not load test image: {test_image_path}")
             print("Please ensure you have a test image available")
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+Test read_image's reduced decode against EXIF-rotated JPEGs
+"""
+
+import os
+import tempfile
+import numpy as np
+from PIL import Image
+from detect_face_v2 import read_image
+
+def test_rotated_jpeg():
+    """A 4000x3000 phone photo with orientation=6 must map back with scale 2.0 and (H, W) = (4000, 3000)"""
+    print("🧪 Testing reduced decode of an EXIF-rotated JPEG")
+    path = os.path.join(tempfile.mkdtemp(), "rotated.jpg")
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotate 90 CW on display
+    Image.fromarray(np.zeros((3000, 4000, 3), np.uint8)).save(path, exif=exif)
+
+    img, scale, size = read_image(path, detector_size=1280)
+    print(f"   decoded {img.shape[:2]}, scale {scale}, size {size}")
+    assert img.shape[:2] == (2000, 1500), img.shape
+    assert scale == 2.0, scale
+    assert size == (4000, 3000), size
+    print("✅ Rotated JPEG maps back correctly")
+
+if __name__ == "__main__":
+    test_rotated_jpeg()
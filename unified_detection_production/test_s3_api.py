@@ -4,7 +4,8 @@ Test S3 API Endpoints
 Test the S3 processing functionality
 """
 
-import requests
+import orjson
+from http_session import SESSION
 import json
 import os
 from typing import Dict, Any
@@ -30,8 +31,8 @@ def test_s3_credentials():
         params['aws_session_token'] = aws_session_token
     
     try:
-        response = requests.get(f"{BASE_URL}/s3/test-credentials", params=params)
-        result = response.json()
+        response = SESSION.get(f"{BASE_URL}/s3/test-credentials", params=params)
+        result = orjson.loads(response.content)
         
         if result['success']:
             print("✅ S3 credentials are valid")
@@ -64,13 +65,13 @@ def test_s3_single_image():
     }
     
     try:
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/s3/process-single",
             json=request_data,
             headers={"Content-Type": "application/json"}
         )
         
-        result = response.json()
+        result = orjson.loads(response.content)
         
         if result['success']:
             print("✅ Single image processing successful")
@@ -108,13 +109,13 @@ def test_s3_folder():
     }
     
     try:
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/s3/process-folder",
             json=request_data,
             headers={"Content-Type": "application/json"}
         )
         
-        result = response.json()
+        result = orjson.loads(response.content)
         
         if result['success']:
             print("✅ Folder processing successful")
@@ -139,7 +140,7 @@ def test_api_health():
     print("🏥 Testing API health...")
     
     try:
-        response = requests.get(f"{BASE_URL}/health")
+        response = SESSION.get(f"{BASE_URL}/health")
         if response.status_code == 200:
             print("✅ API is running")
             return True
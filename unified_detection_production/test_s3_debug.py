@@ -3,7 +3,8 @@
 Test S3 API endpoints with debugging
 """
 
-import requests
+import orjson
+from http_session import SESSION
 import json
 import os
 
@@ -26,8 +27,8 @@ def test_s3_credentials():
         params['aws_session_token'] = aws_session_token
     
     try:
-        response = requests.get(f"{API_BASE_URL}/s3/test-credentials", params=params)
-        result = response.json()
+        response = SESSION.get(f"{API_BASE_URL}/s3/test-credentials", params=params)
+        result = orjson.loads(response.content)
         
         print(f"Status: {response.status_code}")
         print(f"Response: {json.dumps(result, indent=2)}")
@@ -64,13 +65,13 @@ def test_s3_list_folder():
     }
     
     try:
-        response = requests.post(
+        response = SESSION.post(
             f"{API_BASE_URL}/s3/list-folder",
             json=request_data,
             headers={'Content-Type': 'application/json'}
         )
         
-        result = response.json()
+        result = orjson.loads(response.content)
         
         print(f"Status: {response.status_code}")
         print(f"Response: {json.dumps(result, indent=2)}")
@@ -115,14 +116,14 @@ def test_s3_single_image():
     
     try:
         print("🚀 Processing image...")
-        response = requests.post(
+        response = SESSION.post(
             f"{API_BASE_URL}/s3/process-single",
             json=request_data,
             headers={'Content-Type': 'application/json'},
             timeout=300  # 5 minutes timeout
         )
         
-        result = response.json()
+        result = orjson.loads(response.content)
         
         print(f"Status: {response.status_code}")
         print(f"Response: {json.dumps(result, indent=2)}")
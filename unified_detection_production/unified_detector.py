@@ -1,17 +1,48 @@
 """
 Unified Detection System
+On CUDA devices the face and license plate detectors run concurrently, the
+plate models on their own CUDA stream, so their GPU work overlaps.
 """
 
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import numpy as np
 from detect_face_v2_wrapper import DetectFace
 from detect_lp import DetectLP
+from devices import torch_device
+
+# Runs the plate detector next to the face detector (GPU devices only)
+_LP_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="detect-lp")
+
+def results_to_arrays(results):
+    """
+    detect_objects() lists -> SoA {'faces': {'bbox': (N, 4) float32, 'conf': (N,) float32}, 'license_plates': {...}}
+    for vectorized filtering; the visualizer's draw/blur accept either form
+    """
+    faces = results.get('faces', [])
+    plates = results.get('license_plates', [])
+    face_rows = np.asarray([f[:5] for f in faces], np.float32).reshape(-1, 5)
+    return {
+        'faces': {'bbox': face_rows[:, :4], 'conf': face_rows[:, 4]},
+        'license_plates': {
+            'bbox': np.asarray([p['bbox'] for p in plates], np.float32).reshape(-1, 4),
+            'conf': np.asarray([p['confidence'] for p in plates], np.float32)
+        }
+    }
 
 class UnifiedDetector:
     def __init__(self):
         self.face_detector = None
         self.lp_detector = None
         self._initialize_detectors()
+        
+        # Face and plate models are different networks, so overlap them instead of sharing a pass;
+        # on CPU they would only contend for the same cores
+        self._lp_stream = None
+        if torch_device().startswith("cuda"):
+            import torch
+            self._lp_stream = torch.cuda.Stream()
 
     def _initialize_detectors(self):
         """Initialize all detection modules"""
@@ -30,25 +61,62 @@ class UnifiedDetector:
             print(f"❌ Error initializing detectors: {e}")
             raise
 
-    def detect_objects(self, image, detect_face=True, detect_lp=True):
-        """Detect faces and license plates in image"""
+    def _lp_context(self):
+        """The plate detector's CUDA stream (no-op off the GPU)"""
+        if self._lp_stream is None:
+            return contextlib.nullcontext()
+        import torch
+        return torch.cuda.stream(self._lp_stream)
+
+    def _detect_faces(self, image):
+        try:
+            return self.face_detector.detect_faces(image)
+        except Exception as e:
+            print(f"❌ Face detection error: {e}")
+            return []
+
+    def _detect_plates(self, image):
+        try:
+            with self._lp_context():
+                return self.lp_detector.detect_license_plates(image)
+        except Exception as e:
+            print(f"❌ License plate detection error: {e}")
+            return []
+
+    def _detect_faces_batch(self, images):
+        return [self._detect_faces(image) for image in images]
+
+    def _detect_plates_batch(self, images):
+        try:
+            with self._lp_context():
+                return self.lp_detector.detect_license_plates_batch(images)
+        except Exception as e:
+            print(f"❌ License plate detection error: {e}")
+            return [[] for _ in images]
+
+    def _run_both(self, faces_fn, plates_fn, arg, detect_face, detect_lp, empty):
+        """(faces, plates); the plate detector runs on _LP_POOL when both run on a GPU"""
+        detect_face = detect_face and self.face_detector
+        detect_lp = detect_lp and self.lp_detector
+        if detect_face and detect_lp and self._lp_stream is not None:
+            plates = _LP_POOL.submit(plates_fn, arg)
+            return faces_fn(arg), plates.result()
+        return (faces_fn(arg) if detect_face else empty(),
+                plates_fn(arg) if detect_lp else empty())
+
+    def detect_objects(self, image, detect_face=True, detect_lp=True, as_arrays=False):
+        """Detect faces and license plates in image (as_arrays: SoA, see results_to_arrays)"""
+        faces, plates = self._run_both(self._detect_faces, self._detect_plates, image,
+                                       detect_face, detect_lp, list)
         results = {
-            'faces': [],
-            'license_plates': []
+            'faces': faces,
+            'license_plates': plates
         }
-        
-        if detect_face and self.face_detector:
-            try:
-                faces = self.face_detector.detect_faces(image)
-                results['faces'] = faces
-            except Exception as e:
-                print(f"❌ Face detection error: {e}")
-        
-        if detect_lp and self.lp_detector:
-            try:
-                plates = self.lp_detector.detect_license_plates(image)
-                results['license_plates'] = plates
-            except Exception as e:
-                print(f"❌ License plate detection error: {e}")
-        
-        return results
+        return results_to_arrays(results) if as_arrays else results
+
+    def detect_objects_batch(self, images, detect_face=True, detect_lp=True):
+        """detect_objects() for a list of images, with one batched vehicle pass for plates"""
+        empty = lambda: [[] for _ in images]
+        faces, plates = self._run_both(self._detect_faces_batch, self._detect_plates_batch, images,
+                                       detect_face, detect_lp, empty)
+        return [{'faces': f, 'license_plates': p} for f, p in zip(faces, plates)]
@@ -0,0 +1,31 @@
+"""
+Numba Gating Kernels
+"""
+
+import numpy as np
+from nms_numba import NUMBA_AVAILABLE, njit
+
+@njit(cache=True)
+def filter_candidates(F, person_box, head_frac, min_rel, max_rel):
+    """
+    Indices of face rows F[K,5] (xyxy + score) whose center lies in the person's
+    head band and whose height is within [min_rel, max_rel] of the person height
+    """
+    px1, py1, px2, py2 = person_box[0], person_box[1], person_box[2], person_box[3]
+    ph = max(1.0, py2 - py1)
+    by2 = py1 + ph * head_frac
+    keep = np.empty(F.shape[0], np.int64)
+    k = 0
+    for i in range(F.shape[0]):
+        cx = 0.5 * (F[i, 0] + F[i, 2]); cy = 0.5 * (F[i, 1] + F[i, 3])
+        if cx < px1 or cx > px2 or cy < py1 or cy > by2:
+            continue
+        r = max(1.0, F[i, 3] - F[i, 1]) / ph
+        if r < min_rel or r > max_rel:
+            continue
+        keep[k] = i; k += 1
+    return keep[:k]
+
+# compile (or load from cache) at import, not on the first image
+if NUMBA_AVAILABLE:
+    filter_candidates(np.zeros((1, 5)), np.array([0.0, 0.0, 1.0, 1.0]), 0.5, 0.1, 0.5)
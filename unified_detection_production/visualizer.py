@@ -2,10 +2,246 @@
 Visualization Module
 """
 
+import os
+import re
 import cv2
 import numpy as np
-from typing import List, Dict, Union
+from typing import List, Dict, Optional, Union
 from pathlib import Path
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import lru_cache
+from devices import configure_opencv, opencv_cuda, opencv_opencl
+
+def box_quads(boxes) -> np.ndarray:
+    """(N, 4) x1,y1,x2,y2 boxes -> (N, 4, 2) int32 corner quads, for one cv2.polylines call per color"""
+    b = np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+    return b[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 4, 2)
+
+# Hershey digits are monospaced, so every "face: 0.xyz" label shares one cache entry
+_DIGITS_TO_ZERO = str.maketrans("123456789", "000000000")
+
+@lru_cache(maxsize=256)
+def _text_size(text: str, scale: float, thickness: int):
+    return cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, thickness)[0]
+
+def text_size(text: str, scale: float = 0.6, thickness: int = 2):
+    """cv2.getTextSize (FONT_HERSHEY_SIMPLEX) (w, h), memoized per label shape (digits folded to 0)"""
+    return _text_size(text.translate(_DIGITS_TO_ZERO), scale, thickness)
+
+# BGR per class, indexable by the is_face mask (0: plate red, 1: face green)
+CLASS_COLORS = ((0, 0, 255), (0, 255, 0))
+
+def detections_soa(dets: List[Dict]):
+    """API detection dicts -> (boxes (N, 4) int32, confidences (N,) float32, is_face (N,) bool)"""
+    n = len(dets)
+    boxes = np.fromiter((v for d in dets for v in (d['x1'], d['y1'], d['x2'], d['y2'])),
+                        np.int32, 4 * n).reshape(n, 4)
+    conf = np.fromiter((d['confidence'] for d in dets), np.float32, n)
+    is_face = np.fromiter((d['label'] == 'face' for d in dets), bool, n)
+    return boxes, conf, is_face
+
+def _as_arrays(items, kind: str):
+    """
+    Detections -> (boxes (N, 4) int32 x1,y1,x2,y2, confidences (N,) float32), normalized once per frame.
+    items is either SoA {'bbox': (N, 4), 'conf': (N,)} (UnifiedDetector.detect_objects(as_arrays=True))
+    or a list of [x1, y1, x2, y2, confidence] / {'bbox': [x1, y1, x2, y2], 'confidence': score}
+    """
+    if isinstance(items, dict):
+        boxes = np.asarray(items['bbox'], dtype=np.float64).reshape(-1, 4).astype(np.int32)
+        return boxes, np.asarray(items.get('conf', np.zeros(len(boxes))), dtype=np.float32)
+    rows, confs = [], []
+    for item in items:
+        if isinstance(item, dict):
+            bbox, conf = item.get('bbox'), item.get('confidence', 0.0)
+        else:
+            bbox, conf = item, item[4] if isinstance(item, (list, tuple, np.ndarray)) and len(item) >= 5 else 0.0
+        if isinstance(bbox, (list, tuple, np.ndarray)) and len(bbox) >= 4:
+            rows.append(bbox[:4])
+            confs.append(conf)
+        else:
+            print(f"Warning: Invalid {kind} format: {item}")
+    return (np.asarray(rows, dtype=np.float64).astype(np.int32).reshape(-1, 4),
+            np.asarray(confs, dtype=np.float32))
+
+# Kernels above this use the 3-pass box blur instead of a true Gaussian
+FAST_BLUR_MIN_KERNEL = 9
+
+# Per-thread uint8 scratch buffers for ROI intermediates, keyed by role; they only grow
+_scratch_bufs = threading.local()
+
+def _scratch(name: str, shape: tuple) -> np.ndarray:
+    """Contiguous uint8 view of the given shape into this thread's reusable buffer (contents undefined)"""
+    cache = getattr(_scratch_bufs, "cache", None)
+    if cache is None:
+        cache = _scratch_bufs.cache = {}
+    size = int(np.prod(shape))
+    buf = cache.get(name)
+    if buf is None or buf.size < size:
+        buf = cache[name] = np.empty(size, np.uint8)
+    return buf[:size].reshape(shape)
+
+# Kernels from this size up to FAST_BLUR_MIN_KERNEL use sepFilter2D with a cached kernel
+# (~2-3x faster than GaussianBlur on face-sized ROIs; below it GaussianBlur wins)
+SEP_BLUR_MIN_KERNEL = 7
+
+@lru_cache(maxsize=16)
+def _gaussian_kernel(ksize: int) -> np.ndarray:
+    """1D float32 Gaussian taps for ksize (sigma from ksize, as GaussianBlur(..., 0)), built once"""
+    kernel = cv2.getGaussianKernel(ksize, 0).astype(np.float32)
+    kernel.setflags(write=False)
+    return kernel
+
+def _box_width(ksize: int) -> int:
+    """Box width whose 3-pass blur matches GaussianBlur(ksize, sigma=0)"""
+    # OpenCV's sigma for ksize; three boxes of width w have variance (w^2 - 1) / 4.
+    # w is rounded to the nearest odd width: an even box is off-centre by half a pixel per pass
+    sigma = 0.3 * ((ksize - 1) * 0.5 - 1) + 0.8
+    return max(3, 2 * int(round((np.sqrt(4 * sigma * sigma + 1) - 1) / 2)) + 1)
+
+def _fast_blur(region: np.ndarray, ksize: int) -> np.ndarray:
+    """
+    cv2.GaussianBlur(region, (ksize, ksize), 0), approximated by three box filters for large kernels;
+    the result is a scratch buffer, valid until this thread's next call
+    """
+    out = _scratch("blur", region.shape)
+    if ksize < SEP_BLUR_MIN_KERNEL:
+        return cv2.GaussianBlur(region, (ksize, ksize), 0, dst=out)
+    if ksize <= FAST_BLUR_MIN_KERNEL:
+        kernel = _gaussian_kernel(ksize)
+        return cv2.sepFilter2D(region, -1, kernel, kernel, dst=out)
+    w = _box_width(ksize)
+    tmp = _scratch("blur_tmp", region.shape)
+    cv2.boxFilter(region, -1, (w, w), dst=out)
+    cv2.boxFilter(out, -1, (w, w), dst=tmp)
+    return cv2.boxFilter(tmp, -1, (w, w), dst=out)
+
+# cv2.cuda separable filters take kernels up to 32; larger strengths stay on the CPU
+CUDA_MAX_KERNEL = 31
+
+# Per-thread CUDA Gaussian filters, keyed by kernel size (filter objects are not shared across threads)
+_cuda_filters = threading.local()
+
+def _cuda_gaussian(ksize: int):
+    """cv2.cuda Gaussian filter for BGRA uint8 (CUDA filters have no 3-channel 8-bit variant)"""
+    cache = getattr(_cuda_filters, "cache", None)
+    if cache is None:
+        cache = _cuda_filters.cache = {}
+    filt = cache.get(ksize)
+    if filt is None:
+        filt = cache[ksize] = cv2.cuda.createGaussianFilter(cv2.CV_8UC4, cv2.CV_8UC4, (ksize, ksize), 0)
+    return filt
+
+# Optional libjpeg-turbo decoder for the test/demo scripts (pip install PyTurboJPEG)
+try:
+    from turbojpeg import TurboJPEG
+    _TURBOJPEG = TurboJPEG()
+except (ImportError, OSError, RuntimeError):  # package or libturbojpeg missing
+    _TURBOJPEG = None
+
+def exif_orientation(tiff: bytes) -> Optional[int]:
+    """Orientation tag of an EXIF TIFF block (1 when absent), None when unreadable"""
+    order = {b'II': 'little', b'MM': 'big'}.get(tiff[:2])
+    if order is None:
+        return None
+    ifd = int.from_bytes(tiff[4:8], order)
+    if ifd + 2 > len(tiff):
+        return None
+    for entry in range(ifd + 2, ifd + 2 + 12 * int.from_bytes(tiff[ifd:ifd + 2], order), 12):
+        if entry + 12 > len(tiff):
+            return None
+        if int.from_bytes(tiff[entry:entry + 2], order) == 0x0112:
+            return int.from_bytes(tiff[entry + 8:entry + 10], order)
+    return 1
+
+def read_image(path) -> Union[np.ndarray, None]:
+    """cv2.imread(path), decoding JPEGs with TurboJPEG when available; None if unreadable"""
+    path = str(path)
+    if _TURBOJPEG is not None and path.lower().endswith((".jpg", ".jpeg")):
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # TurboJPEG ignores EXIF orientation; OpenCV (like the server's imdecode) applies it
+            exif = data.find(b"Exif\x00\x00", 0, 1 << 16)
+            if exif < 0 or exif_orientation(data[exif + 6:exif + (1 << 16)]) == 1:
+                return _TURBOJPEG.decode(data)
+            return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        except (OSError, ValueError):
+            pass  # missing or not really a JPEG: let OpenCV decide
+    return cv2.imread(path)
+
+def _blur_target(image: np.ndarray, inplace: bool):
+    """(source, output) for a blur; non-uint8 input is quantized once here so every later step stays uint8"""
+    if image.dtype != np.uint8:
+        image = np.clip(image, 0, 255).astype(np.uint8)  # fresh array: safe to write into
+        return image, image
+    return image, (image if inplace else image.copy())
+
+# Crowd frames: at least this many non-overlapping ROIs are blurred concurrently (OpenCV releases the GIL)
+PARALLEL_BLUR_MIN = 8
+_CORES = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+_BLUR_POOL = ThreadPoolExecutor(max_workers=min(8, _CORES), thread_name_prefix="blur") if _CORES > 1 else None
+
+def _disjoint(boxes: np.ndarray, h: int, w: int) -> bool:
+    """True when no two (N, 4) boxes, clipped to the frame, share a pixel"""
+    b = np.clip(boxes, 0, [w, h, w, h])
+    ox = (b[:, None, 0] < b[None, :, 2]) & (b[None, :, 0] < b[:, None, 2])
+    oy = (b[:, None, 1] < b[None, :, 3]) & (b[None, :, 1] < b[:, None, 3])
+    overlap = ox & oy
+    np.fill_diagonal(overlap, False)
+    return not overlap.any()
+
+# Debug/demo artifacts: cheaper JPEG than OpenCV's default quality 95
+DEBUG_JPEG = [cv2.IMWRITE_JPEG_QUALITY, 80, cv2.IMWRITE_JPEG_OPTIMIZE, 0]
+
+# Largest window the demo scripts show
+DISPLAY_MAX = (1200, 800)
+
+@lru_cache(maxsize=64)
+def _display_size(height: int, width: int):
+    """(w, h) to show a frame at, or None when it already fits DISPLAY_MAX"""
+    max_w, max_h = DISPLAY_MAX
+    if width <= max_w and height <= max_h:
+        return None
+    scale = min(max_w / width, max_h / height)
+    return int(width * scale), int(height * scale)
+
+def fit_for_display(image: np.ndarray) -> np.ndarray:
+    """Downscale (INTER_AREA) to fit DISPLAY_MAX; unchanged when it already fits"""
+    size = _display_size(*image.shape[:2])
+    return image if size is None else cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+# HEADLESS=1: demo scripts write their windows to HEADLESS_DIR instead (CI, benchmarking)
+HEADLESS = os.getenv("HEADLESS", "0").strip().lower() in ("1", "true", "yes")
+HEADLESS_DIR = os.getenv("HEADLESS_DIR", "demo_output")
+
+def show_image(image: np.ndarray, title: str, prompt: str = "continue"):
+    """cv2.imshow + wait for a key; under HEADLESS the frame is saved as <title>.jpg instead"""
+    if HEADLESS:
+        os.makedirs(HEADLESS_DIR, exist_ok=True)
+        path = os.path.join(HEADLESS_DIR, re.sub(r'[^\w.-]+', '_', title).strip('_') + ".jpg")
+        cv2.imwrite(path, image, DEBUG_JPEG)
+        print(f"💾 Headless: saved {path}")
+        return
+    cv2.imshow(title, image)
+    print(f"\n⌨️  Press any key to {prompt}...")
+    cv2.waitKey(0)
+    cv2.destroyAllWindows()
+
+def make_grid(images: List[np.ndarray], cols: int = 3) -> np.ndarray:
+    """Tile BGR frames into one image that fits DISPLAY_MAX (each letterboxed into its cell)"""
+    cols = max(1, min(cols, len(images)))
+    rows = -(-len(images) // cols)
+    tile_w, tile_h = DISPLAY_MAX[0] // cols, DISPLAY_MAX[1] // rows
+    grid = np.zeros((rows * tile_h, cols * tile_w, 3), np.uint8)
+    for i, image in enumerate(images):
+        h, w = image.shape[:2]
+        scale = min(1.0, tile_w / w, tile_h / h)  # downscale only
+        tw, th = max(1, int(w * scale)), max(1, int(h * scale))
+        y = (i // cols) * tile_h + (tile_h - th) // 2
+        x = (i % cols) * tile_w + (tile_w - tw) // 2
+        grid[y:y + th, x:x + tw] = cv2.resize(image, (tw, th), interpolation=cv2.INTER_AREA)
+    return grid
 
 class DetectionVisualizer:
     def __init__(self):
@@ -14,34 +250,31 @@ class DetectionVisualizer:
             'license_plate': (0, 0, 255)  # Red
         }
         self.font = cv2.FONT_HERSHEY_SIMPLEX
+        configure_opencv()
 
     def draw_boxes(self, image: np.ndarray, results: Dict[str, List[Dict]], 
                    show_confidence: bool = True) -> np.ndarray:
-        """Draw bounding boxes on image"""
+        """Draw bounding boxes on image (list or SoA results)"""
         result_image = image.copy()
         
-        # Draw face detections
-        for face in results.get('faces', []):
-            bbox = face['bbox']
-            confidence = face['confidence']
-            self._draw_single_box(result_image, bbox, 'face', confidence, show_confidence)
-        
-        # Draw license plate detections
-        for plate in results.get('license_plates', []):
-            bbox = plate['bbox']
-            confidence = plate['confidence']
-            self._draw_single_box(result_image, bbox, 'license_plate', confidence, show_confidence)
+        for key, label in (('faces', 'face'), ('license_plates', 'license_plate')):
+            boxes, confidences = _as_arrays(results.get(key, []), label)
+            # Rectangles for the whole class in one call, labels per box
+            cv2.polylines(result_image, list(box_quads(boxes)), True, self.colors[label], 2)
+            for bbox, confidence in zip(boxes.tolist(), confidences.tolist()):
+                self._draw_single_box(result_image, bbox, label, confidence, show_confidence, outline=False)
         
         return result_image
 
     def _draw_single_box(self, image: np.ndarray, bbox: List[int], 
-                        label: str, confidence: float, show_confidence: bool):
-        """Draw a single bounding box"""
+                        label: str, confidence: float, show_confidence: bool, outline: bool = True):
+        """Draw a single bounding box (outline=False: label only, the rectangle is already drawn)"""
         x1, y1, x2, y2 = bbox
         color = self.colors.get(label, (255, 0, 0))
         
         # Draw rectangle
-        cv2.rectangle(image, (x1, y1), (x2, y2), color, 2)
+        if outline:
+            cv2.rectangle(image, (x1, y1), (x2, y2), color, 2)
         
         # Draw label
         if show_confidence:
@@ -49,7 +282,7 @@ class DetectionVisualizer:
         else:
             label_text = label
         
-        label_size = cv2.getTextSize(label_text, self.font, 0.6, 2)[0]
+        label_size = text_size(label_text)
         
         # Draw background for text
         cv2.rectangle(image, (x1, y1 - label_size[1] - 10), 
@@ -59,8 +292,9 @@ class DetectionVisualizer:
         cv2.putText(image, label_text, (x1, y1 - 5), 
                    self.font, 0.6, (255, 255, 255), 2)
 
-    def blur_face_oval(self, image: np.ndarray, bbox: List[float], blur_strength: int = 15) -> np.ndarray:
-        """Blur a face region with oval shape"""
+    def blur_face_oval(self, image: np.ndarray, bbox: List[float], blur_strength: int = 15,
+                       inplace: bool = False) -> np.ndarray:
+        """Blur a face region with oval shape (inplace: write into image instead of a copy)"""
         x1, y1, x2, y2 = bbox
         h, w = image.shape[:2]
         
@@ -70,40 +304,39 @@ class DetectionVisualizer:
         if blur_strength % 2 == 0:
             blur_strength += 1
         
-        blurred_image = image.copy()
+        image, blurred_image = _blur_target(image, inplace)
         
-        # Calculate oval parameters
+        # Calculate oval parameters (from the unclipped box, so edge faces keep their shape)
         center_x = (x1 + x2) // 2
         center_y = (y1 + y2) // 2
         axes_x = (x2 - x1) // 2
         axes_y = (y2 - y1) // 2
         
-        # Create mask for oval region
-        mask = np.zeros((h, w), dtype=np.uint8)
-        cv2.ellipse(mask, (center_x, center_y), (axes_x, axes_y), 0, 0, 360, 255, -1)
+        # Nothing to blur for degenerate boxes (noisy detector output)
+        if axes_x <= 0 or axes_y <= 0:
+            return blurred_image
         
-        # Extract the region
+        # Extract the region (clipped to the image)
+        x1, y1, x2, y2 = max(x1, 0), max(y1, 0), min(x2, w), min(y2, h)
         region = image[y1:y2, x1:x2]
         if region.size == 0:
             return blurred_image
         
         # Blur the region
-        blurred_region = cv2.GaussianBlur(region, (blur_strength, blur_strength), 0)
-        
-        # Apply oval mask to the blurred region
-        mask_region = mask[y1:y2, x1:x2]
-        if mask_region.shape[:2] == blurred_region.shape[:2]:
-            for c in range(3):
-                blurred_image[y1:y2, x1:x2, c] = np.where(
-                    mask_region > 0,
-                    blurred_region[:, :, c],
-                    image[y1:y2, x1:x2, c]
-                )
+        blurred_region = _fast_blur(region, blur_strength)
+        
+        # Oval mask at ROI size, ellipse center shifted into ROI coordinates
+        mask_region = _scratch("mask", region.shape[:2])
+        mask_region.fill(0)
+        cv2.ellipse(mask_region, (center_x - x1, center_y - y1), (axes_x, axes_y), 0, 0, 360, 255, -1)
+        # masked copy in OpenCV (SIMD), written straight into the output ROI
+        cv2.copyTo(blurred_region, mask_region, blurred_image[y1:y2, x1:x2])
         
         return blurred_image
 
-    def blur_rectangle_region(self, image: np.ndarray, bbox: List[float], blur_strength: int = 15) -> np.ndarray:
-        """Blur a rectangular region (for license plates)"""
+    def blur_rectangle_region(self, image: np.ndarray, bbox: List[float], blur_strength: int = 15,
+                       inplace: bool = False) -> np.ndarray:
+        """Blur a rectangular region (for license plates) (inplace: write into image instead of a copy)"""
         x1, y1, x2, y2 = bbox
         h, w = image.shape[:2]
         
@@ -113,7 +346,7 @@ class DetectionVisualizer:
         if blur_strength % 2 == 0:
             blur_strength += 1
         
-        blurred_image = image.copy()
+        image, blurred_image = _blur_target(image, inplace)
         
         # Ensure coordinates are within image bounds
         x1 = max(0, x1)
@@ -127,7 +360,7 @@ class DetectionVisualizer:
             return blurred_image
         
         # Blur the region
-        blurred_region = cv2.GaussianBlur(region, (blur_strength, blur_strength), 0)
+        blurred_region = _fast_blur(region, blur_strength)
         
         # Replace the region in the image
         blurred_image[y1:y2, x1:x2] = blurred_region
@@ -135,38 +368,115 @@ class DetectionVisualizer:
         return blurred_image
 
     def blur_detections(self, image: np.ndarray, results: Dict[str, List], 
-                       face_blur_strength: int = 15, plate_blur_strength: int = 15) -> np.ndarray:
-        """Blur all detected faces and license plates"""
-        blurred_image = image.copy()
+                       face_blur_strength: int = 15, plate_blur_strength: int = 15,
+                       inplace: bool = False) -> np.ndarray:
+        """Blur all detected faces and license plates (inplace: the caller no longer needs image)"""
+        faces = _as_arrays(results.get('faces', []), 'face')[0]
+        plates = _as_arrays(results.get('license_plates', []), 'plate')[0]
+        
+        if (len(faces) or len(plates)) and self._use_cuda(face_blur_strength, plate_blur_strength):
+            # the GPU result is downloaded into a fresh array, or into image when inplace (or quantized here)
+            quantized = image.dtype != np.uint8
+            image = _blur_target(image, True)[0]
+            return self._blur_detections_cuda(image, faces, plates, face_blur_strength, plate_blur_strength,
+                                              inplace or quantized)
+        if (len(faces) or len(plates)) and self._use_opencl():
+            image, blurred_image = _blur_target(image, inplace)
+            return self._blur_detections_ocl(blurred_image, faces, plates, face_blur_strength, plate_blur_strength)
+        
+        # At most one copy for the whole frame; every ROI is then blurred into it in place
+        image, blurred_image = _blur_target(image, inplace)
+        
+        # Disjoint ROIs read and write separate pixels, so their order does not matter
+        if (_BLUR_POOL is not None and len(faces) + len(plates) >= PARALLEL_BLUR_MIN
+                and _disjoint(np.vstack((faces, plates)), *image.shape[:2])):
+            jobs = [_BLUR_POOL.submit(self.blur_face_oval, blurred_image, bbox, face_blur_strength, True)
+                    for bbox in faces.tolist()]
+            jobs += [_BLUR_POOL.submit(self.blur_rectangle_region, blurred_image, bbox, plate_blur_strength, True)
+                     for bbox in plates.tolist()]
+            for job in wait(jobs).done:
+                job.result()
+            return blurred_image
         
         # Blur faces with oval shape
-        for face in results.get('faces', []):
-            # Handle both formats: [x1, y1, x2, y2, confidence] and {'bbox': [x1, y1, x2, y2], 'confidence': score}
-            if isinstance(face, list) and len(face) >= 4:
-                # Format: [x1, y1, x2, y2, confidence]
-                bbox = face[:4]  # Take first 4 elements as bbox
-            elif isinstance(face, dict) and 'bbox' in face:
-                # Format: {'bbox': [x1, y1, x2, y2], 'confidence': score}
-                bbox = face['bbox']
-            else:
-                print(f"Warning: Invalid face format: {face}")
-                continue
-                
-            blurred_image = self.blur_face_oval(blurred_image, bbox, face_blur_strength)
+        for bbox in faces.tolist():
+            blurred_image = self.blur_face_oval(blurred_image, bbox, face_blur_strength, inplace=True)
         
         # Blur license plates with rectangular shape
-        for plate in results.get('license_plates', []):
-            # Handle both formats: [x1, y1, x2, y2, confidence] and {'bbox': [x1, y1, x2, y2], 'confidence': score}
-            if isinstance(plate, list) and len(plate) >= 4:
-                # Format: [x1, y1, x2, y2, confidence]
-                bbox = plate[:4]  # Take first 4 elements as bbox
-            elif isinstance(plate, dict) and 'bbox' in plate:
-                # Format: {'bbox': [x1, y1, x2, y2], 'confidence': score}
-                bbox = plate['bbox']
-            else:
-                print(f"Warning: Invalid plate format: {plate}")
-                continue
-                
-            blurred_image = self.blur_rectangle_region(blurred_image, bbox, plate_blur_strength)
+        for bbox in plates.tolist():
+            blurred_image = self.blur_rectangle_region(blurred_image, bbox, plate_blur_strength, inplace=True)
         
         return blurred_image
+
+    def _use_cuda(self, *strengths: int) -> bool:
+        """GPU blur when IDEN_HIDE_DEVICE is cuda/tensorrt, OpenCV has CUDA and every kernel fits"""
+        if not hasattr(self, "_cuda"):
+            self._cuda = opencv_cuda()
+        return self._cuda and max(s | 1 for s in strengths) <= CUDA_MAX_KERNEL
+
+    def _use_opencl(self) -> bool:
+        """OpenCL (T-API) blur when enabled with IDEN_HIDE_OPENCL=1 and a device exists"""
+        if not hasattr(self, "_opencl"):
+            self._opencl = opencv_opencl()
+        return self._opencl
+
+    def _blur_detections_ocl(self, image: np.ndarray, faces: np.ndarray, plates: np.ndarray,
+                             face_blur_strength: int, plate_blur_strength: int) -> np.ndarray:
+        """blur_detections through UMat: one upload, every ROI blurred on the OpenCL device, one download into image"""
+        h, w = image.shape[:2]
+        frame = cv2.UMat(image)
+        # each ROI is filtered on its own, like the CPU path's array slices
+        border = cv2.BORDER_REFLECT_101 | cv2.BORDER_ISOLATED
+        
+        for boxes, strength, oval in ((faces, face_blur_strength, True), (plates, plate_blur_strength, False)):
+            ksize = (strength | 1, strength | 1)
+            for x1, y1, x2, y2 in boxes.tolist():
+                axes_x, axes_y = (x2 - x1) // 2, (y2 - y1) // 2
+                cx, cy = (x1 + x2) // 2, (y1 + y2) // 2
+                if oval and (axes_x <= 0 or axes_y <= 0):
+                    continue
+                x1, y1, x2, y2 = max(x1, 0), max(y1, 0), min(x2, w), min(y2, h)
+                if x2 <= x1 or y2 <= y1:
+                    continue
+                roi = cv2.UMat(frame, (y1, y2), (x1, x2))
+                if oval:
+                    mask = np.zeros((y2 - y1, x2 - x1), np.uint8)
+                    cv2.ellipse(mask, (cx - x1, cy - y1), (axes_x, axes_y), 0, 0, 360, 255, -1)
+                    cv2.copyTo(cv2.GaussianBlur(roi, ksize, 0, borderType=border), cv2.UMat(mask), roi)
+                else:
+                    cv2.GaussianBlur(roi, ksize, 0, roi, borderType=border)
+        
+        image[...] = frame.get()
+        return image
+
+    def _blur_detections_cuda(self, image: np.ndarray, faces: np.ndarray, plates: np.ndarray,
+                              face_blur_strength: int, plate_blur_strength: int, inplace: bool) -> np.ndarray:
+        """blur_detections on the GPU: one upload, every ROI blurred on-device, one download"""
+        h, w = image.shape[:2]
+        src = cv2.cuda_GpuMat()
+        src.upload(image)
+        frame = cv2.cuda.cvtColor(src, cv2.COLOR_BGR2BGRA)
+        
+        for boxes, strength, oval in ((faces, face_blur_strength, True), (plates, plate_blur_strength, False)):
+            filt = _cuda_gaussian(strength | 1)
+            for x1, y1, x2, y2 in boxes.tolist():
+                axes_x, axes_y = (x2 - x1) // 2, (y2 - y1) // 2
+                cx, cy = (x1 + x2) // 2, (y1 + y2) // 2
+                if oval and (axes_x <= 0 or axes_y <= 0):
+                    continue
+                x1, y1, x2, y2 = max(x1, 0), max(y1, 0), min(x2, w), min(y2, h)
+                if x2 <= x1 or y2 <= y1:
+                    continue
+                roi = cv2.cuda_GpuMat(frame, (x1, y1, x2 - x1, y2 - y1))
+                blurred = filt.apply(roi)
+                if oval:
+                    mask = np.zeros((y2 - y1, x2 - x1), np.uint8)
+                    cv2.ellipse(mask, (cx - x1, cy - y1), (axes_x, axes_y), 0, 0, 360, 255, -1)
+                    gmask = cv2.cuda_GpuMat()
+                    gmask.upload(mask)
+                    blurred.copyTo(gmask, roi)
+                else:
+                    blurred.copyTo(roi)
+        
+        out = cv2.cuda.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+        return out.download(image) if inplace else out.download()